@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Micro benchmarks of the database layer, run on a temporary Sqlite3 database:
+    - pool: statements/sec with and without the connection pool of Ponicwatch_Db
+    - synchro: rows/sec of the synchronization of tb_log to a Cloud stand-in on a slow link
+    - reader: INSERT latency of the scheduler while a web page runs heavy SELECTs, with and without the reader path
+    - startup: Controller start-up on a database of -n sensors, one SELECT per object vs. bulk loading
+    - adc: samples/sec of the MCP3208 streaming thread on the pigpio simulation vs. one read() per sample
+"""
+import os
+import argparse
+import tempfile
+from time import perf_counter, sleep
+from threading import Thread, Event
+from datetime import datetime, timezone
+from model.pw_db import Ponicwatch_Db
+from model.model import Ponicwatch_Table
+from model.synchro import Cloud_Synchro, Cloud_Sqlite
+from system import System
+from sensor import Sensor
+from pw_log import Ponicwatch_Log
+
+__version__ = "1.20261018"
+__author__ = 'Eric Gibert'
+__license__ = 'MIT'
+
+
+class ctrl:
+    """Minimal controller stand-in: Ponicwatch_Log only needs a name and a database"""
+    def __init__(self, db):
+        self.name = 'Benchmark'
+        self.db = db
+
+
+def new_database(folder, **db_params):
+    """Create an empty Ponicwatch database with one system in it"""
+    db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "bench_{}.db".format(len(os.listdir(folder))))}, **db_params)
+    System(ctrl(db)).insert(system_id=1, name="Bench", location="here", nb_plants=0, sys_type="NFT")
+    return db
+
+
+def bench_pool(nb_statements=2000):
+    """Same statement mix as a sensor reading: one SELECT of a record followed by one INSERT in tb_log"""
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for label, pool_size in (("no pool", 0), ("pool", 2)):
+            db = new_database(folder, pool_size=pool_size)
+            system = Ponicwatch_Table(db, System.META)
+            log = Ponicwatch_Log(ctrl(db))
+            start = perf_counter()
+            for i in range(nb_statements // 2):
+                system.get_record(id=1)
+                log.insert(controller_name="Benchmark", log_type="INFO", object_id=i, system_name="Bench",
+                           float_value=float(i), text_value="benchmark", created_on=datetime.now(timezone.utc))
+            elapsed = perf_counter() - start
+            db.close_pool()
+            results[label] = nb_statements / elapsed
+            print("{:10} {:8.0f} statements/sec  {}".format(label, results[label], db.pool_stats))
+    print("speed up: x{:.1f}".format(results["pool"] / results["no pool"]))
+    return results
+
+
+def bench_synchro(nb_rows=20000, bandwidth=100000):
+    """Initial then incremental synchronization of tb_log over a link of 'bandwidth' bytes/sec"""
+    with tempfile.TemporaryDirectory() as folder:
+        db = new_database(folder)
+        log = Ponicwatch_Log(ctrl(db))
+        now = datetime.now(timezone.utc)
+        rows = [("Benchmark", "SENSOR", i % 20, "Bench", float(i), "", now) for i in range(nb_rows)]
+        log.insert_rows(rows)
+        synchro = Cloud_Synchro(db, Cloud_Sqlite(os.path.join(folder, "cloud.db"), bandwidth=bandwidth))
+        for label in ("initial", "incremental"):
+            start = perf_counter()
+            synchro.synchronize()
+            stats = synchro.get_stats()
+            print("{:12} {:8.3f} sec  {}".format(label, perf_counter() - start, stats))
+            log.insert_rows(rows[:nb_rows // 10])
+        print("{:.0f} rows/sec, compression x{:.1f}".format(stats["rows_per_sec"], stats["compression"]))
+        db.close_pool()
+        return stats
+
+
+def bench_reader(nb_rows=100000, nb_inserts=50):
+    """Latency of single INSERTs from a 'scheduler' thread while the main thread scans tb_log like the /log page"""
+    with tempfile.TemporaryDirectory() as folder:
+        db = new_database(folder)
+        log = Ponicwatch_Log(ctrl(db))
+        now = datetime.now(timezone.utc)
+        log.insert_rows([("Benchmark", "SENSOR", i % 20, "Bench", float(i), "", now) for i in range(nb_rows)])
+        for reader in (False, True):
+            db.set_reader(reader)
+            done, latencies = Event(), []
+
+            def scheduler():
+                for i in range(nb_inserts):
+                    start = perf_counter()
+                    log.insert_rows([("Benchmark", "SENSOR", i % 20, "Bench", float(i), "", datetime.now(timezone.utc))])
+                    latencies.append(perf_counter() - start)
+                    sleep(0.01)
+                done.set()
+
+            writer = Thread(target=scheduler, name="scheduler")
+            writer.start()
+            nb_pages = 0
+            while not done.is_set():
+                log.get_all_records(page_len=0, where_clause="float_value > ?", args=(0.0,), order_by="text_value, float_value")
+                nb_pages += 1
+            writer.join()
+            latencies.sort()
+            print("reader path {:5}: INSERT median {:7.2f} ms, max {:7.2f} ms, {} pages".format(
+                str(reader), latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000, nb_pages))
+        print("semaphore waits:", db.exclusive_access.get_stats())
+        db.close_pool()
+
+
+def bench_startup(nb_objects=1000):
+    """Object loading and SCHEDULER log rows of a Controller start-up, as done in Controller.__init__"""
+    with tempfile.TemporaryDirectory() as folder:
+        db = new_database(folder)
+        Ponicwatch_Table(db, Sensor.META).execute_many(
+            "INSERT INTO tb_sensor (sensor_id, name, mode, init, timer) VALUES (?, ?, 1, ?, '*/5 * * * * *')",
+            [(i, "sensor {}".format(i), '{{"pin": {}}}'.format(i % 8)) for i in range(1, nb_objects + 1)])
+        results = {}
+        for label, bulk in (("per object", False), ("bulk", True)):
+            db.allow_close = False  # as in Controller.__init__
+            start = perf_counter()
+            log = Ponicwatch_Log(ctrl(db), batch_write=bulk)
+            records = Ponicwatch_Table.load_all(db, Sensor.META) if bulk else {}
+            for i in range(1, nb_objects + 1):
+                Ponicwatch_Table(db, Sensor.META, id=i, record=records.get(i))
+                log.add_log(log_type='SCHEDULER', system_name='@startup', param={'error_code': 0, 'text_value': '*/5 * * * * *'})
+            log.stop_writer()
+            results[label] = perf_counter() - start
+            db.allow_close = True
+            db.close()
+            print("{:10} {:8.3f} sec for {} objects".format(label, results[label], nb_objects))
+        print("speed up: x{:.1f}".format(results["per object"] / results["bulk"]))
+        db.close_pool()
+        return results
+
+
+def bench_adc(nb_samples=20000):
+    """Samples/sec of the ADC_Stream thread (unthrottled) against the per-call read path, and the cost of each filter"""
+    import pigpio_simu
+    from drivers.hardware_MCP3208 import Hardware_MCP3208
+    from pw_stream import ADC_Stream, FILTERS
+    adc = Hardware_MCP3208(pigpio_simu.pi(), {})
+    start = perf_counter()
+    for i in range(nb_samples):
+        adc.read(i % 8)
+    results = {"read()": nb_samples / (perf_counter() - start)}
+    for channels in ([0], list(range(8))):
+        stream = ADC_Stream(adc, {"channels": channels, "rate": 0, "size": 8192, "block": 64})
+        stream.start()
+        while stream.samples * len(channels) < nb_samples:
+            sleep(0.01)
+        stream.stop()
+        results["stream {} channel(s)".format(len(channels))] = stream.get_stats()["samples_per_sec"]
+    for label, rate in results.items():
+        print("{:20} {:10.0f} samples/sec".format(label, rate))
+    for name in FILTERS:
+        stream = ADC_Stream(adc, {"channels": [0], "filter": name, "decimation": 100, "order": 3})
+        stream.store(adc.decode(adc.transfer([0], 1000), 1))
+        start = perf_counter()
+        for _ in range(1000):
+            stream.value(0)
+        print("filter {:8} {:8.1f} us per value".format(name, (perf_counter() - start) * 1000))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--bench", dest="bench", help="Benchmark to run", choices=["pool", "synchro", "reader", "startup", "adc"], default="pool")
+    parser.add_argument("-n", "--number", dest="number", help="Number of statements/objects", type=int, default=2000)
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    args = parser.parse_args()
+    if args.bench == "pool":
+        bench_pool(args.number)
+    elif args.bench == "synchro":
+        bench_synchro(args.number)
+    elif args.bench == "reader":
+        bench_reader(args.number)
+    elif args.bench == "startup":
+        bench_startup(args.number)
+    elif args.bench == "adc":
+        bench_adc(args.number)
@@ -5,9 +5,13 @@
 
     Extract data from the database in the supersid format
 """
+import os
 import argparse
+from datetime import datetime
 from model.pw_db import Ponicwatch_Db
 from pw_log import Ponicwatch_Log
+from pw_series import from_ms, EPOCH
+from pw_archive import Log_Archive
 
 __version__ = "1.20180406 Bangalore"
 __author__ = 'Eric Gibert'
@@ -17,8 +21,17 @@ class ctrl:
     def __init__(self):
         self.name = 'Extraction'
 
-def load_data(pwo_type, pwo):
-    rows = log_table.get_all_records(page_len=0, columns="float_value, created_on", where_clause="log_type=? and object_id=?", args=[pwo_type, pwo])
+def load_data(pwo_type, pwo, from_time=None, to_time=None):
+    rows = log_table.get_all_records(page_len=0, columns="float_value, created_on", where_clause="log_type=? and object_id=?", args=[pwo_type, pwo],
+                                     from_time=from_time, to_time=to_time, order_by="created_on")
+    if not rows:  # values stored only in tb_series: the whole series without --from
+        on, vals = log_table.series.read(pwo_type, int(pwo), datetime.strptime(from_time[:10], "%Y-%m-%d") if from_time else EPOCH,
+                                         datetime.strptime(to_time[:10], "%Y-%m-%d") if to_time else None)
+        rows = [(float(v), from_ms(t)) for t, v in zip(on, vals)]
+    if log_table.archive:  # older values, streamed from the archive
+        archived = [(row[5], row[7]) for row in log_table.archive.read(pwo_type, int(pwo), from_time, to_time)]
+        print(len(archived), "archived rows selected for", pwo_type, pwo)
+        rows = archived + list(rows)
     print(len(rows),"rows selected for", pwo_type, pwo)
     pwo_name = "{}_{}".format(pwo_type, pwo)
     pwo_list[pwo_name]=0.0
@@ -38,16 +51,19 @@ if __name__ == "__main__":
     parser.add_argument("-b", "--SWITCHES", dest="switches", help="List of switches", required=False,  default="")
     parser.add_argument("-f", "--from", dest="from", help="From time stamp", required=False,  default=None)
     parser.add_argument("-t", "--to", dest="to", help="To time stamp", required=False,  default=None)
+    parser.add_argument("-r", "--archive", dest="archive", help="Archive folder, default: 'archive' next to the database", required=False, default=None)
     parser.add_argument('-v', '--version', action='version', version=__version__)
     args, unk = parser.parse_known_args()
 
-    log_table = Ponicwatch_Log(controller=ctrl(), db=Ponicwatch_Db("sqlite3", {'database': args.dbfilename}), debug=3)
+    archive_folder = args.archive or os.path.join(os.path.dirname(os.path.abspath(args.dbfilename)), "archive")
+    log_table = Ponicwatch_Log(controller=ctrl(), db=Ponicwatch_Db("sqlite3", {'database': args.dbfilename}), debug=3,
+                               archive=Log_Archive(archive_folder) if os.path.isdir(archive_folder) else None)
 
     data = {}  # dictionary key = timestamp, value = [ (pwo1, value1), (pwo2, value2), ... ]
     pwo_list = {}
 
     for pwo in args.sensors.split(","):
-        load_data("SENSOR", pwo)
+        load_data("SENSOR", pwo, getattr(args, "from"), args.to)
 
     with open("../Private/extraction.data", "wt") as fout:
         print("""# Site = RASPI
@@ -10,6 +10,8 @@
 """
 from datetime import datetime
 from time import sleep
+import asyncio
+from contextlib import nullcontext
 from random import randint
 try:
     from drivers.DHT22 import dht_sensor
@@ -54,15 +56,38 @@ class Hardware_DHT(object):
         Note: param pins is ignored as the reading pin is defined at __init__ time already
         """
         if self.debug>=3: print("T_or_H:", T_or_H)
-        if (datetime.now() - self.last_read).seconds > 3 or self.humidity is None:
+        if self.is_due():
             #humidity, temperature = Adafruit_DHT.read_retry(self.model, self.pin)
             self.sensor.trigger()
             sleep(0.2)
-            humidity, temperature = self.sensor.humidity(), self.sensor.temperature()
-            if self.debug >= 3: print("humidity, temperature =", (humidity, temperature))
-            if humidity is not None and temperature is not None:
-                self.humidity, self.temperature = humidity, temperature
-                self.last_read = datetime.now()
+            self.collect()
+        return self.result(T_or_H)
+
+    async def read_async(self, pins, T_or_H, bus_lock=None):
+        """Same as read() for the asyncio runtime: the event loop is free while the IC answers
+        :param bus_lock: optional, lock of the bus taken for the trigger and the collection, not during the wait
+        """
+        bus_lock = bus_lock or nullcontext()
+        if self.is_due():
+            with bus_lock:
+                self.sensor.trigger()
+            await asyncio.sleep(0.2)
+            with bus_lock:
+                self.collect()
+        return self.result(T_or_H)
+
+    def is_due(self):
+        return (datetime.now() - self.last_read).seconds > 3 or self.humidity is None
+
+    def collect(self):
+        """Keeps the values received after a trigger"""
+        humidity, temperature = self.sensor.humidity(), self.sensor.temperature()
+        if self.debug >= 3: print("humidity, temperature =", (humidity, temperature))
+        if humidity is not None and temperature is not None:
+            self.humidity, self.temperature = humidity, temperature
+            self.last_read = datetime.now()
+
+    def result(self, T_or_H):
         return (self.temperature, self.temperature) if T_or_H == "T" else (self.humidity, self.humidity)
 
     def write(self):
@@ -5,6 +5,8 @@
     reference: https://learn.adafruit.com/adafruits-raspberry-pi-lesson-11-ds18b20-temperature-sensing/hardware
 """
 import os
+import asyncio
+from contextlib import nullcontext
 from time import sleep
 from glob import glob
 from random import randint
@@ -85,19 +87,53 @@ class Hardware_DS18B20(object):
             lines = self.read_temp_raw()
             # print(lines)
             tries = 10
-            while lines[0].strip()[-3:] != 'YES' and tries > 0:
+            while not self.is_valid(lines) and tries > 0:
                 sleep(0.2)
                 lines = self.read_temp_raw()
                 tries -= 1
             if tries > 0:
-                equals_pos = lines[1].find('t=')
-                if equals_pos != -1:
-                    temp_string = lines[1][equals_pos + 2:]
-                    temp_c = float(temp_string) / 1000.0
-                    # temp_f = temp_c * 9.0 / 5.0 + 32.0
-                    self.temperature = temp_c if temp_c < 85.0 else None
+                self.parse(lines)
         return (self.temperature, self.temperature)
 
+    async def read_async(self, pin=None, param=None, bus_lock=None):
+        """Same as read() for the asyncio runtime: the file is read on a worker thread (the w1 conversion takes
+        up to 750 ms) and the event loop is free between the tries
+        :param bus_lock: optional, lock of the bus taken by the worker thread for each read of the file
+        """
+        bus_lock = bus_lock or nullcontext()
+
+        def read_locked():
+            with bus_lock:
+                return self.read_temp_raw()
+
+        if self.simulation:
+            self.temperature = randint(25, 35)
+        else:
+            self.temperature = None
+            loop = asyncio.get_running_loop()
+            lines = await loop.run_in_executor(None, read_locked)
+            tries = 10
+            while not self.is_valid(lines) and tries > 0:
+                await asyncio.sleep(0.2)
+                lines = await loop.run_in_executor(None, read_locked)
+                tries -= 1
+            if tries > 0:
+                self.parse(lines)
+        return (self.temperature, self.temperature)
+
+    @staticmethod
+    def is_valid(lines):
+        """the first line ends with YES when the CRC is correct"""
+        return lines[0].strip()[-3:] == 'YES'
+
+    def parse(self, lines):
+        equals_pos = lines[1].find('t=')
+        if equals_pos != -1:
+            temp_string = lines[1][equals_pos + 2:]
+            temp_c = float(temp_string) / 1000.0
+            # temp_f = temp_c * 9.0 / 5.0 + 32.0
+            self.temperature = temp_c if temp_c < 85.0 else None
+
 
 if __name__ == "__main__":
     import time
@@ -45,7 +45,7 @@ class Hardware_Gravity_TDS(object):
         if self.debug >= 3:
             print(data, volts12bits)
             print("Reading water temperature...", end="")
-        temperature = self.water_temp_sensor.value # if self.pig.connected else 21.0
+        temperature = self.water_temperature()
         if self.debug>=3: print(temperature)
         compensationCoefficient = 1.0 + 0.02 * (temperature - 25.0)
         compensationVolatge = volts12bits / compensationCoefficient
@@ -54,6 +54,15 @@ class Hardware_Gravity_TDS(object):
                     + 857.39 * compensationVolatge) * 5.5  #0.5
         return data[0], round(tdsValue)
 
+    def water_temperature(self):
+        """Last value of the water temperature sensor, as read by its own job: the 1-Wire reading takes up to 2 seconds
+        and would hold the executor of the ADC's bus. 25.0, i.e. no compensation, until the sensor is read once.
+        """
+        if not hasattr(self.water_temp_sensor, "last_value"):  # testing with a driver instead of a Sensor
+            return self.water_temp_sensor.value
+        temperature = self.water_temp_sensor.last_value
+        return 25.0 if temperature is None else temperature
+
 if __name__ == "__main__":
     import pigpio
     from hardware_MCP3208 import Hardware_MCP3208
@@ -20,7 +20,18 @@ Pin Signal  Description                 GPIO        RPI Pin
 
 spi_channel should be 0 (chip connected to CE0) or 1 (CE1)
 baud should be 50000
+
+scan() samples several channels N times and returns robust statistics per channel: read() and average() run on it.
+Each conversion needs its own transfer as the MCP3208 only starts a new conversion when CS rises: the commands
+are prepared once and the raw answers are collected in one buffer, decoded with NumPy when available.
 """
+from statistics import median, pstdev
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ALL_CHANNELS = 0xFF
 
 class Hardware_MCP3208(object):
     """
@@ -41,13 +52,15 @@ class Hardware_MCP3208(object):
                                         init_dict.get("baud", 50000),
                                         init_dict.get("flags", 0))
         self.debug = max(debug, init_dict.get("debug", 0))
+        self.commands = [self.command(channel) for channel in range(8)]
         try:
             self.spi_handle = self.pig.spi_open(spi_channel, baud, spi_flags)
             if self.debug >= 3: print("spi_handle open OK")
         except AttributeError as err:
             print("Unable to open SPI\n", err)
 
-    def read(self, channel, param=5.0):
+    @staticmethod
+    def command(channel):
         """
         First send three bytes
         - byte 0 has 7 zeros and a start bit
@@ -67,15 +80,74 @@ class Hardware_MCP3208(object):
             adc_out = ((r[1]&15) << 8) + r[2]
 
         """
-        # count, adc = self.pig.spi_xfer(self.spi_handle, [6 + ((4 & channel) >> 2), (3 & channel) << 6, 0])  # for 10 bits: [1,(8 + channel) << 4,0]
+        # [6 + ((4 & channel) >> 2), (3 & channel) << 6, 0]  # for 10 bits: [1,(8 + channel) << 4,0]
+        return [4 | 2 |(channel>>2), (channel &3) << 6,0]
+
+    def transfer(self, channels, samples):
+        """
+        Performs 'samples' conversions of each channel, interleaved: ch0, ch1,..., ch0, ch1,...
+        so that all the channels are sampled over the same period
+        :return: raw buffer of 3 bytes per conversion
+        """
+        commands = [self.commands[channel] for channel in channels]
+        raw = bytearray()
         try:
-            count, adc = self.pig.spi_xfer(self.spi_handle, [4 | 2 |(channel>>2), (channel &3) << 6,0])
+            xfer, handle = self.pig.spi_xfer, self.spi_handle
+            for _ in range(samples):
+                for cmd in commands:
+                    count, adc = xfer(handle, cmd)
+                    raw += adc[:3]
         except AttributeError:
             # REPLACE BY SIMULATION
             print("all zeroes for simulation")
-            count, adc = 0, [0,0,0,0]
-        if self.debug >= 3: print("read from MCP3208:", (count, adc))
-        data = ((adc[1] & 15) << 8) + adc[2]
+            raw = bytearray(3 * len(commands) * samples)
+        if self.debug >= 3: print("read from MCP3208:", len(raw), "bytes")
+        return raw
+
+    @staticmethod
+    def decode(raw, nb_channels):
+        """12 bits values of the conversions: one list/row per sample, one column per channel"""
+        if np is not None:
+            adc = np.frombuffer(bytes(raw), dtype=np.uint8).reshape(-1, 3)
+            return (((adc[:, 1] & 15).astype(np.int32) << 8) + adc[:, 2]).reshape(-1, nb_channels)
+        data = [((raw[i + 1] & 15) << 8) + raw[i + 2] for i in range(0, len(raw), 3)]
+        return [data[i:i + nb_channels] for i in range(0, len(data), nb_channels)]
+
+    def scan(self, channels=ALL_CHANNELS, samples=1, param=5.0, trim=1):
+        """
+        Reads several channels 'samples' times
+        :param channels: list of channels or bit mask (bit 0 for ch0...): default all 8 channels
+        :param samples: number of conversions per channel
+        :param param: 3.3V or 5.0V as the max Volt given on Vref (float)
+        :param trim: number of lowest and of highest conversions ignored by the trimmed mean (if enough samples)
+        :return: {channel: {"mean", "trimmed_mean", "median", "std", "min", "max", "volts"}} - 'volts' of the trimmed mean
+        """
+        if isinstance(channels, int):
+            channels = [c for c in range(8) if channels & (1 << c)]
+        data = self.decode(self.transfer(channels, samples), len(channels))
+        if samples <= 2 * trim:
+            trim = 0
+        result = {}
+        if np is not None:
+            data = np.sort(data, axis=0)
+            trimmed = data[trim:samples - trim].mean(axis=0)
+            for i, channel in enumerate(channels):
+                col = data[:, i]
+                result[channel] = {"mean": float(col.mean()), "trimmed_mean": float(trimmed[i]), "median": float(np.median(col)),
+                                   "std": float(col.std()), "min": int(col[0]), "max": int(col[-1])}
+        else:
+            for i, channel in enumerate(channels):
+                col = sorted(row[i] for row in data)
+                kept = col[trim:samples - trim]
+                result[channel] = {"mean": sum(col) / samples, "trimmed_mean": sum(kept) / len(kept), "median": median(col),
+                                   "std": pstdev(col), "min": col[0], "max": col[-1]}
+        for stats in result.values():
+            stats["volts"] = (stats["trimmed_mean"] * param) / 4095.0
+        return result
+
+    def read(self, channel, param=5.0):
+        """One conversion of a channel: (12 bits value, volts)"""
+        data = int(self.scan([channel], 1, param, trim=0)[channel]["median"])
         volts12bits = (data * param) / 4095.0
         return (data, volts12bits)
 
@@ -87,12 +159,8 @@ class Hardware_MCP3208(object):
 
     def average(self, channel, samples, param=5.0):
         """read 'samples' measures and returns the average ignoring the lowest and highest ones"""
-        readings = []
-        for s in range(samples+2):
-            readings.append(self.read(channel, param))
-            #sleep(0.1)
-        sampling = sorted(readings)[1:-1]
-        return sum([s[0] for s in sampling]) / len(sampling), sum([s[1] for s in sampling]) / len(sampling)
+        stats = self.scan([channel], samples + 2, param, trim=1)[channel]
+        return stats["trimmed_mean"], stats["volts"]
 
     def __str__(self):
         return "ADC MCP3208"
@@ -6,6 +6,7 @@
     Define the IC (probes, sensors, other...) that are present on the control board.
     Each hardware will have a driver to interact with defined in the 'drivers' module
 """
+import asyncio
 from model.model import Ponicwatch_Table
 from drivers.hardware_DHT import Hardware_DHT
 from drivers.hardware_DS18B20 import Hardware_DS18B20
@@ -14,6 +15,11 @@ from drivers.hardware_MCP23017 import Hardware_MCP23017
 from drivers.hardware_MCP3208 import Hardware_MCP3208
 from drivers.hardware_Gravity_pH import Hardware_Gravity_pH
 from drivers.hardware_Gravity_TDS import Hardware_Gravity_TDS
+from pw_bus import Bus, No_Lock
+from pw_stream import ADC_Stream
+
+# default bus by type of IC: MCP23017 is on 'I2C-<bus>', DHTxx on 'GPIO:<pin>' (see bus_name())
+BUSES = {"DS18B20": "1-Wire", "RPI3": "GPIO", "MCP3208": "SPI"}
 
 class Hardware(Ponicwatch_Table):
     """
@@ -49,8 +55,12 @@ class Hardware(Ponicwatch_Table):
         self.debug = controller.debug
         self.controller = controller
         self.system_name = system_name + "/" + self["name"]
+        hardware, hw_init = self["hardware"], self.init_dict
+        # the bus is locked around each access to the driver
+        self.bus = Bus.get(bus_name(hardware, hw_init))
+        self.bus_lock = self.bus
+        self.stream = None  # continuous sampling of an ADC, started by the Controller
         if self["mode"] > self.INACTIVE:
-            hardware, hw_init = self["hardware"], self.init_dict
             if hardware in Hardware_DHT.supported_models:  # DHT11|DHT22|AM2302
                 self.driver = Hardware_DHT(pig=controller.pig, model=hardware, pin=translate_pin(hw_init["pin"]), debug=self.debug)
             elif hardware == "DS18B20":
@@ -61,6 +71,11 @@ class Hardware(Ponicwatch_Table):
                 self.driver = Hardware_MCP23017(pig=controller.pig, init_dict=hw_init, debug=self.debug)
             elif hardware == "MCP3208":
                 self.driver = Hardware_MCP3208(pig=controller.pig, init_dict=hw_init, debug=self.debug)
+                if "stream" in hw_init:
+                    try:
+                        self.stream = ADC_Stream(self.driver, hw_init["stream"], bus_lock=self.bus_lock)
+                    except ImportError as err:  # configuration error: the channels are read on request instead
+                        controller.log.add_warning("Hardware {}: no stream, {}".format(self["name"], err), err_code=self["id"])
             elif hardware == "GRAVITY_pH":
                 self.driver = Hardware_Gravity_pH(pig=controller.pig,
                                                   init_dict=hw_init,
@@ -74,6 +89,10 @@ class Hardware(Ponicwatch_Table):
                                                    debug=self.debug)
             else:
                 raise ValueError("Unknown hardware declared: {0} {1}".format(self["id"], hardware))
+            if hardware.startswith("GRAVITY_"):
+                # a probe read through an ADC runs on the ADC's bus, locked by the ADC itself:
+                # the bus is not held while the TDS probe reads its water temperature sensor
+                self.bus, self.bus_lock = self.driver.ADC.bus, No_Lock()
 
     def read(self, pin, param):
         """
@@ -84,23 +103,46 @@ class Hardware(Ponicwatch_Table):
         """
         if self.debug >= 3:
             print("Hardware read (pin, param) =", (pin, param))
-        return self.driver.read(translate_pin(pin), param)
+        if self.stream and self.stream.covers(translate_pin(pin)):
+            return self.stream.read(translate_pin(pin), param)
+        with self.bus_lock:
+            return self.driver.read(translate_pin(pin), param)
+
+    async def read_async(self, pin, param):
+        """
+        read() for the asyncio runtime: a driver having a 'read_async' coroutine waits without blocking the event loop,
+        the other drivers are read on a worker thread.
+        The coroutines are serialized by the bus' asyncio lock: the bus lock, held by a thread, is never held across
+        an await but only taken by the driver around each of its blocking steps.
+        """
+        if self.stream and self.stream.covers(translate_pin(pin)):
+            return self.stream.read(translate_pin(pin), param)
+        async with self.bus.async_lock:
+            if hasattr(self.driver, "read_async"):
+                return await self.driver.read_async(translate_pin(pin), param, bus_lock=self.bus_lock)
+            return await asyncio.get_running_loop().run_in_executor(None, self.read, pin, param)
 
     def write(self, pin, value):
         """param is a tuple (pin, value)"""
-        new_val = self.driver.write(translate_pin(pin), value)
+        with self.bus_lock:
+            new_val = self.driver.write(translate_pin(pin), value)
         if new_val != self["value"]:
             self.update(value=new_val)
-        self.controller.log.add_log(system_name=self.system_name, param=self)
+        self.controller.log.add_log(system_name=self.system_name, param=self, category="HARDWARE")
 
     def average(self, pin, samples, param):
         """read many inpt and average"""
         if self.debug >= 3:
             print("Hardware average (pin, samples, param) =", (pin, samples, param))
-        return self.driver.average(translate_pin(pin), samples, param)
+        if self.stream and self.stream.covers(translate_pin(pin)):  # already averaged by the stream's filter
+            return self.stream.read(translate_pin(pin), param)
+        with self.bus_lock:
+            return self.driver.average(translate_pin(pin), samples, param)
 
 
     def cleanup(self):
+        if self.stream:
+            self.stream.stop()
         try:
             self.driver.cleanup()
         except AttributeError:
@@ -147,6 +189,17 @@ class Hardware(Ponicwatch_Table):
 
 
 # helper function #
+def bus_name(hardware, hw_init):
+    """Name of the bus an IC is connected to: the init key 'bus_name' overrides the default for its type"""
+    if "bus_name" in hw_init:
+        return hw_init["bus_name"]
+    if hardware == "MCP23017":
+        return "I2C-{}".format(hw_init.get("bus", 1))
+    if hardware in Hardware_DHT.supported_models:
+        # bit-banged on its own pin, waiting during its reading: the other GPIO pins must not queue behind it
+        return "GPIO:{}".format(translate_pin(hw_init["pin"]))
+    return BUSES.get(hardware, "GPIO:{}".format(hardware))
+
 def translate_pin(str_pin):
     """Accept a string representing an integer (base 10 or Hex) or A0,...,A7,B0,...,B7"""
     try:
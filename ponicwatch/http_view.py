@@ -3,6 +3,7 @@ from os import path, system
 from glob import glob
 import datetime
 import json
+from urllib.parse import urlencode
 from markdown import markdown
 from bottle import Bottle, template, static_file, request, BaseTemplate, redirect, response, abort, error
 from bottlesession import CookieSession, authenticator
@@ -22,6 +23,16 @@ BaseTemplate.defaults['login_logout'] = "Login"
 def error404(error):
     return '404 error:<h2>%s</h2>' % error
 
+@http_view.hook('before_request')
+def reader_thread():
+    """The pages read the database on read-only connections: they never wait for the scheduler's INSERTs"""
+    http_view.controller.db.set_reader()
+
+@http_view.hook('after_request')
+def end_reader_thread():
+    """The thread serving the request is a reader for this request only: i.e. the main thread also stops the Controller"""
+    http_view.controller.db.set_reader(False)
+
 def get_pwo():
     """Helper function: returns a PonicWatch Object based on the object type and id found in the form.
     Expected fields in the form (can be hidden if necessary):
@@ -41,26 +52,87 @@ def default():
     except RuntimeError:
         session = {}
         session["valid"] = False
-    http_view.controller.last_start = http_view.controller.log.fetch("select max(created_on) from tb_log where log_type='INFO' and float_value=1.0", only_one=True)
-    http_view.controller.last_stop = http_view.controller.log.fetch("select max(created_on) from tb_log where log_type='INFO' and float_value=0.0", only_one=True)
+    # ORDER BY ... LIMIT 1 walks the index ix_..._type_created backward instead of scanning all the INFO rows
+    last_info = "log_type='INFO' and float_value=?"
+    http_view.controller.last_start = http_view.controller.log.last_record(last_info, (1.0,), columns="created_on") or (None,)
+    http_view.controller.last_stop = http_view.controller.log.last_record(last_info, (0.0,), columns="created_on") or (None,)
+    # messages of the last 8 days: range on created_on instead of julianday() to use the index
+    since = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=8)
     rows = http_view.controller.log.get_all_records(order_by="created_on desc",
-                                                    where_clause="(log_type='ERROR' or log_type='INFO') and julianday(date('now')) - julianday(created_on)  < 8")
+                                                    where_clause="log_type in ('ERROR', 'INFO')",
+                                                    from_time="{:%Y-%m-%d}".format(since))
     return template("default", session_valid=session["valid"],
                     controller=http_view.controller,
                     rows=rows)
 
+LOG_TYPES = ("INFO", "WARNING", "ERROR", "SENSOR", "SWITCH", "HARDWARE", "INTERRUPT", "SCHEDULER")
+
+def log_cursor(value):
+    """Decode a page cursor '<created_on>|<log_id>' from the query string: None if invalid"""
+    created_on, _, log_id = value.rpartition('|')
+    try:
+        return (created_on, int(log_id)) if created_on else None
+    except ValueError:
+        return None
+
+def log_date(value):
+    """Decode a date YYYY-MM-DD from the query string: None if invalid"""
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+
 @http_view.route('/log')
-@http_view.route('/log/<page:int>')
-def log(page=0):
-    where, pwo, req_query = "", "", ""
-    if "system" in request.query:
-        log_type, object_id = request.query["system"].split('_')
-        if log_type in ("INFO", "SENSOR", "SWITCH", "HARDWARE", "INTERRUPT", "SCHEDULER"):
-            where = "log_type='{}' and object_id={}".format(log_type, object_id)
-            pwo = """<a href="/{}/{}">Go to PWO page</a>""".format(log_type.lower() + 's', object_id)
-            req_query = "?system=" + request.query["system"]
-    rows = http_view.controller.log.get_all_records(from_page=page, order_by="created_on desc", where_clause=where)
-    return template("log", rows=rows, current_page=page, pwo=pwo, req_query=req_query)
+def log(page_len=20):
+    """Log records, newest first. Query parameters:
+    - filters: log_type and object_id (or system=<log_type>_<object_id>), from and to dates as YYYY-MM-DD
+    - cursor from the page links: before=<created_on>|<log_id> for older records, after=... for newer ones
+    """
+    query, pwo = request.query, ""
+    log_type, object_id = query.get("log_type", ""), query.get("object_id", "")
+    if "system" in query:
+        log_type, _, object_id = query["system"].partition('_')
+    if log_type not in LOG_TYPES:
+        log_type = ""
+    if not object_id.isdigit():
+        object_id = ""
+    if log_type and object_id:
+        pwo = """<a href="/{}/{}">Go to PWO page</a>""".format(log_type.lower() + 's', object_id)
+    filters = {"log_type": log_type, "object_id": object_id,
+               "from": query.get("from", "") if log_date(query.get("from", "")) else "",
+               "to": query.get("to", "") if log_date(query.get("to", "")) else ""}
+    before, after = log_cursor(query.get("before", "")), None
+    if "after" in query:
+        after = log_cursor(query["after"]) or ()
+    # one more record than the page length tells if there is a next page
+    rows = http_view.controller.log.get_page(page_len + 1, before=before, after=after, log_type=log_type or None,
+                                             object_id=int(object_id) if object_id else None,
+                                             from_time=log_date(filters["from"]), to_time=log_date(filters["to"]))
+    if after is not None:
+        has_newer, has_older, rows = len(rows) > page_len, bool(after), rows[-page_len:]
+    else:
+        has_newer, has_older, rows = bool(before), len(rows) > page_len, rows[:page_len]
+    params = {k: v for k, v in filters.items() if v}
+    links = []
+    if has_newer:
+        links.append(("Newest", "/log?" + urlencode(params)))
+        links.append(("Newer", "/log?" + urlencode(dict(params, after="{}|{}".format(rows[0][-1], rows[0][0])))))
+    if has_older and rows:
+        links.append(("Older", "/log?" + urlencode(dict(params, before="{}|{}".format(rows[-1][-1], rows[-1][0])))))
+        links.append(("Oldest", "/log?" + urlencode(dict(params, after=""))))
+    return template("log", rows=rows, pwo=pwo, links=links, filters=filters, log_types=LOG_TYPES)
+
+@http_view.route('/metrics')
+def metrics():
+    """Internal counters of the controller as a JSON document"""
+    response.content_type = 'application/json'
+    return json.dumps(http_view.controller.get_metrics(), default=str)
+
+@http_view.route('/log/counters')
+def log_counters():
+    """Events counted by category instead of being logged, as a JSON document"""
+    response.content_type = 'application/json'
+    return json.dumps(http_view.controller.log.get_counters())
 
 @http_view.route('/links')
 def list_links():
@@ -135,6 +207,7 @@ def pwo_update(id):
             return "<h1>Syntax error in the propose init JSON dictionary</h1>"
         else:
             pwo.update(**upd_dict)
+            pwo.refresh()  # the form's strings are converted by the database i.e. 'mode' as INTEGER
     url = request.forms["pw_object_type"] + 's'
     redirect("/{}/{}".format(url, id))
 
@@ -156,10 +229,11 @@ def pwo_value(id):
         result["value"] = pwo.value
     except AttributeError:
         result["value"] = "Not implemented"
+    result["latest"] = http_view.controller.latest_value(pwo, id)  # last (timestamp, value) recorded by the scheduler
     if http_view.controller.debug >= 3:
-        print(result, json.dumps(result))
+        print(result, json.dumps(result, default=str))
     response.content_type = 'application/json'
-    return json.dumps(result)
+    return json.dumps(result, default=str)
 
 #
 ###  Special operations on specific PWO
@@ -179,7 +253,7 @@ def sensor_exec(sensor_id):
     """Force read the sensor value now"""
     try:
         sensor = http_view.controller.sensors[sensor_id]
-        sensor.execute()
+        http_view.controller.read_now(sensor)
     except KeyError:
         abort(404, "Unknown Sensor %d" % sensor_id)
     redirect("/sensors/%d" % sensor_id)
@@ -295,17 +369,12 @@ def make_image(data_object):
     image_file = get_image_file(data_object)  # images/sensor_id_1.png
     log_type = obj_class_name.upper()  # http_view.controller.log.LOG_TYPE[obj_class_name.upper()]
     yesterday = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(1)
-    where_clause = "log_type='{}' and object_id={} and created_on>=?".format(log_type, data_object["id"])  #, yesterday.strftime('%Y-%m-%d %H:%M:%S'))
     if http_view.controller.debug >= 3:
         print(obj_class_name, data_object, image_file)
-        # print("where ==>", where_clause, yesterday)
-    rows = http_view.controller.log.get_all_records(page_len=0, where_clause=where_clause, order_by="created_on asc", args=(yesterday,))
-    # for row in rows: print(row)
-    x = [row[-1].replace(tzinfo=datetime.timezone.utc).astimezone() for row in rows]
-    y = [row[5] for row in rows]
-    # print(len(x), "log entries:")
-    # print("x ==>",min(x), max(x))
-    # print("y ==>", min(y), max(y))
+    # from the object's ring buffer if it holds the last 24h, else from the log
+    series = http_view.controller.get_window(data_object, data_object["id"], from_time=yesterday)
+    x = [t.replace(tzinfo=datetime.timezone.utc).astimezone() for t, v in series]
+    y = [v for t, v in series]
     fig = Figure()
     canvas = FigureCanvas(fig)
     ax = fig.add_subplot(111)
@@ -7,6 +7,7 @@
 """
 
 from model.model import Ponicwatch_Table
+from pw_retention import Log_Retention
 
 class Interrupt(Ponicwatch_Table):
     """
@@ -36,13 +37,14 @@ class Interrupt(Ponicwatch_Table):
         if self["hardware"] != "N/A":
             self.hardware.register_interrupt(self.init_dict["pin"], self.on_interrupt)
         elif "timer" in self.init_dict: # special interrupt based on timer
-            self.controller.add_cron_job(self.on_interrupt, self.init_dict["timer"])
+            self.controller.add_cron_job(self.on_interrupt, self.init_dict["timer"],
+                                         max_jitter=self.init_dict.get("max_jitter", 0), seed=self.system_name)
 
 
     def on_interrupt(self):
         """Callback function for the 'init' dictionary entry
         - email_notification: to send an email listing all the PWO
-        - reduce_log_table: drop rows in tb_log
+        - reduce_log_table: drop rows in tb_log, by whole months or following the 'retention' policies (see pw_retention.py)
         """
         if self.controller.debug >= 3:
             print("Call back on interrupt:", self, self.init_dict)
@@ -55,7 +57,10 @@ class Interrupt(Ponicwatch_Table):
                     "value": self["id"]
                 }
             elif self.init_dict["action"] == "reduce_log_table":
-                nb_rows = self.controller.log.reduce_size(keep_days=self.init_dict.get('days', 90))
+                if "retention" in self.init_dict:
+                    nb_rows = Log_Retention(self.controller.log, self.init_dict).enforce()
+                else:
+                    nb_rows = self.controller.log.reduce_size(keep_days=self.init_dict.get('days', 90))
                 msg = {
                     "text_value": "Log reduced",
                     "value": nb_rows
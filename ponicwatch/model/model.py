@@ -14,14 +14,18 @@ class Ponicwatch_Table(dict):
         """
         Select one record from the given table
         META: dictionary providing the table's 'name', 'columns' and 'id' key
+        record: optional, row already fetched (i.e. by load_all) to build the object without a SELECT
         """
+        record = kwargs.pop("record", None)
         dict.__init__(self, *args, **kwargs)
         self.db = db
         self.table = META["table"]
         self.columns = META["columns"]
         self.id_column = META["id"]
         # is a record already requested? i.e one of the possible key argument is given as parameter
-        if "id" in kwargs or self.id_column in kwargs:
+        if record is not None:
+            self.hydrate(record)
+        elif "id" in kwargs or self.id_column in kwargs:
             self.get_record(id=kwargs["id"] if "id" in kwargs else kwargs[self.id_column])
         elif "name" in kwargs:
             self.get_record(name=kwargs["name"])
@@ -48,46 +52,60 @@ class Ponicwatch_Table(dict):
                 self.db.close()
         return nb_row
 
-
-    def fetch(self, sql, params=[], only_one=False):
+    def execute_many(self, sql, seq_params):
+        """Execute an SQL command for all the parameters of the sequence in one transaction with exclusive access"""
+        nb_row = -1
         with self.db.exclusive_access:
-            rows= None
             self.db.open()
             try:
-                self.db.curs.execute(sql, params)
-                rows = self.db.curs.fetchone() if only_one else self.db.curs.fetchall()
+                self.db.curs.executemany(sql, seq_params)
+                self.db.conn.commit()
+                nb_row = self.db.curs.rowcount
             except InterfaceError as err:
                 print('*'*30, err)
                 print(sql)
-                print(params)
             finally:
                 self.db.close()
+        return nb_row
+
+    def fetch(self, sql, params=[], only_one=False):
+        rows = None
+        with self.db.reading() as curs:
+            try:
+                curs.execute(sql, params)
+                rows = curs.fetchone() if only_one else curs.fetchall()
+            except InterfaceError as err:
+                print('*'*30, err)
+                print(sql)
+                print(params)
         return rows
 
     def get_record(self, id=None, name=None):
         """select on record form the table"""
-        with self.db.exclusive_access:
-            self.db.open()
-            try:
-                if type(id) is int:
-                    self.db.curs.execute("SELECT * FROM {0} WHERE {1}=?".format(self.table, self.id_column), (id,))
-                elif type(name) is str:
-                    self.db.curs.execute("SELECT * FROM {0} WHERE name=?".format(self.table), (name,))
-                else:
-                    raise ValueError("Missing or incorrect argument: id or name")
-                rows = self.db.curs.fetchall()
-                if len(rows) == 1:
-                    r = rows[0]
-                    for col in r.keys():
-                        self[col] = r[col]
-                    self["id"] = r[self.id_column]
-                elif len(rows) == 0: # unknown key
-                    raise KeyError("Unkown record key on id/name: " + str(name or id))
-                else: # not a key: more than one record found ?1?
-                    raise KeyError("Too many records found ?!? Not a key on id/name: " + str(name or id))
-            finally:
-                self.db.close()
-        # convert the JSON init string to a python dictionary
+        with self.db.reading() as curs:
+            if type(id) is int:
+                curs.execute("SELECT * FROM {0} WHERE {1}=?".format(self.table, self.id_column), (id,))
+            elif type(name) is str:
+                curs.execute("SELECT * FROM {0} WHERE name=?".format(self.table), (name,))
+            else:
+                raise ValueError("Missing or incorrect argument: id or name")
+            rows = curs.fetchall()
+        if len(rows) == 1:
+            self.hydrate(rows[0])
+        elif len(rows) == 0: # unknown key
+            raise KeyError("Unkown record key on id/name: " + str(name or id))
+        else: # not a key: more than one record found ?1?
+            raise KeyError("Too many records found ?!? Not a key on id/name: " + str(name or id))
+
+    def hydrate(self, row):
+        """set the object's values from a table row"""
+        for col in row.keys():
+            self[col] = row[col]
+        self["id"] = row[self.id_column]
+        self.parse_init()
+
+    def parse_init(self):
+        """convert the JSON init string to a python dictionary"""
         try:
             self.init_dict = json.loads(self["init"])
         except KeyError:
@@ -97,52 +115,60 @@ class Ponicwatch_Table(dict):
             print("Warning: init is not a JSON string for", self)
             print("init=", self["init"])
 
+    def refresh(self):
+        """Invalidate the cached values by reloading the record, i.e. after an update with values to be converted by the database"""
+        self.get_record(id=self["id"])
+
 
-    def get_all_records(self, page_len=20, from_page=0, where_clause=None, order_by=None, args=[], columns='*'):
+    def get_all_records(self, page_len=20, from_page=0, where_clause=None, order_by=None, args=[], columns='*', table=None):
         """
         Return a list of all the table records starting from the right page
             page_len: number of rows in one page. If given as 0 then no LIMIT set in the SELECT statement 
+            table: optional table name or sub-query to select from instead of the object's table
         """
-        sql = "SELECT {} FROM {}".format(columns, self.table)
+        sql = "SELECT {} FROM {}".format(columns, table or self.table)
         if where_clause:
             sql += " WHERE " + where_clause
         if order_by:
             sql += " ORDER BY " + order_by
         if page_len:
             sql += " LIMIT {} OFFSET {}".format(page_len, from_page * page_len)
-        with self.db.exclusive_access:
-            self.db.open()
+        with self.db.reading() as curs:
             try:
-                self.db.curs.execute(sql, args)
-                rows = self.db.curs.fetchall()
+                curs.execute(sql, args)
+                rows = curs.fetchall()
             except InterfaceError as err:
                 print('*'*30, err)
                 print(sql)
-            finally:
-                self.db.close()
         return rows
 
     def __str__(self):
         return self["name"]
 
     def update(self, **kwargs):
-        """update the fields given as parameters with their values using the 'kwargs' dictionary"""
+        """update the fields given as parameters with their values using the 'kwargs' dictionary
+        The values are kept as given: call refresh() if the database converts them (i.e. strings from a HTML form)
+        """
         col_value = [] # list of tuple col=value to update
         for col, val in kwargs.items():
             if col in self.columns:
                 col_value.append( (col, val) )
             else:
                 raise KeyError(col, ": column cannot be updated. Is it properly spelled?")
-        # update_on timestamp managenemt
+        # update_on timestamp managenemt: naive UTC, as the records read from the database
         if 'updated_on' in self.columns and 'updated_on' not in kwargs:
-            col_value.append( ('updated_on', datetime.now(timezone.utc)) )
+            col_value.append( ('updated_on', datetime.now(timezone.utc).replace(tzinfo=None)) )
         # SQL statement build and execution
         if col_value:
             sql = "UPDATE {0} SET {1} WHERE {2}=?".format(self.table,
                                                           ",".join([c+"=?" for c, v in col_value]),
                                                           self.id_column)
             self.execute_sql(sql, [v for c, v in col_value] + [self["id"]])
-            self.get_record(id=self["id"]) # reload data after the update
+            # write-through: the record keeps the values just written instead of reading them back
+            for col, val in col_value:
+                self[col] = val
+            if "init" in kwargs:
+                self.parse_init()
 
     def insert(self, **kwargs):
         """INSERT a record in the table"""
@@ -170,6 +196,14 @@ class Ponicwatch_Table(dict):
             db.close()
         return [r[0] for r in rows]
 
+    @classmethod
+    def load_all(cls, db, META, where_clause=None, args=()):
+        """return all the table rows, in one SELECT, as a dictionary {id: row} to create the objects with 'record=row'"""
+        with db.reading() as curs:
+            curs.execute("SELECT * FROM {0}{1}".format(META["table"], " WHERE " + where_clause if where_clause else ""), args)
+            rows = curs.fetchall()
+        return {r[META["id"]]: r for r in rows}
+
     @classmethod
     def get_field_value(cls, db, META, id, field):
         """return the unique value from the table.field matching the id"""
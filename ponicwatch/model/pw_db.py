@@ -5,19 +5,71 @@
     pw_db.py: the database connection parameters which can be used on both locally Sqlite3 and MySQL (or equivalent like MariaDB) in the Cloud.
 """
 import os
-from threading import BoundedSemaphore
+from time import time, perf_counter
+from datetime import datetime, timezone
+from threading import BoundedSemaphore, Lock, local, current_thread
+from contextlib import contextmanager
+from urllib.request import pathname2url
 # import atexit
 import sqlite3
 
+class Timed_Semaphore(object):
+    """BoundedSemaphore keeping, per thread name, the number of acquisitions and the time spent waiting for them"""
+    def __init__(self, value=1):
+        self.semaphore = BoundedSemaphore(value=value)
+        self.stats, self.stats_lock = {}, Lock()
+
+    def acquire(self, blocking=True, timeout=None):
+        start = perf_counter()
+        acquired = self.semaphore.acquire(blocking, timeout)
+        wait = perf_counter() - start
+        with self.stats_lock:
+            stats = self.stats.setdefault(current_thread().name, {"count": 0, "wait": 0.0, "max_wait": 0.0})
+            stats["count"] += 1
+            stats["wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+        return acquired
+
+    def release(self):
+        self.semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
+    def get_stats(self):
+        with self.stats_lock:
+            return {name: dict(stats, avg_wait=stats["wait"] / stats["count"]) for name, stats in self.stats.items()}
+
+
+class Schema_Error(Exception):
+    """The database schema is older than the migrations of this version: only the Controller upgrades it"""
+    pass
+
+
 class Ponicwatch_Db():
     """
     Common 'interface' to be used to access the database layer with a specific DBMS
     """
-    def __init__(self, dbms, server_params, clean_tables=False):
-        """Connects to a database and create a cursor. Ensure the db closing at exit"""
+    def __init__(self, dbms, server_params, clean_tables=False, pool_size=2, conn_lifetime=3600, migrate=False):
+        """Connects to a database and create a cursor. Ensure the db closing at exit
+        :param pool_size: number of idle connections kept open for re-use. 0 to connect/disconnect on every open/close
+        :param conn_lifetime: seconds after which a pooled connection is discarded and a fresh one is created
+        :param migrate: True to apply the missing migrations (the Controller). Else an older schema raises Schema_Error:
+                        the tools never upgrade a database another process might be using.
+        """
         assert(dbms in ["sqlite3", "mysql"])
         assert(type(server_params) is dict)
-        self.exclusive_access = BoundedSemaphore(value=1)
+        self.exclusive_access = Timed_Semaphore(value=1)
+        # pools of idle connections as a list of (connection, creation time): writer and read-only connections
+        self.pool, self.read_pool, self.pool_lock = [], [], Lock()
+        self.pool_size, self.conn_lifetime = pool_size, conn_lifetime
+        self.pool_stats = {"created": 0, "reused": 0, "discarded": 0, "reads": 0}
+        # threads flagged as readers (i.e. the web pages) read on their own connections without the exclusive access
+        self.thread = local()
+        self.read_only = False
         if dbms == "sqlite3" and "database" in server_params:
             # server_params = {'database': 'path to the file', "detect_types": sqlite3.PARSE_DECLTYPES}
             # to allow datetime conversion for timestamps
@@ -25,7 +77,18 @@ class Ponicwatch_Db():
                 server_params["detect_types"] = sqlite3.PARSE_DECLTYPES
             if not os.path.isfile(server_params["database"]):
                 self.create_tables(server_params["database"])
+                migrate = True
+            if migrate:
+                self.schema_version = self.migrate(server_params["database"])
+            else:
+                self.schema_version = self.get_schema_version(server_params["database"])
+                if self.schema_version < migrations[-1][0]:
+                    raise Schema_Error("Database {} at schema version {} instead of {}: start the Controller to migrate it".format(
+                                       server_params["database"], self.schema_version, migrations[-1][0]))
             self.connect = sqlite3.connect
+            # WAL journal: the readers are not blocked by the writer and do not block it
+            with sqlite3.connect(server_params["database"]) as conn:
+                self.read_only = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0].lower() == "wal"
         else:
             # refer to: http://www.philvarner.com/test/ng-python3-db-api/
             # server_params = {'database': 'mydb',
@@ -44,8 +107,7 @@ class Ponicwatch_Db():
             
     def open(self):
         if not self.is_open:
-            self.conn = self.connect(**self.server_params)
-            self.conn.row_factory = sqlite3.Row
+            self.conn, self.conn_created_on = self.checkout()
             self.curs = self.conn.cursor()
             self.is_open = True
 
@@ -55,14 +117,112 @@ class Ponicwatch_Db():
     def close(self):
         if self.allow_close and self.is_open:
             self.curs.close()
-            self.conn.close()
+            self.checkin(self.conn, self.conn_created_on)
             self.is_open = False
 
+    def set_reader(self, reader=True):
+        """Flag the current thread as a reader: its SELECT use read-only connections instead of the exclusive access"""
+        self.thread.reader = reader
+
+    @contextmanager
+    def reading(self):
+        """Cursor for a SELECT: on a read-only connection for the reader threads, else with the exclusive access
+        Usage:  with db.reading() as curs: ...
+        """
+        if self.read_only and getattr(self.thread, "reader", False):
+            conn, created_on = self.checkout(read_only=True)
+            curs = conn.cursor()
+            try:
+                yield curs
+            finally:
+                curs.close()
+                self.checkin(conn, created_on, read_only=True)
+                with self.pool_lock:
+                    self.pool_stats["reads"] += 1
+        else:
+            with self.exclusive_access:
+                self.open()
+                try:
+                    yield self.curs
+                finally:
+                    self.close()
+
+    def new_connection(self, read_only=False):
+        """Create a new connection to the database. It can be shared between threads as the access is serialized"""
+        if read_only:
+            params = dict(self.server_params, database="file:{}?mode=ro".format(pathname2url(os.path.abspath(self.server_params["database"]))), uri=True)
+        else:
+            params = self.server_params
+        conn = self.connect(check_same_thread=False, **params)
+        conn.row_factory = sqlite3.Row
+        with self.pool_lock:
+            self.pool_stats["created"] += 1
+        return conn
+
+    def is_healthy(self, conn, created_on):
+        """Check that a pooled connection is still young enough and able to execute a statement"""
+        if time() - created_on > self.conn_lifetime:
+            return False
+        try:
+            conn.execute("select 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def checkout(self, read_only=False):
+        """Get a healthy connection from the pool or create a new one
+        :return: tuple (connection, creation time)
+        """
+        pool = self.read_pool if read_only else self.pool
+        while True:
+            with self.pool_lock:
+                if not pool:
+                    break
+                conn, created_on = pool.pop()
+            if self.is_healthy(conn, created_on):
+                with self.pool_lock:
+                    self.pool_stats["reused"] += 1
+                return conn, created_on
+            self.discard(conn)
+        return self.new_connection(read_only), time()
+
+    def checkin(self, conn, created_on, read_only=False):
+        """Give back a connection to the pool or close it if the pool is full"""
+        if conn.in_transaction:
+            conn.rollback()
+        pool = self.read_pool if read_only else self.pool
+        with self.pool_lock:
+            if len(pool) < self.pool_size:
+                pool.append((conn, created_on))
+                return
+        self.discard(conn)
+
+    def discard(self, conn):
+        """Close a connection no longer kept in the pool"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self.pool_lock:
+            self.pool_stats["discarded"] += 1
+
+    def get_pool_stats(self):
+        """Copy of the pool counters with the number of idle connections, consistent with each other"""
+        with self.pool_lock:
+            return dict(self.pool_stats, idle=len(self.pool), idle_readers=len(self.read_pool))
+
+    def close_pool(self):
+        """Close all the idle connections, usually at the application exit"""
+        with self.pool_lock:
+            pool, self.pool, self.read_pool = self.pool + self.read_pool, [], []
+        for conn, created_on in pool:
+            self.discard(conn)
+
     def clean(self):
         self.open()
         try:
-            for sql in ("delete from tb_log",):
-                self.curs.execute(sql)
+            for partition in log_partitions(self.curs):
+                self.curs.execute("delete from " + partition)
             self.conn.commit()
         except sqlite3.InterfaceError as err:
             print('*' * 30, err)
@@ -72,9 +232,15 @@ class Ponicwatch_Db():
     def __str__(self):
         return "{} on {}".format(self.server_params["database"],self.dbms)
 
-    def synchro_to_cloud(self):
-        """Synchronize selected tables from local Sqlite3 db to MySQL db in the Cloud"""
-        pass
+    def synchro_to_cloud(self, remote):
+        """Synchronize selected tables from local Sqlite3 db to MySQL db in the Cloud: one incremental pass
+        :param remote: connection to the Cloud database i.e. model.synchro.Cloud_Sqlite
+        :return: statistics of the synchronization
+        """
+        from model.synchro import Cloud_Synchro
+        synchro = Cloud_Synchro(self, remote)
+        synchro.synchronize()
+        return synchro.get_stats()
 
 
     def create_tables(self, db_path):
@@ -85,6 +251,48 @@ class Ponicwatch_Db():
                 curs.execute(sql)
             conn.commit()
 
+    @staticmethod
+    def get_schema_version(db_path):
+        """Version of the database schema, without changing it: 0 for a database never migrated"""
+        conn = sqlite3.connect(db_path)
+        try:
+            if not conn.execute("select name from sqlite_master where type='table' and name='schema_version'").fetchone():
+                return 0
+            return conn.execute("select max(version) from schema_version").fetchone()[0] or 0
+        finally:
+            conn.close()
+
+    def migrate(self, db_path):
+        """Upgrade in place the database schema by applying the 'migrations' not yet recorded in schema_version.
+        Each migration is applied in its own transaction: an error leaves the database at the previous version.
+        :return: the current schema version
+        """
+        conn = sqlite3.connect(db_path, isolation_level=None)  # transactions are handled explicitly
+        try:
+            conn.execute(sql_schema_version)
+            version = conn.execute("select max(version) from schema_version").fetchone()[0] or 0
+            for mig_version, description, steps in migrations:
+                if mig_version <= version:
+                    continue
+                conn.execute("BEGIN")
+                try:
+                    for step in steps:
+                        if callable(step):
+                            step(conn)
+                        else:
+                            conn.execute(step)
+                    conn.execute("INSERT INTO schema_version (version, description, applied_on) VALUES (?, ?, ?)",
+                                 (mig_version, description, datetime.now(timezone.utc)))
+                    conn.execute("COMMIT")
+                except sqlite3.Error as err:
+                    conn.execute("ROLLBACK")
+                    print('*' * 30, "Migration {} '{}' failed: {}".format(mig_version, description, err))
+                    raise
+                version = mig_version
+        finally:
+            conn.close()
+        return version
+
 
 sql_statements = {
 
@@ -173,6 +381,291 @@ sql_statements = {
 }
 
 
+sql_schema_version = """CREATE TABLE IF NOT EXISTS schema_version (
+    "version" INTEGER PRIMARY KEY NOT NULL,
+    "description" TEXT,
+    "applied_on" TIMESTAMP
+)"""
+
+# version 1: the configuration tables get a primary key on their id
+sql_primary_keys = {
+
+'tb_sensor': """CREATE TABLE tb_sensor (
+    "sensor_id" INTEGER PRIMARY KEY NOT NULL,
+    "name" TEXT NOT NULL,
+    "mode" INTEGER NOT NULL DEFAULT ('(0)'),
+    "init" TEXT NOT NULL,
+    "timer" TEXT,
+    "read_value" FLOAT NOT NULL DEFAULT ('(0.0)'),
+    "value" FLOAT NOT NULL DEFAULT ('(0.0)'),
+    "timestamp_value" TIMESTAMP,
+    "updated_on" TIMESTAMP,
+    "synchro_on" TIMESTAMP
+)""",
+
+'tb_switch': """CREATE TABLE "tb_switch" (
+	`switch_id`	INTEGER PRIMARY KEY NOT NULL,
+	`name`	TEXT NOT NULL,
+	`mode`	INTEGER NOT NULL DEFAULT '(0)',
+	`init`	TEXT NOT NULL,
+	`timer`	TEXT NOT NULL,
+	`value`	INTEGER NOT NULL DEFAULT '(0)',
+	`timer_interval`	INTEGER NOT NULL DEFAULT '(15)',
+	`updated_on`	TIMESTAMP,
+	`synchro_on`	TIMESTAMP
+)""",
+
+'tb_system':    """CREATE TABLE tb_system (
+    "system_id" INTEGER PRIMARY KEY NOT NULL,
+    "name" TEXT NOT NULL,
+    "location" TEXT,
+    "nb_plants" INTEGER NOT NULL DEFAULT (0),
+    "sys_type" TEXT
+)""",
+
+'tb_interrupt': """CREATE TABLE tb_interrupt (
+    "interrupt_id" INTEGER PRIMARY KEY NOT NULL,
+    "name" TEXT NOT NULL,
+    "hardware" TEXT NOT NULL,
+    "init" TEXT,
+    "threshold" INTEGER NOT NULL DEFAULT (0),
+    "updated_on" TIMESTAMP,
+    "synchro_on" TIMESTAMP
+)""",
+
+ 'tb_hardware': """CREATE TABLE tb_hardware (
+    "hardware_id" INTEGER PRIMARY KEY NOT NULL,
+    "name" TEXT NOT NULL,
+    "mode" INTEGER NOT NULL DEFAULT (0),
+    "hardware" TEXT NOT NULL,
+    "init" TEXT,
+    "updated_on" TIMESTAMP,
+    "synchro_on" TIMESTAMP,
+    "value" INTEGER DEFAULT (0)
+)""",
+}
+
+
+# version 3: tb_log is a view on monthly partitions tb_log_YYYYMM. log_id is given by Ponicwatch_Log to stay unique.
+sql_log_partition = """CREATE TABLE IF NOT EXISTS {0} (
+    "log_id" INTEGER PRIMARY KEY NOT NULL,
+    "controller_name" TEXT NOT NULL,
+    "log_type" TEXT NOT NULL,
+    "object_id" INTEGER NOT NULL,
+    "system_name" TEXT NOT NULL,
+    "float_value" REAL NOT NULL DEFAULT (0.0),
+    "text_value" TEXT,
+    "created_on" TIMESTAMP NOT NULL
+)"""
+
+sql_log_partition_indexes = (
+    "CREATE INDEX IF NOT EXISTS ix_{0}_object ON {0} (log_type, object_id, created_on, float_value)",
+    "CREATE INDEX IF NOT EXISTS ix_{0}_type_created ON {0} (log_type, created_on)",
+    "CREATE INDEX IF NOT EXISTS ix_{0}_created ON {0} (created_on)",  # with the rowid: keyset on (created_on, log_id)
+)
+
+
+def log_partition_name(timestamp):
+    """Name of the tb_log partition for a timestamp given as datetime (naive is UTC) or 'YYYY-MM...' string"""
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo:
+            timestamp = timestamp.astimezone(timezone.utc)
+        return "tb_log_{:%Y%m}".format(timestamp)
+    return "tb_log_" + timestamp[:4] + timestamp[5:7]
+
+
+def log_partitions(curs):
+    """Sorted list of the tb_log partitions found in the database"""
+    curs.execute("select name from sqlite_master where type='table' and name glob 'tb_log_[0-9][0-9][0-9][0-9][0-9][0-9]'")
+    return sorted(r[0] for r in curs.fetchall())
+
+
+def create_log_partition(curs, name):
+    curs.execute(sql_log_partition.format(name))
+    for sql in sql_log_partition_indexes:
+        curs.execute(sql.format(name))
+
+
+def index_log_partitions(conn):
+    """Create the missing indexes on all the existing partitions"""
+    for partition in log_partitions(conn.cursor()):
+        for sql in sql_log_partition_indexes:
+            conn.execute(sql.format(partition))
+
+
+def create_log_view(curs, partitions):
+    """(Re)create the view tb_log as the union of all the partitions"""
+    curs.execute("DROP VIEW IF EXISTS tb_log")
+    curs.execute("CREATE VIEW tb_log AS " + " UNION ALL ".join("SELECT * FROM " + p for p in partitions))
+
+
+def partition_log_table(conn):
+    """Move the rows of the table tb_log to the monthly partitions and replace it by the view"""
+    conn.execute("ALTER TABLE tb_log RENAME TO tb_log_unpartitioned")
+    conn.execute("CREATE INDEX ix_log_unpartitioned ON tb_log_unpartitioned (created_on)")
+    current = log_partition_name(datetime.now(timezone.utc))
+    create_log_partition(conn, current)
+    months = [r[0] for r in conn.execute("SELECT DISTINCT substr(created_on, 1, 7) FROM tb_log_unpartitioned "
+                                         "WHERE created_on GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*'")]
+    for month in months:
+        create_log_partition(conn, log_partition_name(month))
+        conn.execute("INSERT INTO {} SELECT * FROM tb_log_unpartitioned WHERE created_on >= ? AND created_on < ?".format(log_partition_name(month)),
+                     (month, month + '~'))  # '~' sorts after any timestamp character
+    # invalid timestamps are kept in the current partition
+    conn.execute("INSERT INTO {} SELECT * FROM tb_log_unpartitioned "
+                 "WHERE NOT created_on GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*'".format(current))
+    conn.execute("DROP TABLE tb_log_unpartitioned")
+    create_log_view(conn, log_partitions(conn.cursor()))
+
+
+# version 4: aggregates per minute/hour/day of the SENSOR and SWITCH values, maintained by Ponicwatch_Rollup
+sql_rollup = """CREATE TABLE IF NOT EXISTS tb_log_rollup (
+    "resolution" TEXT NOT NULL,
+    "log_type" TEXT NOT NULL,
+    "object_id" INTEGER NOT NULL,
+    "bucket" TIMESTAMP NOT NULL,
+    "nb_values" INTEGER NOT NULL DEFAULT (0),
+    "min_value" REAL,
+    "max_value" REAL,
+    "sum_value" REAL,
+    "last_value" REAL,
+    "last_on" TIMESTAMP,
+    PRIMARY KEY (resolution, log_type, object_id, bucket)
+)"""
+
+# (name, bucket length in seconds, length of the created_on prefix identifying the bucket, completion of the prefix)
+ROLLUP_RESOLUTIONS = (
+    ("day", 86400, 10, " 00:00:00"),
+    ("hour", 3600, 13, ":00:00"),
+    ("minute", 60, 16, ":00"),
+)
+ROLLUP_LOG_TYPES = ("SENSOR", "SWITCH")
+
+# SQLite: the bare column float_value is taken from the row matching max(created_on)
+sql_rollup_partition = """INSERT INTO tb_log_rollup
+    SELECT ?, log_type, object_id, substr(created_on, 1, {0}) || ?, count(*),
+           min(float_value), max(float_value), sum(float_value), float_value, substr(max(created_on), 1, 19)
+    FROM {1} WHERE log_type IN ('SENSOR', 'SWITCH') GROUP BY log_type, object_id, substr(created_on, 1, {0})"""
+
+
+def rollup_log_partition(curs, partition):
+    """Aggregate all the records of a tb_log partition in tb_log_rollup"""
+    for resolution, seconds, prefix, completion in ROLLUP_RESOLUTIONS:
+        curs.execute(sql_rollup_partition.format(prefix, partition), (resolution, completion))
+
+
+def fill_rollup(conn):
+    for partition in log_partitions(conn.cursor()):
+        rollup_log_partition(conn, partition)
+
+
+# version 5: compact store of the SENSOR/SWITCH values by chunks, maintained by Ponicwatch_Series
+sql_series = """CREATE TABLE IF NOT EXISTS tb_series (
+    "log_type" TEXT NOT NULL,
+    "object_id" INTEGER NOT NULL,
+    "first_on" INTEGER NOT NULL,
+    "last_on" INTEGER NOT NULL,
+    "nb_values" INTEGER NOT NULL,
+    "deltas" BLOB NOT NULL,
+    "vals" BLOB NOT NULL,
+    PRIMARY KEY (log_type, object_id, first_on)
+)"""
+
+
+# version 6: high-water marks of the synchronization to the Cloud, maintained by Cloud_Synchro
+sql_synchro = """CREATE TABLE IF NOT EXISTS tb_synchro (
+    "table_name" TEXT PRIMARY KEY NOT NULL,
+    "high_water" TEXT,
+    "nb_rows" INTEGER NOT NULL DEFAULT (0),
+    "synchro_on" TIMESTAMP
+)"""
+
+
+# version 8: state of the Sensor filters kept across restarts, maintained by Signal_Filter
+sql_filter_state = """CREATE TABLE IF NOT EXISTS tb_filter_state (
+    "sensor_id" INTEGER PRIMARY KEY NOT NULL,
+    "filter" TEXT NOT NULL,
+    "state" BLOB NOT NULL,
+    "updated_on" TIMESTAMP
+)"""
+
+
+# version 9: values of the tb_series chunks being filled, appended in the transaction of their batch
+sql_series_open = """CREATE TABLE IF NOT EXISTS tb_series_open (
+    "log_type" TEXT NOT NULL,
+    "object_id" INTEGER NOT NULL,
+    "value_on" INTEGER NOT NULL,
+    "float_value" REAL NOT NULL
+)"""
+
+
+# version 10: counters allocated in the transaction of the INSERTs using them, i.e. the log_id of the tb_log partitions
+sql_counter = """CREATE TABLE IF NOT EXISTS tb_counter (
+    "name" TEXT PRIMARY KEY NOT NULL,
+    "value" INTEGER NOT NULL DEFAULT (0)
+)"""
+
+
+def seed_log_counter(conn):
+    """Start the log_id counter after the greatest log_id of the partitions"""
+    last_id = 0
+    for partition in log_partitions(conn.cursor()):
+        last_id = max(last_id, conn.execute("select max(log_id) from " + partition).fetchone()[0] or 0)
+    conn.execute("INSERT OR IGNORE INTO tb_counter (name, value) VALUES ('log_id', ?)", (last_id,))
+
+
+def allocate_ids(curs, name, nb_ids):
+    """Reserve nb_ids consecutive values of a counter - must be called within the transaction using them:
+    the UPDATE takes the write lock first, no other connection can get the same values
+    :return: first value reserved
+    """
+    curs.execute("UPDATE tb_counter SET value = value + ? WHERE name = ?", (nb_ids, name))
+    curs.execute("SELECT value FROM tb_counter WHERE name = ?", (name,))
+    return curs.fetchone()[0] - nb_ids + 1
+
+
+def rebuild_table(table, create_sql):
+    """SQL statements to re-create a table with a new definition but the same columns in the same order, keeping its rows"""
+    return ["ALTER TABLE {0} RENAME TO {0}_old".format(table),
+            create_sql,
+            "INSERT INTO {0} SELECT * FROM {0}_old".format(table),
+            "DROP TABLE {0}_old".format(table)]
+
+
+# list of (version, description, steps): a step is either an SQL statement or a function accepting the connection
+migrations = [
+    (1, "primary keys on the configuration tables",
+        [sql for table, create_sql in sql_primary_keys.items() for sql in rebuild_table(table, create_sql)]),
+    (2, "indexes on tb_log",
+        ["CREATE INDEX IF NOT EXISTS ix_log_object ON tb_log (log_type, object_id, created_on, float_value)",
+         "CREATE INDEX IF NOT EXISTS ix_log_type_created ON tb_log (log_type, created_on)"]),
+    (3, "monthly partitions of tb_log", [partition_log_table]),
+    (4, "rollup table of the SENSOR/SWITCH values", [sql_rollup, fill_rollup]),
+    (5, "columnar store of the SENSOR/SWITCH values", [sql_series]),
+    (6, "high-water marks of the Cloud synchronization", [sql_synchro]),
+    (7, "index on created_on of the tb_log partitions", [index_log_partitions]),
+    (8, "state of the sensor filters", [sql_filter_state]),
+    (9, "values of the tb_series chunks being filled", [sql_series_open]),
+    (10, "counter of the tb_log ids", [sql_counter, seed_log_counter]),
+]
+
+
+def current_schema():
+    """CREATE TABLE statements of all the tables once all the migrations are applied
+    tb_log is a view: its partitions follow sql_log_partition
+    """
+    schema = dict(sql_statements)
+    schema.update(sql_primary_keys)
+    schema['tb_log_rollup'] = sql_rollup
+    schema['tb_series'] = sql_series
+    schema['tb_synchro'] = sql_synchro
+    schema['tb_filter_state'] = sql_filter_state
+    schema['tb_series_open'] = sql_series_open
+    schema['tb_counter'] = sql_counter
+    del schema['tb_log']
+    return schema
+
+
 def same_schema(sch1, sch2):
     """Compare two schema strings ignoring whitespaces and quotes
     Display the line in error
@@ -189,8 +682,9 @@ def same_schema(sch1, sch2):
 
 if __name__ == "__main__":
     db = Ponicwatch_Db("sqlite3", {'database': "../local_ponicwatch.db"})
+    print("Schema version:", db.schema_version)
     db.open()
-    for table, schema in sql_statements.items():
+    for table, schema in current_schema().items():
         db.curs.execute("select sql from sqlite_master where type = 'table' and name = ?", (table, ))
         in_schema = db.curs.fetchone()
         if same_schema(schema, in_schema[0]):
@@ -199,5 +693,6 @@ if __name__ == "__main__":
             print("Table {} has difference:".format(table))
             print("In program:\n", schema)
             print("In database:\n", in_schema[0])
+    print("tb_log partitions:", ", ".join(log_partitions(db.curs)))
     db.close()
 
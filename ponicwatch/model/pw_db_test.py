@@ -0,0 +1,108 @@
+#!/bin/python3
+"""
+  Test the database layer on temporary Sqlite3 files
+  To run from the ponicwatch folder:  python -m pytest model/pw_db_test.py
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from threading import current_thread
+from model.pw_db import Ponicwatch_Db, Timed_Semaphore, Schema_Error, migrations
+
+
+class Migrations(unittest.TestCase):
+    def test_migrate_baseline(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = os.path.join(folder, "baseline.db")
+            Ponicwatch_Db.create_tables(None, db_path)  # as created by the first versions: no schema_version
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("INSERT INTO tb_sensor (sensor_id, name, init, timer) VALUES (3, 'Temp', '{}', '0')")
+                conn.execute("INSERT INTO tb_log VALUES (1, 'Test', 'SENSOR', 3, 'Sys', 20.0, 'value', '2026-09-01 00:01:00.000000')")
+            self.assertEqual(Ponicwatch_Db.get_schema_version(db_path), 0)
+            db = Ponicwatch_Db("sqlite3", {'database': db_path}, migrate=True)
+            self.assertEqual(db.schema_version, migrations[-1][0])
+            db.close_pool()
+            with sqlite3.connect(db_path) as conn:
+                self.assertEqual(conn.execute("SELECT sensor_id, name FROM tb_sensor").fetchall(), [(3, 'Temp')])
+                self.assertEqual(conn.execute("SELECT log_id, float_value FROM tb_log").fetchall(), [(1, 20.0)])
+                with self.assertRaises(sqlite3.IntegrityError):  # sensor_id is now the primary key
+                    conn.execute("INSERT INTO tb_sensor (sensor_id, name, init, timer) VALUES (3, 'Copy', '{}', '0')")
+                indexes = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")]
+                self.assertIn("ix_tb_log_202609_object", indexes)  # on each monthly partition
+            # already migrated: opened without migrate by the tools
+            db = Ponicwatch_Db("sqlite3", {'database': db_path})
+            self.assertEqual(db.schema_version, migrations[-1][0])
+            db.close_pool()
+
+    def test_refused_without_migrate(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = os.path.join(folder, "baseline.db")
+            Ponicwatch_Db.create_tables(None, db_path)
+            with self.assertRaises(Schema_Error):  # only the Controller migrates
+                Ponicwatch_Db("sqlite3", {'database': db_path})
+            self.assertEqual(Ponicwatch_Db.get_schema_version(db_path), 0)
+
+
+class Pool(unittest.TestCase):
+    def test_connection_reused(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "pool.db")}, pool_size=1)
+            for i in range(5):
+                db.open()
+                db.curs.execute("select count(*) from tb_user")
+                db.close()
+            self.assertEqual(db.get_pool_stats()["created"], 1)
+            self.assertEqual(db.get_pool_stats()["reused"], 4)
+            self.assertEqual(db.get_pool_stats()["idle"], 1)
+            db.close_pool()
+            self.assertEqual(db.get_pool_stats()["idle"], 0)
+
+    def test_expired_connection_discarded(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "pool.db")}, conn_lifetime=-1)
+            db.open()
+            db.close()
+            db.open()  # too old to be reused
+            db.close()
+            self.assertEqual(db.get_pool_stats()["created"], 2)
+            self.assertEqual(db.get_pool_stats()["discarded"], 1)
+            db.close_pool()
+
+    def test_no_pool(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "pool.db")}, pool_size=0)
+            db.open()
+            db.close()
+            self.assertEqual(db.get_pool_stats()["discarded"], 1)
+            self.assertEqual(db.get_pool_stats()["idle"], 0)
+
+
+class Reader(unittest.TestCase):
+    def test_reader_not_blocked(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "reader.db")})
+            self.assertTrue(db.read_only)  # WAL journal
+            db.set_reader(True)
+            try:
+                with db.exclusive_access:  # held by the writer: the reader uses its own connection
+                    with db.reading() as curs:
+                        curs.execute("select count(*) from tb_user")
+                        self.assertEqual(curs.fetchone()[0], 0)
+            finally:
+                db.set_reader(False)
+            stats = db.get_pool_stats()
+            self.assertEqual((stats["reads"], stats["idle_readers"], stats["idle"]), (1, 1, 0))
+            db.close_pool()
+
+    def test_wait_statistics(self):
+        semaphore = Timed_Semaphore()
+        with semaphore:
+            self.assertFalse(semaphore.acquire(timeout=0.05))
+        stats = semaphore.get_stats()[current_thread().name]
+        self.assertEqual(stats["count"], 2)
+        self.assertGreaterEqual(stats["max_wait"], 0.04)
+
+
+if __name__ == "__main__":
+    unittest.main()
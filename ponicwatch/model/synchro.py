@@ -0,0 +1,168 @@
+#!/bin/python3
+"""
+    synchro.py: incremental replication of the local Sqlite3 database to a database in the Cloud.
+
+    For each table a high-water mark is kept in tb_synchro and only moves forward once the remote database
+    has committed a batch: an interrupted synchronization resumes from the last committed batch.
+    - tb_log: rows with a log_id above the high-water mark, in batches of 'batch_size' rows
+    - tb_sensor, tb_switch, tb_hardware, tb_interrupt: rows updated since the high-water mark ('updated_on').
+      Their 'synchro_on' column is set once they are shipped.
+    - tb_system, tb_link: the whole table when its content changed (the high-water mark is a digest)
+    tb_user is not replicated as it holds the passwords.
+
+    A batch is shipped as a zlib compressed JSON document {table, columns, rows, mode} and
+    applied by the remote with INSERT OR REPLACE ('upsert' mode) or after deleting all the rows ('replace' mode).
+"""
+import json
+import zlib
+import hashlib
+import sqlite3
+from time import time, sleep
+from threading import Thread, Event
+from datetime import datetime, timezone
+from model.model import Ponicwatch_Table
+from model.pw_db import log_partitions, current_schema, sql_statements
+
+UPDATED_TABLES = (("tb_system", None), ("tb_link", None),
+                  ("tb_hardware", "hardware_id"), ("tb_sensor", "sensor_id"),
+                  ("tb_switch", "switch_id"), ("tb_interrupt", "interrupt_id"))
+
+
+class Cloud_Sqlite(object):
+    """
+    Stand-in of the Cloud database on a Sqlite3 file: same tables as the local database, tb_log being a plain table
+    :param bandwidth: optional, bytes/sec to simulate a slow link
+    """
+    def __init__(self, database, bandwidth=None):
+        self.database, self.bandwidth = database, bandwidth
+        schema = current_schema()
+        schema["tb_log"] = sql_statements["tb_log"]
+        with sqlite3.connect(database) as conn:
+            existing = [r[0] for r in conn.execute("select name from sqlite_master where type='table'")]
+            for table, sql in schema.items():
+                if table not in existing:
+                    conn.execute(sql)
+
+    def send(self, payload):
+        """Transfer and apply one compressed batch in one transaction"""
+        if self.bandwidth:
+            sleep(len(payload) / self.bandwidth)
+        batch = json.loads(zlib.decompress(payload).decode("utf-8"))
+        sql = "INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})".format(batch["table"], ",".join(batch["columns"]),
+                                                                      ",".join("?" * len(batch["columns"])))
+        with sqlite3.connect(self.database) as conn:  # commit or rollback at exit
+            if batch["mode"] == "replace":
+                conn.execute("DELETE FROM " + batch["table"])
+            conn.executemany(sql, batch["rows"])
+
+    def __str__(self):
+        return "Cloud stand-in {}".format(self.database)
+
+
+class Cloud_Synchro(Thread):
+    """Thread synchronizing the local database to the Cloud every 'interval' seconds"""
+    META = {"table": "tb_synchro",
+            "id": "table_name",
+            "columns": (
+                            "table_name",   # TEXT PRIMARY KEY NOT NULL,
+                            "high_water",   # TEXT,
+                            "nb_rows",      # INTEGER NOT NULL DEFAULT (0),
+                            "synchro_on",   # TIMESTAMP
+                        )
+            }
+
+    def __init__(self, db, remote, interval=300.0, batch_size=5000, debug=0):
+        super().__init__(name="pw_synchro", daemon=True)
+        self.table = Ponicwatch_Table(db, Cloud_Synchro.META)
+        self.remote, self.interval, self.batch_size, self.debug = remote, interval, batch_size, debug
+        self.stopped = Event()
+        self.stats = {"passes": 0, "rows": 0, "batches": 0, "raw_bytes": 0, "sent_bytes": 0,
+                      "send_time": 0.0, "errors": 0, "last_error": ""}
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.synchronize()
+            except Exception as err:  # the link or the remote database can fail in many ways: try again later
+                self.stats["errors"] += 1
+                self.stats["last_error"] = str(err)
+                if self.debug >= 2:
+                    print("WARNING: synchronization to", self.remote, "failed:", err)
+            self.stopped.wait(self.interval)
+
+    def stop(self, timeout=10.0):
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def synchronize(self):
+        """One incremental pass on all the replicated tables"""
+        for table, id_column in UPDATED_TABLES:
+            if id_column:
+                self.synchronize_updated(table, id_column)
+            else:
+                self.synchronize_whole(table)
+        while self.synchronize_log():
+            pass
+        self.stats["passes"] += 1
+
+    def high_water(self, table):
+        row = self.table.fetch("SELECT high_water FROM tb_synchro WHERE table_name=?", (table,), only_one=True)
+        return row[0] if row else None
+
+    def ship(self, table, columns, rows, high_water, mode="upsert"):
+        """Send one batch then record the new high-water mark"""
+        raw = json.dumps({"table": table, "columns": columns, "rows": rows, "mode": mode}, default=str).encode("utf-8")
+        payload = zlib.compress(raw)
+        start = time()
+        self.remote.send(payload)
+        self.stats["send_time"] += time() - start
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(rows)
+        self.stats["raw_bytes"] += len(raw)
+        self.stats["sent_bytes"] += len(payload)
+        self.table.execute_sql("INSERT OR REPLACE INTO tb_synchro (table_name, high_water, nb_rows, synchro_on) VALUES "
+                               "(?, ?, coalesce((SELECT nb_rows FROM tb_synchro WHERE table_name=?), 0) + ?, ?)",
+                               (table, high_water, table, len(rows), datetime.now(timezone.utc)))
+
+    def synchronize_updated(self, table, id_column):
+        """Rows updated since the last synchronization"""
+        high_water = self.high_water(table)
+        where, args = ("WHERE updated_on > ?", (high_water,)) if high_water else ("", ())
+        # CAST: the timestamp is kept as stored to be compared as text with the next pass
+        rows = self.table.fetch("SELECT *, CAST(updated_on AS TEXT) FROM {} {} ORDER BY updated_on".format(table, where), args)
+        if rows:
+            columns = list(rows[0].keys())[:-1]
+            self.ship(table, columns, [list(row)[:-1] for row in rows], rows[-1][-1] or high_water)
+            self.table.execute_sql("UPDATE {0} SET synchro_on=? WHERE {1} IN ({2})".format(table, id_column, ",".join("?" * len(rows))),
+                                   [datetime.now(timezone.utc)] + [row[id_column] for row in rows])
+
+    def synchronize_whole(self, table):
+        """The whole table when its digest changed"""
+        rows = self.table.fetch("SELECT * FROM " + table)
+        values = [list(row) for row in rows]
+        digest = hashlib.sha1(json.dumps(values, default=str).encode("utf-8")).hexdigest()
+        if rows and digest != self.high_water(table):
+            self.ship(table, list(rows[0].keys()), values, digest, mode="replace")
+
+    def synchronize_log(self):
+        """One batch of tb_log rows: the lowest log_ids above the high-water mark found in all the partitions
+        :return: True if a full batch was sent i.e. more rows are probably waiting
+        """
+        last_id = int(self.high_water("tb_log") or 0)
+        with self.table.db.reading() as curs:
+            partitions = log_partitions(curs)
+        rows = []
+        for partition in partitions:  # log_id is the rowid: each partition is read in its index order
+            rows += self.table.fetch("SELECT * FROM {} WHERE log_id > ? ORDER BY log_id LIMIT ?".format(partition),
+                                     (last_id, self.batch_size))
+        rows = sorted(rows, key=lambda r: r[0])[:self.batch_size]
+        if rows:
+            self.ship("tb_log", list(rows[0].keys()), [list(row) for row in rows], str(rows[-1][0]))
+        return len(rows) == self.batch_size
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["rows_per_sec"] = stats["rows"] / stats["send_time"] if stats["send_time"] else 0.0
+        stats["compression"] = stats["raw_bytes"] / stats["sent_bytes"] if stats["sent_bytes"] else 0.0
+        return stats
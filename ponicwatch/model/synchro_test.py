@@ -0,0 +1,44 @@
+#!/bin/python3
+"""
+  Test the incremental synchronization to a Sqlite3 file standing for the Cloud database
+  To run from the ponicwatch folder:  python -m pytest model/synchro_test.py
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from model.pw_db import Ponicwatch_Db
+from model.synchro import Cloud_Synchro, Cloud_Sqlite
+from pw_log import Ponicwatch_Log
+
+
+class ctrl:
+    """Controller stand-in: Ponicwatch_Log only needs a name and a database"""
+    def __init__(self, db):
+        self.name = 'Test'
+        self.db = db
+
+
+class Synchro(unittest.TestCase):
+    def test_incremental_log(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "local.db")})
+            remote_path = os.path.join(folder, "remote.db")
+            log = Ponicwatch_Log(ctrl(db))
+            for i in range(5):
+                log.add_info("synchro {}".format(i))
+            synchro = Cloud_Synchro(db, Cloud_Sqlite(remote_path), batch_size=2)
+            synchro.synchronize()
+            with sqlite3.connect(remote_path) as conn:
+                self.assertEqual([r[0] for r in conn.execute("SELECT log_id FROM tb_log ORDER BY log_id")], [1, 2, 3, 4, 5])
+            self.assertEqual(synchro.high_water("tb_log"), "5")
+            log.add_info("synchro 5")
+            synchro.synchronize()
+            with sqlite3.connect(remote_path) as conn:
+                self.assertEqual([r[0] for r in conn.execute("SELECT log_id FROM tb_log ORDER BY log_id")], [1, 2, 3, 4, 5, 6])
+            self.assertEqual(synchro.get_stats()["rows"], 6)  # the rows already shipped are not sent again
+            db.close_pool()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -46,4 +46,20 @@ class pi():
         self.func = func
 
     def set_mode(self, pin, value):
+        pass
+
+    def spi_open(self, spi_channel, baud, spi_flags=0):
+        return 0
+
+    def spi_xfer(self, handle, data):
+        """MCP3208 like answer: 12 bits value in the 2nd and 3rd bytes of every 3 bytes sent"""
+        answer = bytearray()
+        for _ in range(0, len(data), 3):
+            sim = randint(0, 4095)
+            answer += bytes((0, sim >> 8, sim & 0xFF))
+        if DEBUG >= 3:
+            print("Simulation SPI transfer", list(data), "-->", list(answer))
+        return len(answer), answer
+
+    def spi_close(self, handle):
         pass
\ No newline at end of file
@@ -9,9 +9,15 @@ import sys, os
 import argparse
 import signal
 import json
+import asyncio
+from threading import Thread
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.schedulers import SchedulerNotRunningError
-from datetime import datetime
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MAX_INSTANCES
+from datetime import datetime, timedelta, timezone
+from time import time
 
 try:
     import pigpio
@@ -21,12 +27,19 @@ except ImportError:
 import pigpio_simu
 
 from model.pw_db import Ponicwatch_Db
+from model.model import Ponicwatch_Table
+from model.synchro import Cloud_Synchro, Cloud_Sqlite
 from system import System
 from pw_log import Ponicwatch_Log
+from pw_archive import Log_Archive
 from user import User
 from sensor import Sensor
 from switch import Switch
 from hardware import Hardware
+from pw_bus import Bus
+from pw_planner import Job_Planner
+from pw_power import Power_Sequencer
+from pw_filter import Signal_Filter
 from interrupt import Interrupt
 from http_view import http_view, get_image_file, one_pw_object_html, stop as bottle_stop, default as http_default
 from send_email import send_email
@@ -43,7 +56,8 @@ DEBUG = 0
 class Controller(object):
     """The Controller in a MVC model"""
 
-    def __init__(self, db, bottle_ip='127.0.0.1', pigpio_host="", pigpio_port=8888):
+    def __init__(self, db, bottle_ip='127.0.0.1', pigpio_host="", pigpio_port=8888, cloud=None, verbosity=None, use_asyncio=False,
+                 filter_save_interval=300):
         """- Create the controller, its Viewer and connect to database (Model)
            - Select all the hardware (sensors/switches) for the systems under its control
            - Launch the scheduler
@@ -52,6 +66,11 @@ class Controller(object):
 
            :param db: instance of a Ponicwatch_Db
            :param bottle_ip: IP to reach the webpages. Important to set properly for remote access.
+           :param cloud: optional, connection to the Cloud database to synchronize the local database with
+           :param verbosity: optional, log verbosity by category of events i.e. {"POWER": "LOG"} - see Ponicwatch_Log.VERBOSITY
+           :param use_asyncio: optional, the scheduler and the acquisitions run as coroutines on one asyncio event loop
+                the power delays and the waits of the drivers do not hold a thread
+           :param filter_save_interval: seconds between two saves of the sensor filters' state, kept across restarts
         """
         global _simulation # if no PGIO port as we are not running on a Raspberry Pi
         self.debug = DEBUG
@@ -64,10 +83,28 @@ class Controller(object):
         self.name = self.user["name"]  # this name is used to identify the log messages posted by this controller
 
         # opening the LOGger with the debug level for this application run
-        self.log = Ponicwatch_Log(controller=self, debug=DEBUG)
+        # the records removed from tb_log are kept in the 'archive' folder next to the database
+        archive = Log_Archive(os.path.join(os.path.dirname(os.path.abspath(db.server_params["database"])), "archive"))
+        self.log = Ponicwatch_Log(controller=self, debug=DEBUG, batch_write=True, archive=archive, verbosity=verbosity)
+
+        # incremental synchronization of the database to the Cloud, on its own thread
+        self.synchro = Cloud_Synchro(db, cloud, debug=DEBUG) if cloud else None
 
         # Create the background scheduler that will execute the actions (using the APScheduler library)
-        self.scheduler = BackgroundScheduler()
+        self.use_asyncio = use_asyncio
+        self.loop = None
+        if use_asyncio:
+            # the Controller owns its loop: asyncio.get_event_loop() is deprecated when no loop is running
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+        self.scheduler = AsyncIOScheduler(event_loop=self.loop) if use_asyncio else BackgroundScheduler()
+        # the jobs accessing a hardware bus run on the bus' own single thread executor: job id --> Bus
+        self.bus_jobs, self.bus_executors = {}, set()
+        # the jobs accepting a delay ("max_jitter") are spread over the seconds of the minute
+        self.planner = Job_Planner()
+        # the probes powered only for their reading: no thread waits for their power delay
+        self.power = Power_Sequencer()
+        self.scheduler.add_listener(self.on_bus_job, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MAX_INSTANCES)
 
         # select all the systems, sensors, switchs to monitor and the necessary hardware drivers
         self.pig = pigpio.pi(pigpio_host, pigpio_port) if not _simulation else pigpio_simu.pi()
@@ -77,55 +114,88 @@ class Controller(object):
             _simulation = True
         # some plural are "fake" to respect the logic of: <cls name> + 's' --> dictionary of <cls> PonicWatch Object
         self.systems, self.sensors, self.switchs, self.hardwares, self.interrupts = {}, {}, {}, {}, {}
+        # coalesced acquisition jobs: (cron time, hardware id) --> sensors read together
+        self.acquisitions = {}
         # system_id <= 0:  inactive link --> ignore this row
-        self.db.curs.execute("SELECT * from tb_link where system_id > 0 order by system_id desc, order_for_creation")
-        self.links = self.db.curs.fetchall()
+        # the Log_Writer already writes the startup records on the shared connection: it is used with the exclusive access
+        with self.db.exclusive_access:
+            self.db.open()
+            self.db.curs.execute("SELECT * from tb_link where system_id > 0 order by system_id desc, order_for_creation")
+            self.links = self.db.curs.fetchall()
+        # one SELECT per table instead of one per object: a missing row falls back to get_record() raising the KeyError
+        records = {cls: Ponicwatch_Table.load_all(self.db, cls.META) for cls in (System, Hardware, Sensor, Switch, Interrupt)}
         for system_id, sensor_id, switch_id, hardware_id, order_for_creation, interrupt_id in self.links:
             # (1) create all necessary objects
             # (2) and register the system and hardware to a sensor/switch
             if system_id not in self.systems:
-                self.systems[system_id] = System(self, id=system_id)
+                self.systems[system_id] = System(self, id=system_id, record=records[System].get(system_id))
             if hardware_id and hardware_id not in self.hardwares:
                 self.hardwares[hardware_id] = Hardware(controller=self,
                                                        id=hardware_id,
+                                                       record=records[Hardware].get(hardware_id),
                                                        system_name=self.systems[system_id]["name"])
             if sensor_id and sensor_id not in self.sensors:
                     self.sensors[sensor_id] = Sensor(controller=self,
                                                      id=sensor_id,
+                                                     record=records[Sensor].get(sensor_id),
                                                      system_name=self.systems[system_id]["name"],
                                                      hardware=self.hardwares[hardware_id])
             if switch_id and switch_id not in self.switchs:
                     self.switchs[switch_id] = Switch(controller=self,
                                                      id=switch_id,
+                                                     record=records[Switch].get(switch_id),
                                                      system_name=self.systems[system_id]["name"],
                                                      hardware=self.hardwares[hardware_id])
 
             if interrupt_id and interrupt_id not in self.interrupts:
                 self.interrupts[interrupt_id] = Interrupt(controller=self,
                                                           id=interrupt_id,
+                                                          record=records[Interrupt].get(interrupt_id),
                                                           system_name=self.systems[system_id]["name"],
                                                           hardware=self.hardwares[hardware_id])
-        self.db.allow_close = True
-        self.db.close()
+        # the sensor filters continue from their state saved at the last stop
+        states = Signal_Filter.load_states(self.db)
+        for sensor in self.sensors.values():
+            if sensor.filter:
+                sensor.filter.restore(states.get(sensor["id"]))
+        if any(sensor.filter for sensor in self.sensors.values()):
+            # saved periodically too: a crash or a power loss only loses the readings since the last save
+            self.scheduler.add_job(self.save_filter_states, 'interval', seconds=filter_save_interval)
+        with self.db.exclusive_access:
+            self.db.allow_close = True
+            self.db.close()
+        self.stopped = False
 
-    def add_cron_job(self, callback, timer):
+    @staticmethod
+    def parse_timer(timer):
         """
-        Add a new scheduled task
-        :param callback:
         :param timer:  a string '* * * * * *' OR a JSON object as { 't': ['* * * * * *', t2, t3...]}
-        :return:
+        :return: list of cron time strings
         """
         if timer[0]=='{':
             # convert the JSON timer string to a python dictionary
             try:
-                cron_times = json.loads(timer)
-                cron_times = cron_times['t']
+                return json.loads(timer)['t']
             except:  # json.JSONDecodeError:
                 print("Alarm: timer is not a JSON string!", timer)
-        else:
-            cron_times = [timer]
+                return []
+        return [timer]
+
+    def add_cron_job(self, callback, timer, args=None, bus=None, max_jitter=0, seed=""):
+        """
+        Add a new scheduled task
+        :param callback:
+        :param timer:  a string '* * * * * *' OR a JSON object as { 't': ['* * * * * *', t2, t3...]}
+        :param args: optional, arguments given to the callback
+        :param bus: optional, Bus accessed by the task: the task runs on the bus' executor
+        :param max_jitter: optional, delay in seconds the task accepts to be spread from the other tasks
+        :param seed: optional, name of the object scheduling the task: its offset does not depend on random
+        :return:
+        """
+        # asyncio runtime: the coroutines run on the event loop, the other jobs on the loop's worker threads
+        executor = self.bus_executor(bus) if bus and not self.use_asyncio else 'default'
         i = 0.0
-        for cron_time in cron_times:
+        for cron_time in self.parse_timer(timer):
             # When do we need to read the sensor or activate a switch?
             # ┌───────────── sec (0 - 59)
             # | ┌───────────── min (0 - 59)
@@ -138,11 +208,124 @@ class Controller(object):
             # | │ │ │ │ │
             # * * * * * *
             _sec, _min, _hrs, _dom, _mon, _dow = cron_time.split()  # like "*/5 * * * * *" --> every 5 seconds
-            self.scheduler.add_job(callback, 'cron', second=_sec, minute=_min, hour=_hrs, day=_dom, month=_mon, day_of_week=_dow)
+            _sec = self.planner.plan(_sec, max_jitter, seed, minute=_min,
+                                     every_minute=(_min, _hrs, _dom, _mon, _dow) == ("*", "*", "*", "*", "*"))
+            job = self.scheduler.add_job(callback, 'cron', args=args, executor=executor,
+                                         second=_sec, minute=_min, hour=_hrs, day=_dom, month=_mon, day_of_week=_dow)
+            if bus:
+                self.bus_jobs[job.id] = bus
             self.log.add_log(log_type='SCHEDULER', system_name='@startup',
-                            param={ 'error_code':0, 'text_value': cron_time, 'float_value':i})
+                            param={ 'error_code':0, 'text_value': " ".join((_sec, _min, _hrs, _dom, _mon, _dow)), 'float_value':i})
             i += 1.0
 
+    def bus_executor(self, bus):
+        """Alias of the executor of a bus: one thread per bus, created on first use"""
+        if bus.name not in self.bus_executors:
+            self.scheduler.add_executor(ThreadPoolExecutor(max_workers=1), alias=bus.name)
+            self.bus_executors.add(bus.name)
+        return bus.name
+
+    def on_bus_job(self, event):
+        """Scheduler listener: counts the jobs queued on each bus' executor"""
+        bus = self.bus_jobs.get(event.job_id)
+        if bus is None:
+            return
+        if event.code == EVENT_JOB_SUBMITTED:
+            bus.job_submitted()
+        elif event.code == EVENT_JOB_MAX_INSTANCES:  # previous run still queued or running: this one is dropped
+            bus.job_skipped()
+        else:
+            bus.job_finished()
+
+    def add_acquisition_job(self, sensor, timer):
+        """
+        Schedule the reading of a sensor: the sensors read at the same cron time on the same hardware, with the
+        same "max_jitter", share one job, reading them all in one pass before logging their values
+        :param sensor: Sensor object
+        :param timer: same as add_cron_job
+        """
+        for cron_time in self.parse_timer(timer):
+            max_jitter = sensor.init_dict.get("max_jitter", 0)
+            key = (" ".join(cron_time.split()), sensor.hardware["id"], max_jitter)
+            if key in self.acquisitions:
+                self.acquisitions[key]["sensors"].append(sensor)
+            else:
+                self.acquisitions[key] = {"sensors": [sensor], "bus": sensor.hardware.bus, "runs": 0, "read_time": 0.0, "max_read_time": 0.0}
+                self.add_cron_job(self.acquire_async if self.use_asyncio else self.acquire, cron_time, args=[key],
+                                  bus=sensor.hardware.bus, max_jitter=max_jitter, seed=sensor.hardware.system_name)
+
+    def acquire(self, key):
+        """Coalesced acquisition job: reads all the sensors of the job back-to-back, then executes them with their values
+        The sensors needing power are powered on and read by a one-shot job once their power delay has elapsed"""
+        acquisition = self.acquisitions[key]
+        start = time()
+        readings, powered, delay = [], [], 0.0
+        for sensor in acquisition["sensors"]:
+            wait = self.power.power_on(sensor) if getattr(sensor, "pwr_ic", None) else None
+            if wait is not None:
+                powered.append(sensor)
+                delay = max(delay, wait)
+                continue
+            try:
+                readings.append((sensor, sensor.read_hardware()))
+            except Exception as err:  # a failing sensor must not prevent the reading of the others
+                self.log.add_error("Acquisition failed for {}: {}".format(sensor, err), err_code=sensor["id"], fval=-3.6)
+        if powered:
+            # no 'misfire_grace_time': even late, the job must run to power the probes off
+            executor = 'default' if self.use_asyncio else self.bus_executor(acquisition["bus"])
+            self.scheduler.add_job(self.acquire_powered, 'date', run_date=datetime.now() + timedelta(seconds=delay),
+                                   args=[key, powered], executor=executor, misfire_grace_time=None)
+        self.acquired(acquisition, readings, time() - start)
+
+    def acquire_powered(self, key, sensors):
+        """Second step of an acquisition: reads the powered sensors, powers them off and executes them with their values"""
+        acquisition = self.acquisitions[key]
+        start = time()
+        readings = []
+        for sensor in sensors:
+            try:
+                readings.append((sensor, sensor.read_hardware()))
+            except Exception as err:
+                self.log.add_error("Acquisition failed for {}: {}".format(sensor, err), err_code=sensor["id"], fval=-3.6)
+            finally:
+                self.power.power_off(sensor)
+        self.acquired(acquisition, readings, time() - start, new_run=False)
+
+    async def acquire_async(self, key):
+        """acquire() for the asyncio runtime: the sensors of the job are read concurrently, their bus serializing the accesses
+        The values are then processed on a worker thread: the database writes do not block the event loop."""
+        acquisition = self.acquisitions[key]
+        start = time()
+        results = await asyncio.gather(*[sensor.read_values_async() for sensor in acquisition["sensors"]], return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(None, self.acquired_results, acquisition, results, time() - start)
+
+    def acquired_results(self, acquisition, results, read_time):
+        """acquired() for the results of asyncio.gather: the exceptions are logged as failed acquisitions"""
+        readings = []
+        for sensor, values in zip(acquisition["sensors"], results):
+            if isinstance(values, Exception):
+                self.log.add_error("Acquisition failed for {}: {}".format(sensor, values), err_code=sensor["id"], fval=-3.6)
+            else:
+                readings.append((sensor, values))
+        self.acquired(acquisition, readings, read_time)
+
+    def acquired(self, acquisition, readings, read_time, new_run=True):
+        """Executes the sensors with their values and updates the acquisition counters"""
+        for sensor, values in readings:
+            sensor.execute(values=values)
+        acquisition["runs"] += new_run
+        acquisition["read_time"] += read_time
+        acquisition["max_read_time"] = max(acquisition["max_read_time"], read_time)
+
+    def read_now(self, sensor):
+        """Reads and logs a sensor on request from the web pages i.e. from Bottle's thread
+        asyncio runtime: the reading runs on the event loop while the web thread waits for its result"""
+        if self.use_asyncio and self.loop.is_running():
+            values = asyncio.run_coroutine_threadsafe(sensor.read_values_async(), self.loop).result(timeout=30)
+            sensor.execute(values=values)
+        else:
+            sensor.execute()
+
     def run(self):
         """Starts the APScheduler task and the Bottle HTTP server"""
         self.running = True
@@ -156,25 +339,54 @@ class Controller(object):
         signal.signal(signal.SIGUSR1, stop_handler)
 
         self.scheduler.start()
+        if self.synchro:
+            self.synchro.start()
+        for hw in self.hardwares.values():
+            if hw.stream:
+                hw.stream.start()
         self.log.add_info("Controller {} is now running.".format(__version__), fval=1.0)
         # http_view.controller = self
         try:
-            http_view.run(host=self.bottle_ip)
+            if self.use_asyncio:
+                # the Bottle server gets its own thread while the event loop runs the scheduler and the acquisitions
+                Thread(target=http_view.run, kwargs={"host": self.bottle_ip}, name="pw_http", daemon=True).start()
+                self.loop.run_forever()
+            else:
+                http_view.run(host=self.bottle_ip)
         except (KeyboardInterrupt, SystemExit):
             pass
         finally:
             self.stop()
 
     def stop(self, from_bottle=False):
+        """Stops the scheduler, powers the probes off and flushes the logs: only once, as the stop handler and
+        the end of run() both call it"""
+        if self.stopped:
+            return
+        self.stopped = True
         try:
             self.scheduler.shutdown()  # Not strictly necessary if daemonic mode is enabled but should be done if possible
         except SchedulerNotRunningError:
             pass
+        if self.use_asyncio and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.power.power_off_all(self.sensors.values())
         for hw in self.hardwares.values():
             hw.cleanup()
+        for sensor in self.sensors.values():
+            sensor.flush_log()
+        self.save_filter_states()
         self.log.add_info("Controller {} has been stopped.".format(__version__), fval=0.0)
+        self.log.stop_writer()
+        if self.synchro:
+            self.synchro.stop()
+        self.db.close_pool()
         if not from_bottle: bottle_stop()
 
+    def save_filter_states(self):
+        """Saves the state of the sensor filters in tb_filter_state: periodically and at the stop"""
+        Signal_Filter.save_states(self.db, self.sensors.values(), datetime.now(timezone.utc))
+
     # if_expression manipulation to provide conditional execution to PWO based on their 'if' string
     def make_expression(self, submitted_by, if_expression):
         """Replace the Sensor/Switch/Hardware reference to its value
@@ -229,6 +441,22 @@ class Controller(object):
         return result
 
     ### helper functions
+    def latest_value(self, cls, id):
+        """Last reading of a Sensor/Switch from its ring buffer, without database access
+        :return: (naive UTC datetime, value) or None if nothing read since the start
+        """
+        pwo = self.get_pwo(cls, id)
+        return pwo.ring.latest() if hasattr(pwo, "ring") else None
+
+    def get_window(self, cls, id, from_time, to_time=None):
+        """Readings of a Sensor/Switch over a time window: from its ring buffer if it covers the window, else from the log
+        :return: list of (naive UTC datetime, value)
+        """
+        pwo = self.get_pwo(cls, id)
+        if hasattr(pwo, "ring") and pwo.ring.covers(from_time):
+            return pwo.ring.window(from_time, to_time)
+        return self.log.get_series(pwo.__class__.__name__.upper(), pwo["id"], from_time, to_time)
+
     def get_pwo(self, cls, id):
         """return a PonicWatch Object from the controller's PWO dictionary
         :param cls: either a string as class name or an PW object
@@ -267,6 +495,27 @@ class Controller(object):
                   "sensor_id", sensor_id or '-',
                   "interrupt_id", interrupt_id or '-', sep='\t')
 
+    def get_metrics(self):
+        """Counters to tune the application: returned as JSON on the /metrics page"""
+        return {
+            "log_writer": self.log.writer.get_stats() if self.log.writer else {},
+            "db_pool": self.db.get_pool_stats(),
+            "db_wait": self.db.exclusive_access.get_stats(),
+            "log_events": self.log.get_counters(),
+            "acquisitions": {"{} on hardware {} (jitter {})".format(*key): {"sensors": len(acq["sensors"]), "runs": acq["runs"],
+                                                                "avg_read_time": acq["read_time"] / acq["runs"] if acq["runs"] else 0.0,
+                                                                "max_read_time": acq["max_read_time"]}
+                             for key, acq in self.acquisitions.items()},
+            "compression": {getattr(s, "long_name", s["name"]): s.compressor.get_stats() for s in self.sensors.values() if getattr(s, "compressor", None)},
+            "synchro": self.synchro.get_stats() if self.synchro else {},
+            "buses": {name: bus.get_stats() for name, bus in Bus.buses.items()},
+            "schedule": self.planner.get_stats(),
+            "power": self.power.get_stats(),
+            "streams": {hw["name"]: hw.stream.get_stats() for hw in self.hardwares.values() if hw.stream},
+            "filters": {getattr(s, "long_name", s["name"]): s.filter.get_stats() for s in self.sensors.values() if s.filter},
+            "value_cache": {getattr(s, "long_name", s["name"]): s.get_cache_stats() for s in self.sensors.values()},
+        }
+
     def ponicwatch_notification(self):
         """
         Regular email to inform the system manager of its status
@@ -309,6 +558,9 @@ if __name__ == "__main__":
     parser.add_argument("-l", "--list",   dest="print_list", help="List all created objects - no running -", action='store_true')
     parser.add_argument("-c", "--clean",  dest="cleandb", help="Clean database tables/logs", action='store_true', default=False)
     parser.add_argument("-n", "--notification", dest="notification", help="Sends notification email", action='store_true', default=False)
+    parser.add_argument("-V", "--verbosity", dest="verbosity", help="Optional: log verbosity by category i.e. POWER=LOG,HARDWARE=OFF", required=False, default="")
+    parser.add_argument("-k", "--cloud", dest="cloud", help="Optional: Sqlite3 database standing for the Cloud database to synchronize with", required=False, default="")
+    parser.add_argument("-a", "--asyncio", dest="use_asyncio", help="Optional: runs the scheduler on an asyncio event loop", action='store_true', default=False)
     parser.add_argument('-v', '--version', action='version', version=__version__)
     # parser.add_argument('config_file', nargs='?', default='')
     args, unk = parser.parse_known_args()
@@ -316,8 +568,11 @@ if __name__ == "__main__":
         DEBUG = args.debug
 
     if args.dbfilename:
-        db = Ponicwatch_Db("sqlite3", {'database': args.dbfilename}, args.cleandb)
-        ctrl = Controller(db, bottle_ip=args.bottle_ip, pigpio_host=args.pigpio)
+        db = Ponicwatch_Db("sqlite3", {'database': args.dbfilename}, args.cleandb, migrate=True)
+        ctrl = Controller(db, bottle_ip=args.bottle_ip, pigpio_host=args.pigpio,
+                          cloud=Cloud_Sqlite(args.cloud) if args.cloud else None,
+                          verbosity=dict(v.split('=', 1) for v in args.verbosity.split(',')) if args.verbosity else None,
+                          use_asyncio=args.use_asyncio)
         http_view.controller = ctrl
         if args.print_list:
             ctrl.print_list()
@@ -0,0 +1,108 @@
+#!/bin/python3
+"""
+    pw_archive.py: append-only archive of the tb_log records removed from the database by reduce_size or the retention policies.
+
+    One gzip segment per day (UTC) of records: 'tb_log_YYYYMMDD.ndjson.gz', one JSON list of the column values per line.
+    New records of a day are appended as a new gzip member: the segment stays one valid gzip stream.
+    The small index 'index.json' lists the segments with their number of records, time range and log types.
+    The reader streams the records of the selected segments: nothing is loaded in memory but the log_ids of one
+    segment, to skip a record archived twice if the deletion failed after its archiving.
+"""
+import os
+import gzip
+import json
+from datetime import datetime
+from threading import Lock
+
+LOG_COLUMNS = ("log_id", "controller_name", "log_type", "object_id", "system_name", "float_value", "text_value", "created_on")
+
+
+def parse_timestamp(text):
+    """'YYYY-MM-DD HH:MM:SS[.ffffff]' to a naive datetime"""
+    timestamp = datetime.strptime(text[:19], "%Y-%m-%d %H:%M:%S")
+    if len(text) > 20 and text[19] == '.':
+        timestamp = timestamp.replace(microsecond=int(text[20:26].ljust(6, '0')))
+    return timestamp
+
+
+def timestamp_text(timestamp):
+    """datetime or text to the 'YYYY-MM-DD HH:MM:SS' text compared with the archived created_on"""
+    return "{:%Y-%m-%d %H:%M:%S}".format(timestamp) if isinstance(timestamp, datetime) else timestamp
+
+
+class Log_Archive(object):
+    """Folder of daily gzip segments with their index"""
+    def __init__(self, folder):
+        self.folder = folder
+        self.index_path = os.path.join(folder, "index.json")
+        self.lock = Lock()
+        os.makedirs(folder, exist_ok=True)
+        try:
+            with open(self.index_path, "rt") as findex:
+                self.index = json.load(findex)
+        except FileNotFoundError:
+            self.index = {"columns": list(LOG_COLUMNS), "segments": {}}
+
+    def save_index(self):
+        """Write the index in a temporary file first: a crash never leaves a truncated index"""
+        with open(self.index_path + ".tmp", "wt") as findex:
+            json.dump(self.index, findex, indent=1, sort_keys=True)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def append(self, rows):
+        """Archive tb_log records given with all their columns"""
+        by_day = {}
+        for row in rows:
+            values = list(row)
+            values[-1] = str(values[-1])  # created_on
+            by_day.setdefault(values[-1][:10].replace('-', ''), []).append(values)
+        with self.lock:
+            for day, day_rows in sorted(by_day.items()):
+                segment = self.index["segments"].setdefault(day, {"file": "tb_log_{}.ndjson.gz".format(day), "nb_rows": 0,
+                                                                  "first_on": day_rows[0][-1], "last_on": day_rows[0][-1],
+                                                                  "log_types": {}})
+                with gzip.open(os.path.join(self.folder, segment["file"]), "at", encoding="utf-8") as fseg:
+                    for values in day_rows:
+                        fseg.write(json.dumps(values) + "\n")
+                        segment["log_types"][values[2]] = segment["log_types"].get(values[2], 0) + 1
+                segment["nb_rows"] += len(day_rows)
+                segment["first_on"] = min([segment["first_on"]] + [v[-1] for v in day_rows])
+                segment["last_on"] = max([segment["last_on"]] + [v[-1] for v in day_rows])
+            self.save_index()
+        return len(rows)
+
+    def read(self, log_type=None, object_id=None, from_time=None, to_time=None):
+        """Stream the archived records, in the column order of tb_log, created in [from_time, to_time[
+        created_on is returned as a naive UTC datetime
+        """
+        from_on = timestamp_text(from_time) if from_time is not None else ""
+        to_on = timestamp_text(to_time) if to_time is not None else "~"
+        with self.lock:
+            segments = [seg for day, seg in sorted(self.index["segments"].items())
+                        if seg["last_on"] >= from_on and seg["first_on"] < to_on
+                        and (log_type is None or log_type in seg["log_types"])]
+        for segment in segments:
+            seen = set()
+            with gzip.open(os.path.join(self.folder, segment["file"]), "rt", encoding="utf-8") as fseg:
+                for line in fseg:
+                    values = json.loads(line)
+                    if values[0] in seen:
+                        continue
+                    seen.add(values[0])
+                    if (log_type is None or values[2] == log_type) and (object_id is None or values[3] == object_id) \
+                            and from_on <= values[-1] < to_on:
+                        values[-1] = parse_timestamp(values[-1])
+                        yield tuple(values)
+
+    def __str__(self):
+        return "Archive of tb_log in {}".format(self.folder)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a", "--archive", dest="folder", help="Archive folder", required=True)
+    args = parser.parse_args()
+    archive = Log_Archive(args.folder)
+    for day, segment in sorted(archive.index["segments"].items()):
+        print(day, segment["nb_rows"], "records", segment["log_types"])
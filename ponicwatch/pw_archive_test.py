@@ -0,0 +1,52 @@
+#!/bin/python3
+"""
+  Test the daily gzip segments of the archived log records in a temporary folder
+  To run from the ponicwatch folder:  python -m pytest pw_archive_test.py
+"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone, timedelta
+from model.pw_db import Ponicwatch_Db
+from pw_log import Ponicwatch_Log
+from pw_retention import Log_Retention
+from pw_archive import Log_Archive
+
+
+class ctrl:
+    """Controller stand-in: Ponicwatch_Log only needs a name and a database"""
+    def __init__(self, db):
+        self.name = 'Test'
+        self.db = db
+
+
+class Archive(unittest.TestCase):
+    def test_append_read(self):
+        rows = [(1, "Test", "SENSOR", 1, "Sys", 20.5, "value", "2026-09-01 10:00:00.250000+00:00"),
+                (2, "Test", "INFO", 0, "Sys", -1.0, "message", "2026-09-01 23:59:59.000000+00:00"),
+                (3, "Test", "SENSOR", 1, "Sys", 21.5, "value", datetime(2026, 9, 2, 8, 30))]
+        with tempfile.TemporaryDirectory() as folder:
+            archive = Log_Archive(folder)
+            self.assertEqual(archive.append(rows), 3)
+            archive.append(rows[:1])  # archived twice: read once
+            self.assertEqual(sorted(archive.index["segments"]), ["20260901", "20260902"])
+            archive = Log_Archive(folder)  # index reloaded from the folder
+            self.assertEqual([(r[0], r[5], r[-1]) for r in archive.read("SENSOR", 1)],
+                             [(1, 20.5, datetime(2026, 9, 1, 10, 0, 0, 250000)), (3, 21.5, datetime(2026, 9, 2, 8, 30))])
+            self.assertEqual([r[0] for r in archive.read(from_time=datetime(2026, 9, 1, 12), to_time=datetime(2026, 9, 2, 8, 30))], [2])
+
+    def test_archived_before_deletion(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db), archive=Log_Archive(os.path.join(folder, "archive")))
+            now = datetime.now(timezone.utc)
+            log.insert_rows([("Test", "SENSOR", 1, "Sys", 1.0, "value", now - timedelta(days=10)),
+                             ("Test", "SENSOR", 1, "Sys", 2.0, "value", now - timedelta(days=1)),
+                             ("Test", "INFO", 0, "Sys", 0.0, "message", now - timedelta(days=100))])
+            self.assertEqual(Log_Retention(log, {"days": 90, "retention": [{"log_type": "SENSOR", "days": 7}]}).enforce(), 2)
+            self.assertEqual(sorted((r[2], r[5]) for r in log.archive.read()), [("INFO", 0.0), ("SENSOR", 1.0)])
+            db.close_pool()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/bin/python3
+"""
+    pw_bus.py: the hardware buses (I2C, SPI, 1-Wire, GPIO) the ICs are connected to.
+
+    Each Hardware declares its bus (init key "bus_name" or the default for its type, see hardware.bus_name).
+    The Controller gives each bus its own scheduler executor with a single thread: the jobs on a bus run one
+    after the other while the jobs on different buses run in parallel.
+    The Bus is also a re-entrant lock taken by the Hardware around each driver access: the accesses made outside
+    of the bus' executor (web pages, switch conditions reading a sensor, probes read through an ADC) are serialized too.
+"""
+import asyncio
+from threading import Lock, RLock
+from time import time, perf_counter
+
+
+class Bus(object):
+    """One hardware bus: lock serializing its accesses and usage counters"""
+    buses = {}  # name --> Bus, shared by all the Hardware on the same bus
+    registry_lock = Lock()
+
+    @classmethod
+    def get(cls, name):
+        """Returns the Bus with this name, created on first use"""
+        with cls.registry_lock:
+            if name not in cls.buses:
+                cls.buses[name] = cls(name)
+            return cls.buses[name]
+
+    def __init__(self, name):
+        self.name = name
+        self.rlock = RLock()
+        self.stats_lock = Lock()
+        self.depth = 0  # re-entrance level of the thread owning the bus
+        self.acquired_at = 0.0
+        self.started_on = time()
+        self.accesses, self.busy, self.wait, self.max_wait = 0, 0.0, 0.0, 0.0
+        self.waiting = 0  # threads currently waiting for the bus
+        # jobs of the bus' executor: submitted by the scheduler, finished (executed or in error), skipped (still running)
+        self.submitted, self.finished, self.skipped, self.max_queue = 0, 0, 0, 0
+        self._async_lock = None
+
+    @property
+    def async_lock(self):
+        """asyncio runtime: serializes the coroutines accessing the bus, created within the running event loop"""
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
+
+    def __enter__(self):
+        start = perf_counter()
+        with self.stats_lock:
+            self.waiting += 1
+        self.rlock.acquire()
+        got = perf_counter()
+        with self.stats_lock:
+            self.waiting -= 1
+        self.depth += 1
+        if self.depth == 1:
+            self.accesses += 1
+            self.wait += got - start
+            self.max_wait = max(self.max_wait, got - start)
+            self.acquired_at = got
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.depth -= 1
+        if not self.depth:
+            self.busy += perf_counter() - self.acquired_at
+        self.rlock.release()
+
+    def job_submitted(self):
+        with self.stats_lock:
+            self.submitted += 1
+            self.max_queue = max(self.max_queue, self.submitted - self.finished)
+
+    def job_finished(self):
+        with self.stats_lock:
+            self.finished += 1
+
+    def job_skipped(self):
+        with self.stats_lock:
+            self.skipped += 1
+
+    def get_stats(self):
+        """Counters for Controller.get_metrics: 'queue' is the number of jobs submitted to the executor and not yet
+        finished (the running one included), 'utilization' the fraction of the time the bus was held"""
+        elapsed = time() - self.started_on
+        return {"accesses": self.accesses,
+                "utilization": round(self.busy / elapsed, 4) if elapsed else 0.0,
+                "avg_wait": self.wait / self.accesses if self.accesses else 0.0,
+                "max_wait": self.max_wait,
+                "waiting": self.waiting,
+                "jobs": self.finished,
+                "queue": self.submitted - self.finished,
+                "max_queue": self.max_queue,
+                "skipped": self.skipped}
+
+    def __str__(self):
+        return self.name
+
+
+class No_Lock(object):
+    """Bus lock of the ICs accessed through another Hardware which locks the bus itself"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
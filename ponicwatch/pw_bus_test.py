@@ -0,0 +1,41 @@
+#!/bin/python3
+"""
+  Test the bus locks serializing the hardware accesses
+  To run from the ponicwatch folder:  python -m pytest pw_bus_test.py
+"""
+import unittest
+from threading import Thread
+from time import sleep
+from pw_bus import Bus
+
+
+class Buses(unittest.TestCase):
+    def test_reentrant(self):
+        self.assertIs(Bus.get("test_bus_shared"), Bus.get("test_bus_shared"))
+        bus = Bus("test_bus")
+        with bus:
+            with bus:  # the same thread can take the bus again
+                pass
+        self.assertEqual(bus.get_stats()["accesses"], 1)
+
+    def test_serialized(self):
+        bus, inside, overlaps = Bus("test_serialized"), [0], []
+
+        def access():
+            with bus:
+                inside[0] += 1
+                overlaps.append(inside[0])
+                sleep(0.01)
+                inside[0] -= 1
+
+        threads = [Thread(target=access) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [1, 1, 1, 1])
+        self.assertEqual(bus.get_stats()["accesses"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
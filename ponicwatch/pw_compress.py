@@ -0,0 +1,135 @@
+#!/bin/python3
+"""
+    pw_compress.py: compression of the Sensor values logged in tb_log, selected by the init key "LOG":
+    - "DEADBAND": a value is stored when it leaves the band around the last stored value.
+        The band is the largest of 'deadband' (absolute) and 'deadband_pct' (percent of the last stored value).
+    - "SWING": swinging door. A value is stored when no straight line from the last stored value can go through
+        all the following readings within the band: the reading before the one opening the door is stored.
+    - 'max_interval': heartbeat in seconds, a value is stored at least that often (both modes)
+
+    The values between two stored points are reconstructed by linear interpolation, as the charts draw them:
+    the reconstruction error of the skipped readings is measured to tune the parameters
+    (see Controller.get_metrics or run this module on a database to replay the values of an object).
+"""
+from math import sqrt, inf
+from collections import deque
+from datetime import datetime, timezone
+
+
+class Log_Compressor(object):
+    """Decide which readings of one object to store"""
+    MODES = ("DEADBAND", "SWING")
+
+    def __init__(self, init_dict):
+        self.mode = init_dict.get("LOG", "DEADBAND")
+        self.deadband = float(init_dict.get("deadband", 0.0))
+        self.deadband_pct = float(init_dict.get("deadband_pct", 0.0))
+        self.max_interval = init_dict.get("max_interval")
+        self.archived, self.last = None, None  # (seconds since epoch, value) of the last stored and last read values
+        self.slope_low, self.slope_up = -inf, inf
+        self.pending = deque(maxlen=10000)  # readings not stored since the last stored value
+        self.stats = {"readings": 0, "stored": 0, "skipped": 0, "sum_abs_error": 0.0, "sum_sq_error": 0.0, "max_abs_error": 0.0}
+
+    def tolerance(self, reference):
+        return max(self.deadband, abs(reference) * self.deadband_pct / 100.0)
+
+    def add(self, value, timestamp=None):
+        """New reading
+        :return: list of (aware UTC datetime, value) to store, possibly empty
+        """
+        t = (timestamp or datetime.now(timezone.utc)).timestamp()
+        self.stats["readings"] += 1
+        stored = []
+        if self.archived is None or (self.max_interval and t - self.archived[0] >= self.max_interval):
+            stored.append(self.store(t, value))
+        elif self.mode == "SWING":
+            if not self.door_open(t, value):
+                # the previous reading is the end of the segment and the beginning of the next one
+                stored.append(self.store(*self.last))
+                self.door_open(t, value)
+            self.pending.append((t, value))
+        elif abs(value - self.archived[1]) > self.tolerance(self.archived[1]):
+            stored.append(self.store(t, value))
+        else:
+            self.pending.append((t, value))
+        self.last = (t, value)
+        return [(datetime.fromtimestamp(on, timezone.utc), val) for on, val in stored]
+
+    def door_open(self, t, value):
+        """Narrow the doors with the new reading: False once they cross i.e. the reading cannot be on the segment"""
+        dt = t - self.archived[0]
+        if dt <= 0:
+            return True
+        band = self.tolerance(self.archived[1])
+        self.slope_up = min(self.slope_up, (value + band - self.archived[1]) / dt)
+        self.slope_low = max(self.slope_low, (value - band - self.archived[1]) / dt)
+        return self.slope_low <= self.slope_up
+
+    def store(self, t, value):
+        """Record (t, value) as stored and measure the interpolation error of the readings skipped since the previous one"""
+        if self.archived is not None:
+            t0, v0 = self.archived
+            while self.pending and self.pending[0][0] <= t:
+                on, val = self.pending.popleft()
+                if on == t:
+                    continue
+                error = abs(val - (v0 + (value - v0) * (on - t0) / (t - t0)))
+                self.stats["skipped"] += 1
+                self.stats["sum_abs_error"] += error
+                self.stats["sum_sq_error"] += error * error
+                self.stats["max_abs_error"] = max(self.stats["max_abs_error"], error)
+        self.archived = (t, value)
+        self.slope_low, self.slope_up = -inf, inf
+        self.stats["stored"] += 1
+        return t, value
+
+    def flush(self):
+        """Last reading if not yet stored, i.e. at the application stop
+        :return: list of (aware UTC datetime, value) to store
+        """
+        if self.last is None or self.last == self.archived:
+            return []
+        t, value = self.store(*self.last)
+        return [(datetime.fromtimestamp(t, timezone.utc), value)]
+
+    def get_stats(self):
+        """Reconstruction error report"""
+        stats = dict(self.stats, mode=self.mode)
+        stats["ratio"] = stats["readings"] / stats["stored"] if stats["stored"] else 0.0
+        stats["mean_abs_error"] = stats["sum_abs_error"] / stats["skipped"] if stats["skipped"] else 0.0
+        stats["rms_error"] = sqrt(stats["sum_sq_error"] / stats["skipped"]) if stats["skipped"] else 0.0
+        return stats
+
+
+if __name__ == "__main__":
+    # replay the values logged for one object to tune the compression parameters
+    import argparse
+    from datetime import timedelta
+    from model.pw_db import Ponicwatch_Db
+    from pw_log import Ponicwatch_Log
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sqlite", dest="dbfilename", help="Path of a Sqlite3 database.", required=True)
+    parser.add_argument("-t", "--type", dest="log_type", help="Log type", default="SENSOR")
+    parser.add_argument("-i", "--id", dest="object_id", help="Object id", type=int, required=True)
+    parser.add_argument("-m", "--mode", dest="mode", help="Compression mode, default: all", choices=Log_Compressor.MODES, default=None)
+    parser.add_argument("-d", "--deadband", dest="deadband", help="Absolute band", type=float, default=0.0)
+    parser.add_argument("-p", "--percent", dest="deadband_pct", help="Band in percent of the value", type=float, default=0.0)
+    parser.add_argument("-x", "--max_interval", dest="max_interval", help="Heartbeat in seconds", type=float, default=None)
+    parser.add_argument("--days", dest="days", help="Number of days to replay", type=int, default=7)
+    args = parser.parse_args()
+
+    class ctrl:
+        def __init__(self):
+            self.name = 'Compression'
+    log = Ponicwatch_Log(controller=ctrl(), db=Ponicwatch_Db("sqlite3", {'database': args.dbfilename}))
+    from_time = datetime.now(timezone.utc) - timedelta(days=args.days)
+    rows = log.get_all_records(page_len=0, where_clause="log_type=? and object_id=?", args=(args.log_type, args.object_id),
+                               order_by="created_on", columns="created_on, float_value", from_time=from_time)
+    values = [(row[0].replace(tzinfo=timezone.utc), row[1]) for row in rows]
+    for mode in [args.mode] if args.mode else Log_Compressor.MODES:
+        compressor = Log_Compressor({"LOG": mode, "deadband": args.deadband, "deadband_pct": args.deadband_pct,
+                                     "max_interval": args.max_interval})
+        for on, value in values:
+            compressor.add(value, on)
+        compressor.flush()
+        print(compressor.get_stats())
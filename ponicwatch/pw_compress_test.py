@@ -0,0 +1,41 @@
+#!/bin/python3
+"""
+  Test the deadband and swinging-door compression of the logged values
+  To run from the ponicwatch folder:  python -m pytest pw_compress_test.py
+"""
+import unittest
+from datetime import datetime, timezone, timedelta
+from pw_compress import Log_Compressor
+
+START = datetime(2026, 9, 1, tzinfo=timezone.utc)
+
+
+class Compressor(unittest.TestCase):
+    def test_deadband(self):
+        comp, stored = Log_Compressor({"LOG": "DEADBAND", "deadband": 0.5}), []
+        for s, value in enumerate((20.0, 20.1, 20.4, 21.0, 21.2, 21.3)):
+            stored += comp.add(value, START + timedelta(seconds=s))
+        self.assertEqual(stored, [(START, 20.0), (START + timedelta(seconds=3), 21.0)])
+        self.assertEqual(comp.flush(), [(START + timedelta(seconds=5), 21.3)])  # the last reading at the stop
+        self.assertEqual(comp.flush(), [])
+        stats = comp.get_stats()
+        self.assertEqual((stats["readings"], stats["stored"], stats["ratio"]), (6, 3, 2.0))
+
+    def test_swing_on_a_ramp(self):
+        comp, stored = Log_Compressor({"LOG": "SWING", "deadband": 0.1}), []
+        for s in range(10):
+            stored += comp.add(1.0 + 0.5 * s, START + timedelta(seconds=s))
+        self.assertEqual(stored, [(START, 1.0)])  # all the readings on the segment
+        stored += comp.add(0.0, START + timedelta(seconds=10))  # slope change: the previous reading ends the segment
+        self.assertEqual(stored, [(START, 1.0), (START + timedelta(seconds=9), 5.5)])
+        self.assertAlmostEqual(comp.get_stats()["max_abs_error"], 0.0)
+
+    def test_heartbeat(self):
+        comp, stored = Log_Compressor({"deadband": 10.0, "max_interval": 60}), []
+        for s in range(0, 181, 30):
+            stored += comp.add(5.0, START + timedelta(seconds=s))
+        self.assertEqual([t for t, v in stored], [START + timedelta(seconds=s) for s in (0, 60, 120, 180)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/bin/python3
+"""
+    pw_filter.py: filtering of the Sensor values between the hardware reading and the update/logging.
+
+    The init key "filter" selects the filter, as a name or a dictionary with its parameters:
+    - "EMA": exponential moving average, {"type": "EMA", "alpha": 0.2}
+    - "MEDIAN": median of the last k readings, {"type": "MEDIAN", "k": 5}
+    - "HAMPEL": outlier rejection: a reading further than t scaled MADs from the median of the last k readings
+        is replaced by that median, {"type": "HAMPEL", "k": 7, "t": 3.0, "min_mad": 0.0}
+        'min_mad' is the floor of the MAD: when the window is flat (MAD of 0) any change would be an outlier,
+        so nothing is rejected while the MAD is 0 and below a 'min_mad' of 0 (default)
+    - "KALMAN": 1-D Kalman filter of a slowly varying value, {"type": "KALMAN", "q": 0.001, "r": 0.1}
+        q: variance of the process between two readings, r: variance of the measurement noise
+    The state of a filter is one array of doubles: [number of readings, ...] then the EMA, the window of the
+    MEDIAN/HAMPEL, or the estimate and its variance for KALMAN.
+    It is saved in tb_filter_state every few minutes (Controller's 'filter_save_interval') and when the Controller stops,
+    then restored at start-up, unless the filter changed.
+"""
+import sys
+from array import array
+from statistics import median
+from model.model import Ponicwatch_Table
+
+KINDS = ("EMA", "MEDIAN", "HAMPEL", "KALMAN")
+MAD_SCALE = 1.4826  # MAD to standard deviation for a normal distribution
+
+
+class Signal_Filter(object):
+    """Filter of the values of one Sensor with its state in an array of doubles"""
+    META = {"table": "tb_filter_state",
+            "id": "sensor_id",
+            "columns": (
+                            "sensor_id",    # INTEGER PRIMARY KEY NOT NULL,
+                            "filter",       # TEXT NOT NULL,
+                            "state",        # BLOB NOT NULL,
+                            "updated_on",   # TIMESTAMP
+                        )
+            }
+
+    def __init__(self, spec):
+        """:param spec: value of the init key "filter": name of the filter or dictionary with its parameters"""
+        if not isinstance(spec, dict):
+            spec = {"type": spec}
+        self.kind = str(spec.get("type", "")).upper()
+        if self.kind not in KINDS:
+            raise ValueError("Unknown filter {}: must be one of {}".format(spec.get("type"), KINDS))
+        self.alpha = float(spec.get("alpha", 0.2))
+        self.k = max(int(spec.get("k", 7 if self.kind == "HAMPEL" else 5)), 1)
+        self.t = float(spec.get("t", 3.0))
+        self.min_mad = float(spec.get("min_mad", 0.0))
+        self.q, self.r = float(spec.get("q", 0.001)), float(spec.get("r", 0.1))
+        # the saved state is only restored for the same filter with the same parameters
+        self.signature = {"EMA": "EMA alpha={0.alpha}", "MEDIAN": "MEDIAN k={0.k}", "HAMPEL": "HAMPEL k={0.k} t={0.t}",
+                          "KALMAN": "KALMAN q={0.q} r={0.r}"}[self.kind].format(self)
+        size = {"EMA": 2, "KALMAN": 3}.get(self.kind, 1 + self.k)
+        self.state = array('d', bytes(8 * size))
+        self.rejected = 0  # HAMPEL: readings replaced by the median
+
+    def filter(self, value, update=True):
+        """
+        :param value: new reading
+        :param update: False to get the filtered value without changing the state i.e. for Sensor.value
+        :return: filtered value
+        """
+        state = self.state if update else array('d', self.state)
+        n = int(state[0])
+        if self.kind == "EMA":
+            state[1] = value if n == 0 else state[1] + self.alpha * (value - state[1])
+            result = state[1]
+        elif self.kind == "KALMAN":
+            if n == 0:
+                state[1], state[2] = value, self.r
+            else:
+                variance = state[2] + self.q
+                gain = variance / (variance + self.r)
+                state[1] += gain * (value - state[1])
+                state[2] = (1.0 - gain) * variance
+            result = state[1]
+        else:
+            state[1 + n % self.k] = value
+            window = state[1:1 + min(n + 1, self.k)]
+            result = median(window)
+            if self.kind == "HAMPEL":
+                mad = max(median(abs(v - result) for v in window), self.min_mad)
+                if mad > 0.0 and abs(value - result) > self.t * MAD_SCALE * mad:
+                    if update:
+                        self.rejected += 1
+                else:
+                    result = value
+        state[0] = n + 1
+        return result
+
+    def to_blob(self):
+        """state as little endian doubles"""
+        state = array('d', self.state)
+        if sys.byteorder == 'big':
+            state.byteswap()
+        return state.tobytes()
+
+    def restore(self, row):
+        """Reloads the state saved in tb_filter_state if it was saved by the same filter"""
+        if not row or row["filter"] != self.signature or len(row["state"]) != 8 * len(self.state):
+            return False
+        state = array('d', bytes(row["state"]))
+        if sys.byteorder == 'big':
+            state.byteswap()
+        self.state = state
+        return True
+
+    @classmethod
+    def load_states(cls, db):
+        """{sensor_id: row} of all the saved states, in one SELECT"""
+        return Ponicwatch_Table.load_all(db, cls.META)
+
+    @classmethod
+    def save_states(cls, db, sensors, updated_on):
+        """Saves the state of the filters of the given sensors in one transaction"""
+        rows = [(s["id"], s.filter.signature, s.filter.to_blob(), updated_on) for s in sensors if s.filter]
+        if rows:
+            Ponicwatch_Table(db, cls.META).execute_many(
+                "INSERT OR REPLACE INTO tb_filter_state (sensor_id, filter, state, updated_on) VALUES (?, ?, ?, ?)", rows)
+
+    def get_stats(self):
+        last = {"EMA": 1, "KALMAN": 1}.get(self.kind)
+        return {"filter": self.signature, "readings": int(self.state[0]), "rejected": self.rejected,
+                "estimate": self.state[last] if last and self.state[0] else None}
@@ -0,0 +1,70 @@
+#!/bin/python3
+"""
+  Test the signal filters of the sensors and the saving of their state on a temporary Sqlite3 file
+  To run from the ponicwatch folder:  python -m pytest pw_filter_test.py
+"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from model.pw_db import Ponicwatch_Db
+from pw_filter import Signal_Filter
+
+
+class sensor(dict):
+    """Sensor stand-in: save_states only needs its id and its filter"""
+    def __init__(self, id, spec):
+        dict.__init__(self, id=id)
+        self.filter = Signal_Filter(spec) if spec else None
+
+
+class Filters(unittest.TestCase):
+    def test_ema(self):
+        sig = Signal_Filter({"type": "EMA", "alpha": 0.5})
+        self.assertEqual([sig.filter(v) for v in (10.0, 20.0, 20.0)], [10.0, 15.0, 17.5])
+        self.assertEqual(sig.filter(30.0, update=False), 23.75)  # peek: the state is not updated
+        self.assertEqual(sig.get_stats()["readings"], 3)
+
+    def test_median(self):
+        sig = Signal_Filter({"type": "MEDIAN", "k": 3})
+        self.assertEqual([sig.filter(v) for v in (1.0, 100.0, 2.0, 3.0)], [1.0, 50.5, 2.0, 3.0])
+
+    def test_hampel(self):
+        sig = Signal_Filter({"type": "HAMPEL", "k": 5})
+        self.assertEqual([sig.filter(v) for v in (10.0, 10.2, 9.9, 10.1, 50.0)][-1], 10.1)  # the spike is replaced by the median
+        self.assertEqual(sig.rejected, 1)
+        sig = Signal_Filter("HAMPEL")
+        self.assertEqual([sig.filter(v) for v in (1.0, 1.0, 1.0, 1.0, 1.01)][-1], 1.01)  # a flat window does not reject every change
+        sig = Signal_Filter({"type": "HAMPEL", "min_mad": 0.001})
+        self.assertEqual([sig.filter(v) for v in (1.0, 1.0, 1.0, 1.0, 2.0)][-1], 1.0)
+        self.assertEqual(sig.rejected, 1)
+
+    def test_kalman(self):
+        sig = Signal_Filter("KALMAN")
+        self.assertAlmostEqual([sig.filter(v) for v in [10.0, 12.0, 8.0] * 20][-1], 10.0, delta=0.5)
+        self.assertLess(sig.state[2], 0.1)  # variance of the estimate
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            Signal_Filter("LOWPASS")
+
+    def test_states_saved_and_restored(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "filter.db")})
+            sensors = [sensor(1, {"type": "MEDIAN", "k": 3}), sensor(2, None)]
+            for value in (1.0, 5.0, 3.0):
+                sensors[0].filter.filter(value)
+            Signal_Filter.save_states(db, sensors, datetime.now(timezone.utc))
+            sensors[0].filter.filter(9.0)
+            Signal_Filter.save_states(db, sensors, datetime.now(timezone.utc))  # saved again: replaced
+            rows = Signal_Filter.load_states(db)
+            self.assertEqual(list(rows), [1])
+            restored = Signal_Filter({"type": "MEDIAN", "k": 3})
+            self.assertTrue(restored.restore(rows[1]))
+            self.assertEqual(restored.filter(4.0), sensors[0].filter.filter(4.0))
+            self.assertFalse(Signal_Filter({"type": "MEDIAN", "k": 5}).restore(rows[1]))  # another filter starts empty
+            db.close_pool()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,7 +12,117 @@
     - ERROR: log an error message, an email should be trigger to raise an alarm to an operator
 """
 from datetime import datetime, timezone, timedelta
+from time import time
+from threading import Thread, Lock
+from queue import Queue, Empty
 from model.model import Ponicwatch_Table
+from model.pw_db import log_partition_name, log_partitions, create_log_partition, create_log_view, allocate_ids
+from pw_rollup import Ponicwatch_Rollup
+from pw_series import Ponicwatch_Series, from_ms
+
+
+class Log_Writer(Thread):
+    """
+    Background thread inserting the tb_log records by batches: one transaction per batch.
+    A batch is written when it reaches 'batch_size' records or when its oldest record waited 'flush_interval' seconds.
+    The queue is bounded: when it is full, add_log blocks until the writer catches up.
+    A batch failing to be written is kept and tried again after 'retry_delay' seconds, with the records queued meanwhile:
+    only the oldest records beyond 'max_queue' are lost.
+    """
+    def __init__(self, log, batch_size=50, flush_interval=2.0, max_queue=1000, retry_delay=5.0):
+        super().__init__(name="pw_log_writer", daemon=True)
+        self.log = log
+        self.queue = Queue(maxsize=max_queue)
+        self.batch_size, self.flush_interval, self.retry_delay = batch_size, flush_interval, retry_delay
+        self.stopping = False
+        self.stats_lock = Lock()  # the counters are read by the web thread (/metrics) while the writer updates them
+        self.stats = {"flushes": 0, "rows": 0, "errors": 0, "lost": 0, "sync_writes": 0, "last_error": "",
+                      "last_batch_size": 0, "max_batch_size": 0,
+                      "last_flush_latency": 0.0, "max_flush_latency": 0.0}
+
+    def put(self, record, series_only=False):
+        self.queue.put((record, series_only))
+
+    def run(self):
+        batch, deadline, retry_on = [], None, 0.0
+        while True:
+            try:
+                record = self.queue.get(timeout=max(0.0, deadline - time()) if batch else None)
+            except Empty:
+                record = False  # time threshold reached
+            if record is None:  # sentinel sent by stop()
+                break
+            if record:
+                if not batch:
+                    deadline = time() + self.flush_interval
+                batch.append(record)  # (record, series_only)
+            if batch and (len(batch) >= self.batch_size or time() >= deadline) and time() >= retry_on:
+                if self.flush(batch):
+                    batch, retry_on = [], 0.0
+                else:
+                    self.drop_oldest(batch)
+                    retry_on = deadline = time() + self.retry_delay
+        if batch and not self.flush(batch):
+            self.drop_oldest(batch, 0)
+
+    def flush(self, batch):
+        """Write one batch in one transaction
+        :return: False if the batch could not be written: it must be kept for a new try
+        """
+        if not batch:
+            return True
+        start = time()
+        try:
+            self.log.insert_rows([r for r, series_only in batch if not series_only],
+                                 [r for r, series_only in batch if series_only])
+        except Exception as err:  # the thread must survive whatever the error: its records are kept
+            last_error = "{}: {}".format(err.__class__.__name__, err)
+            with self.stats_lock:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = last_error
+            print('*' * 30, "Log_Writer: {} records not written:".format(len(batch)), last_error)
+            return False
+        latency = time() - start
+        with self.stats_lock:
+            self.stats["flushes"] += 1
+            self.stats["rows"] += len(batch)
+            self.stats["last_batch_size"], self.stats["last_flush_latency"] = len(batch), latency
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+            self.stats["max_flush_latency"] = max(self.stats["max_flush_latency"], latency)
+        return True
+
+    def drop_oldest(self, batch, keep=None):
+        """Keep at most 'keep' records (default: the size of the queue) of a batch failing to be written"""
+        keep = self.queue.maxsize if keep is None else keep
+        if len(batch) > keep:
+            lost = len(batch) - keep
+            print('*' * 30, "Log_Writer: {} records lost".format(lost))
+            with self.stats_lock:
+                self.stats["lost"] += lost
+            del batch[:lost]
+
+    def stop(self, timeout=10.0):
+        """Write all the queued records then terminate the thread"""
+        self.stopping = True
+        self.queue.put(None)
+        self.join(timeout)
+
+    def count_sync_write(self):
+        """A record written synchronously as the thread is not running
+        :return: number of such records since the start
+        """
+        with self.stats_lock:
+            self.stats["sync_writes"] += 1
+            return self.stats["sync_writes"]
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats["alive"] = self.is_alive()
+        stats["queue_depth"] = self.queue.qsize()
+        stats["avg_batch_size"] = stats["rows"] / stats["flushes"] if stats["flushes"] else 0.0
+        return stats
+
 
 class Ponicwatch_Log(Ponicwatch_Table):
     """
@@ -32,6 +142,13 @@ class Ponicwatch_Log(Ponicwatch_Table):
         - text_value: message
 
     'created_on": timestamp when the log record has been created. A log record cannot be updated.
+
+    Storage: tb_log is a view on monthly tables tb_log_YYYYMM (UTC month of 'created_on').
+    The records are INSERTed in their partition with a log_id unique across the partitions: it is allocated from
+    tb_counter in the INSERT transaction, never given twice even by two processes or after dropping partitions.
+    Reads given a time range only select from the overlapping partitions and retention drops whole partitions.
+    The SENSOR and SWITCH values are also aggregated in tb_log_rollup in the same transaction.
+    A Sensor/Switch with "STORE": "series" in its init dictionary has its values only in tb_series (no tb_log row).
     """
     META = {"table": "tb_log",
             "id": "log_id",
@@ -47,17 +164,48 @@ class Ponicwatch_Log(Ponicwatch_Table):
                         )
             }
 
-    def __init__(self, controller, debug=False, db=None, *args, **kwargs):
+    # verbosity per category of frequent events:
+    # - LOG: one record per event
+    # - COUNT: the events are counted and one INFO record summarizes them every 'summary_interval' seconds
+    # - OFF: the events are counted only
+    VERBOSITY = {
+        "POWER": "COUNT",       # sensor powered on/off around its reading
+        "HARDWARE": "COUNT",    # hardware state after a write
+    }
+
+    def __init__(self, controller, debug=False, db=None, batch_write=False, archive=None, verbosity=None, summary_interval=3600,
+                 *args, **kwargs):
+        """
+        :param batch_write: if True, the records are queued and written by batches by a Log_Writer thread
+        :param archive: optional Log_Archive receiving the records before they are deleted
+        :param verbosity: optional, dictionary {category: LOG|COUNT|OFF} overriding Ponicwatch_Log.VERBOSITY
+        """
         super().__init__(db or controller.db, Ponicwatch_Log.META, *args, **kwargs)
         self.debug = debug
         self.controller_name = controller.name
+        self.rollup = Ponicwatch_Rollup(self.db)
+        self.series = Ponicwatch_Series(self.db)
+        with self.db.exclusive_access:
+            self.db.open()
+            try:
+                self.partitions = log_partitions(self.db.curs)
+            finally:
+                self.db.close()
+        self.archive = archive
+        self.verbosity = dict(Ponicwatch_Log.VERBOSITY, **(verbosity or {}))
+        self.summary_interval, self.summary_on = summary_interval, time()
+        self.counters, self.counters_lock = {}, Lock()
+        self.writer = None
+        if batch_write:
+            self.writer = Log_Writer(self)
+            self.writer.start()
 
     @staticmethod
     def json_exception(o):
         if isinstance(o, datetime):
             return o.isoformat()
 
-    def add_log(self, log_type=None, system_name="", param=None):
+    def add_log(self, log_type=None, system_name="", param=None, value=None, created_on=None, category=None):
         """
         Add an entry in tb_log.
         :param log_type: optional, given for the message type (info, warning, error) else the param type will be used to find it
@@ -65,32 +213,206 @@ class Ponicwatch_Log(Ponicwatch_Table):
         :param param:
             - message: a dictionary for { 'error_code', 'float_value', 'text_value' }
             - switch/sensor: object itself to get its values as a JSON string
+        :param value: optional, switch/sensor value to log instead of its current value i.e. an earlier reading
+        :param created_on: optional, timestamp of that earlier reading
+        :param category: optional, the entry is an event of this category, logged following its verbosity
         :return: log_id if INSERT is successful or None
         """
+        if category is not None and self.suppressed(category, "{} value: {}".format(system_name, param.get("value"))):
+            return
         # MESSAGE:
         # log_type is mandatory to know the message level (info/warning/error)
         # param is a dictionary
         if log_type in ["INFO", "WARNING", "ERROR", "SCHEDULER"]:
-            self.insert(controller_name=self.controller_name,
-                        log_type=log_type,
-                        object_id=param["error_code"],
-                        system_name=system_name,
-                        float_value=param.get("float_value", -1.0),
-                        text_value=param["text_value"],
-                        created_on=datetime.now(timezone.utc)
-                        )
+            self.write((self.controller_name,
+                        log_type,
+                        param["error_code"],
+                        system_name,
+                        param.get("float_value", -1.0),
+                        param["text_value"],
+                        datetime.now(timezone.utc)
+                        ))
             self.print_debug(log_type, param["error_code"], param.get("float_value", -1.0), param["text_value"])
         else:
             log_type = param.get("cls_name", param.__class__.__name__.upper())
-            self.insert(controller_name=self.controller_name,
-                        log_type=log_type,
-                        object_id=param["id"],
-                        system_name=system_name,
-                        float_value=float(param["value"]),
-                        text_value="{} value: {}".format(str(param), param["value"]),
-                        created_on=datetime.now(timezone.utc)
-                        )
-            self.print_debug(log_type, param["value"], "\n", param)
+            series_only = getattr(param, "init_dict", {}).get("STORE") == "series"
+            if value is None:
+                value = param["value"]
+            self.write((self.controller_name,
+                        log_type,
+                        param["id"],
+                        system_name,
+                        float(value),
+                        None if series_only else "{} value: {}".format(str(param), value),
+                        created_on or datetime.now(timezone.utc)
+                        ), series_only)
+            self.print_debug(log_type, value, "\n", param)
+
+    def write(self, record, series_only=False):
+        """Queue the record for the Log_Writer if it runs, else INSERT it now
+        :param record: tuple of values for all the columns except log_id
+        :param series_only: the value is only stored in tb_series
+        """
+        if self.writer and self.writer.is_alive():
+            self.writer.put(record, series_only)
+            return
+        if self.writer and not self.writer.stopping:  # the writer thread died: the records are written synchronously
+            if self.writer.count_sync_write() == 1:
+                self.add_warning("Log_Writer is not running: the records are written synchronously", fval=-1.0)
+        if series_only:
+            self.insert_rows([], [record])
+        else:
+            self.insert_rows([record])
+
+    def insert_rows(self, rows, series_rows=()):
+        """INSERT many records in their partitions in one transaction
+        :param rows: tuples of values for all the columns except log_id
+        :param series_rows: same tuples but only stored in tb_log_rollup and tb_series
+        """
+        by_partition = {}
+        for row in rows:
+            by_partition.setdefault(log_partition_name(row[-1]), []).append(row)
+        sql = "INSERT INTO {0} ({1}) VALUES ({2})".format("{}", ",".join(self.columns), ",".join("?" * len(self.columns)))
+        with self.db.exclusive_access:
+            self.db.open()
+            try:
+                first_id = allocate_ids(self.db.curs, "log_id", len(rows)) if rows else 0
+                for partition, part_rows in sorted(by_partition.items()):
+                    if partition not in self.partitions:
+                        self.add_partition(partition)
+                    self.db.curs.executemany(sql.format(partition),
+                                             [(first_id + i,) + tuple(row) for i, row in enumerate(part_rows)])
+                    first_id += len(part_rows)
+                self.rollup.add_rows(self.db.curs, list(rows) + list(series_rows))
+                if series_rows:
+                    self.series.add_rows(self.db.curs, series_rows)
+                self.db.conn.commit()
+            except Exception:
+                self.db.conn.rollback()
+                self.series.chunks = None  # rolled back: the chunks being filled are reloaded from tb_series_open
+                raise
+            finally:
+                self.db.close()
+        return len(rows)
+
+    def add_partition(self, partition):
+        """Create a new partition and add it to the view tb_log - must be called with the exclusive access"""
+        create_log_partition(self.db.curs, partition)
+        self.partitions = sorted(self.partitions + [partition])
+        create_log_view(self.db.curs, self.partitions)
+
+    def insert(self, **kwargs):
+        """INSERT one record in its partition: 'log_id' is ignored"""
+        self.insert_rows([tuple(kwargs.get(col) for col in self.columns[1:])])
+
+    def partitions_between(self, from_time=None, to_time=None):
+        """Sorted list of the partitions holding the records created between from_time and to_time (both optional)"""
+        first = log_partition_name(from_time) if from_time is not None else ""
+        last = log_partition_name(to_time) if to_time is not None else "~"
+        return [p for p in self.partitions if first <= p <= last]
+
+    def source(self, from_time=None, to_time=None):
+        """Table or sub-query to select the records created between from_time and to_time (both optional)
+        Only the partitions overlapping the time range are used.
+        """
+        if from_time is None and to_time is None:
+            return self.table
+        partitions = self.partitions_between(from_time, to_time)
+        if not partitions:
+            return self.table
+        elif len(partitions) == 1:
+            return partitions[0]
+        return "(" + " UNION ALL ".join("SELECT * FROM " + p for p in partitions) + ")"
+
+    def get_all_records(self, page_len=20, from_page=0, where_clause=None, order_by=None, args=[], columns='*',
+                        from_time=None, to_time=None):
+        """Same as Ponicwatch_Table.get_all_records restricted to the records created in [from_time, to_time["""
+        where, args = [where_clause] if where_clause else [], list(args)
+        if from_time is not None:
+            where.append("created_on >= ?")
+            args.append(from_time)
+        if to_time is not None:
+            where.append("created_on < ?")
+            args.append(to_time)
+        return super().get_all_records(page_len, from_page, " and ".join(where) or None, order_by, args, columns,
+                                       table=self.source(from_time, to_time))
+
+    def get_page(self, page_len=20, before=None, after=None, log_type=None, object_id=None, from_time=None, to_time=None):
+        """One page of records, newest first, by keyset pagination on (created_on, log_id): the cost does not depend on the page depth
+        :param before: cursor (created_on, log_id) of the oldest row of the current page to get the older records
+        :param after: cursor of the newest row of the current page to get the newer records. Empty tuple for the oldest page.
+        Without any cursor, the newest page is returned.
+        :return: records with the cursor's created_on, as stored, as an additional last column
+        """
+        where, args = [], []
+        if log_type:
+            where.append("log_type=?")
+            args.append(log_type)
+        if object_id is not None:
+            where.append("object_id=?")
+            args.append(object_id)
+        if from_time is not None:
+            where.append("created_on >= ?")
+            args.append(from_time)
+        if to_time is not None:
+            where.append("created_on < ?")
+            args.append(to_time)
+        partitions = self.partitions_between(from_time, to_time)
+        if after is not None:
+            if after:
+                where.append("created_on >= ? and (created_on > ? or log_id > ?)")  # range on the index, no sort
+                args += [after[0], after[0], after[1]]
+                partitions = [p for p in partitions if p >= log_partition_name(after[0])]
+            order_by = "created_on, log_id"
+        else:
+            if before:
+                where.append("created_on <= ? and (created_on < ? or log_id < ?)")
+                args += [before[0], before[0], before[1]]
+                partitions = [p for p in partitions if p <= log_partition_name(before[0])]
+            order_by = "created_on desc, log_id desc"
+            partitions.reverse()
+        # the partitions are read in the page order until the page is full
+        rows = []
+        for partition in partitions:
+            rows += self.fetch("SELECT *, CAST(created_on AS TEXT) FROM {} {} ORDER BY {} LIMIT ?".format(
+                                   partition, "WHERE " + " and ".join(where) if where else "", order_by),
+                               args + [page_len - len(rows)])
+            if len(rows) >= page_len:
+                break
+        if after is not None:
+            rows.reverse()
+        return rows
+
+    def get_series(self, log_type, object_id, from_time, to_time=None, min_points=100):
+        """Values of one object over a time window: from tb_log_rollup at the coarsest resolution giving
+        at least 'min_points' values, else from the tb_log records
+        :return: list of (timestamp, value)
+        """
+        resolution = self.rollup.best_resolution(from_time, to_time, min_points)
+        if resolution:
+            return self.rollup.get_series(resolution, log_type, object_id, from_time, to_time)
+        on, vals = self.series.read(log_type, object_id, from_time, to_time)
+        if len(on):
+            return [(from_ms(t), float(v)) for t, v in zip(on, vals)]
+        rows = self.get_all_records(page_len=0, where_clause="log_type=? and object_id=?", args=(log_type, object_id),
+                                    order_by="created_on", columns="created_on, float_value", from_time=from_time, to_time=to_time)
+        archived = self.archive.read(log_type, object_id, from_time, to_time) if self.archive else []
+        return [(row[-1], row[5]) for row in archived] + [(row[0], row[1]) for row in rows]
+
+    def last_record(self, where_clause, args=(), columns="*"):
+        """Most recent record matching the where clause: the partitions are searched from the newest one"""
+        for partition in reversed(self.partitions):
+            row = self.fetch("SELECT {} FROM {} WHERE {} ORDER BY created_on DESC LIMIT 1".format(columns, partition, where_clause),
+                             args, only_one=True)
+            if row:
+                return row
+        return None
+
+    def stop_writer(self):
+        """Drain the queue of the Log_Writer: following add_log are written immediately"""
+        self.summarize()
+        if self.writer:
+            self.writer.stop()
 
 
     def print_debug(self, msg, id, name, value=""):
@@ -99,8 +421,47 @@ class Ponicwatch_Log(Ponicwatch_Table):
             if msg.startswith("ERROR"): msg = "** %s *" % msg
             print("{0:15} {1:10} {2:3} {3} {4}".format(datetime.now().strftime("%H:%M:%S.%f"), msg, id, name, value))
 
-    def add_info(self, msg, err_code=0, fval=0.0):
-        """Helper function for the controller to log an INFO message"""
+    def suppressed(self, category, text=""):
+        """Count an event of the category
+        :return: True if the event must not be logged individually
+        """
+        if category is None:
+            return False
+        with self.counters_lock:
+            counter = self.counters.setdefault(category, {"events": 0, "pending": 0, "last": ""})
+            counter["events"] += 1
+            counter["last"] = text
+            level = self.verbosity.get(category, "LOG")
+            if level == "COUNT":
+                counter["pending"] += 1
+        if time() - self.summary_on >= self.summary_interval:
+            self.summarize()
+        return level != "LOG"
+
+    def summarize(self):
+        """One INFO record per category with events counted since the previous summary"""
+        with self.counters_lock:
+            since, self.summary_on = self.summary_on, time()
+            pending = [(category, counter["pending"], counter["last"]) for category, counter in sorted(self.counters.items())
+                       if counter["pending"]]
+            for counter in self.counters.values():
+                counter["pending"] = 0
+        for category, nb_events, last in pending:
+            self.add_info("{}: {} events since {:%Y-%m-%d %H:%M:%S}, last: {}".format(category, nb_events, datetime.fromtimestamp(since), last),
+                          fval=float(nb_events))
+
+    def get_counters(self):
+        """Events counted by category since the start, with their verbosity"""
+        with self.counters_lock:
+            return {category: dict(self.counters.get(category, {"events": 0, "pending": 0, "last": ""}), verbosity=level)
+                    for category, level in sorted(self.verbosity.items())}
+
+    def add_info(self, msg, err_code=0, fval=0.0, category=None):
+        """Helper function for the controller to log an INFO message
+        :param category: optional, the message is an event of this category, logged following its verbosity
+        """
+        if self.suppressed(category, msg):
+            return
         self.add_log("INFO", self.controller_name, {'error_code': err_code, 'float_value': fval, 'text_value': msg})
     def add_warning(self, msg, err_code=0, fval=0.0):
         """Helper function for the controller to log a WARNING message"""
@@ -110,10 +471,48 @@ class Ponicwatch_Log(Ponicwatch_Table):
         self.add_log("ERROR", self.controller_name, {'error_code': err_code, 'float_value': fval, 'text_value': msg})
 
     def reduce_size(self, keep_days=90):
-        """Delete all records above the number of days given as parameters"""
-        keep_from = datetime.now() - timedelta(days=keep_days)
-        nb_rows = self.execute_sql("delete from tb_log where created_on < ?", ("{:%Y-%m-%d}".format(keep_from), ))
-        self.execute_sql("vacuum")
+        """Drop the partitions holding only records older than the number of days given as parameters
+        The records are kept by whole months: up to one month more than 'keep_days' can be kept.
+        :return: number of records dropped
+        """
+        keep_from = log_partition_name(datetime.now(timezone.utc) - timedelta(days=keep_days))
+        to_drop = [p for p in self.partitions[:-1] if p < keep_from]
+        if self.archive:
+            for partition in to_drop:
+                self.archive_partition(partition)
+        nb_rows = self.drop_partitions(to_drop)
+        self.series.reduce_size(keep_days)
+        return nb_rows
+
+    def archive_partition(self, partition, batch_size=5000):
+        """Copy all the records of a partition to the archive, by batches"""
+        last_id = 0
+        while True:
+            rows = self.fetch("SELECT * FROM {} WHERE log_id > ? ORDER BY log_id LIMIT ?".format(partition), (last_id, batch_size))
+            if not rows:
+                break
+            self.archive.append(rows)
+            last_id = rows[-1][0]
+
+    def drop_partitions(self, to_drop):
+        """Drop the given partitions, never the newest one, and recreate the view tb_log
+        :return: number of records dropped
+        """
+        nb_rows = 0
+        with self.db.exclusive_access:
+            self.db.open()
+            try:
+                to_drop = [p for p in to_drop if p in self.partitions[:-1]]
+                if to_drop:
+                    for partition in to_drop:
+                        self.db.curs.execute("select count(*) from " + partition)
+                        nb_rows += self.db.curs.fetchone()[0]
+                        self.db.curs.execute("drop table " + partition)
+                    self.partitions = [p for p in self.partitions if p not in to_drop]
+                    create_log_view(self.db.curs, self.partitions)
+                    self.db.conn.commit()
+            finally:
+                self.db.close()
         return nb_rows
 
     def __str__(self):
@@ -0,0 +1,143 @@
+#!/bin/python3
+"""
+  Test Ponicwatch_Log on temporary Sqlite3 files
+  To run from the ponicwatch folder:  python -m pytest pw_log_test.py
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from time import sleep
+from datetime import datetime, timezone
+from model.pw_db import Ponicwatch_Db
+from pw_log import Ponicwatch_Log, Log_Writer
+
+
+class ctrl:
+    """Controller stand-in: Ponicwatch_Log only needs a name and a database"""
+    def __init__(self, db):
+        self.name = 'Test'
+        self.db = db
+
+
+class Log_Ids(unittest.TestCase):
+    def test_ids_continue_across_partitions(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db))
+            log.insert_rows([("Test", "SENSOR", 1, "Sys", 1.0, "value", datetime(2026, 7, 31, 23, 59, tzinfo=timezone.utc)),
+                             ("Test", "SENSOR", 1, "Sys", 2.0, "value", datetime(2026, 8, 1, 0, 0, tzinfo=timezone.utc)),
+                             ("Test", "SENSOR", 1, "Sys", 3.0, "value", datetime(2026, 7, 1, tzinfo=timezone.utc))])
+            self.assertIn("tb_log_202607", log.partitions)
+            self.assertIn("tb_log_202608", log.partitions)
+            self.assertEqual(sorted(r[0] for r in log.fetch("SELECT log_id FROM tb_log")), [1, 2, 3])
+            # the ids of a dropped partition are never given again
+            log.insert_rows([("Test", "SENSOR", 1, "Sys", 4.0, "value", datetime(2026, 9, 1, tzinfo=timezone.utc))])
+            log.drop_partitions(["tb_log_202607", "tb_log_202608"])
+            log.insert_rows([("Test", "SENSOR", 1, "Sys", 5.0, "value", datetime(2026, 9, 2, tzinfo=timezone.utc))])
+            self.assertEqual([r[0] for r in log.fetch("SELECT log_id FROM tb_log ORDER BY log_id")], [4, 5])
+            db.close_pool()
+
+    def test_ids_unique_across_processes(self):
+        with tempfile.TemporaryDirectory() as folder:
+            dbs = [Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")}) for _ in range(2)]
+            logs = [Ponicwatch_Log(ctrl(db)) for db in dbs]
+            for i in range(10):
+                logs[i % 2].insert_rows([("Test", "SENSOR", 1, "Sys", float(i), "value", datetime.now(timezone.utc))] * 3)
+            self.assertEqual(sorted(r[0] for r in logs[0].fetch("SELECT log_id FROM tb_log")), list(range(1, 31)))
+            for db in dbs:
+                db.close_pool()
+
+    def test_migrated_baseline(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = os.path.join(folder, "baseline.db")
+            Ponicwatch_Db.create_tables(None, db_path)
+            with sqlite3.connect(db_path) as conn:
+                conn.executemany("INSERT INTO tb_log VALUES (?, 'Test', 'SENSOR', 4, 'Sys', 20.0, 'value', ?)",
+                                 [(1, "2026-08-30 23:59:00.000000"), (2, "2026-09-01 00:01:00.000000"), (7, "2026-09-02 12:00:00.000000")])
+            db = Ponicwatch_Db("sqlite3", {'database': db_path}, migrate=True)
+            log = Ponicwatch_Log(ctrl(db))
+            self.assertIn("tb_log_202608", log.partitions)
+            self.assertIn("tb_log_202609", log.partitions)
+            self.assertEqual([r[0] for r in log.fetch("SELECT log_id FROM tb_log ORDER BY log_id")], [1, 2, 7])
+            log.add_info("after migration")  # the counter starts after the greatest log_id
+            self.assertEqual(log.last_record("log_type='INFO'", columns="log_id")[0], 8)
+            db.close_pool()
+
+
+class Pages(unittest.TestCase):
+    def test_keyset_pages(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db))
+            # log_id 1 to 5 over two partitions, 2 and 3 at the same time, object 2 for log_id 4
+            for month, day, object_id in ((8, 31, 1), (9, 1, 1), (9, 1, 1), (9, 2, 2), (9, 3, 1)):
+                log.insert_rows([("Test", "SENSOR", object_id, "Sys", 1.0, "value", datetime(2026, month, day, 0, 0, 0, 1000, tzinfo=timezone.utc))])
+            pages, page = [], log.get_page(page_len=2)
+            while page:
+                pages.append([row[0] for row in page])
+                page = log.get_page(page_len=2, before=(page[-1][-1], page[-1][0]))
+            self.assertEqual(pages, [[5, 4], [3, 2], [1]])
+            pages, page = [], log.get_page(page_len=2, after=())
+            while page:
+                pages.append([row[0] for row in page])
+                page = log.get_page(page_len=2, after=(page[0][-1], page[0][0]))
+            self.assertEqual(pages, [[2, 1], [4, 3], [5]])
+            page = log.get_page(page_len=10, from_time=datetime(2026, 9, 1, tzinfo=timezone.utc), to_time=datetime(2026, 9, 3, tzinfo=timezone.utc))
+            self.assertEqual([row[0] for row in page], [4, 3, 2])
+            self.assertEqual([row[0] for row in log.get_page(log_type="SENSOR", object_id=2)], [4])
+            self.assertEqual(log.get_page(log_type="INFO"), [])
+            db.close_pool()
+
+
+class Writer(unittest.TestCase):
+    def test_batches(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db))
+            log.writer = Log_Writer(log, batch_size=3, flush_interval=0.1)
+            log.writer.start()
+            for i in range(7):
+                log.add_info("batch {}".format(i))
+            log.stop_writer()
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_log", only_one=True)[0], 7)
+            stats = log.writer.get_stats()
+            self.assertEqual((stats["rows"], stats["max_batch_size"], stats["alive"]), (7, 3, False))
+            db.close_pool()
+
+    def test_failed_batch_kept(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db))
+            insert_rows, failures = log.insert_rows, [RuntimeError("database is locked")]
+
+            def failing_insert(rows, series_rows=()):
+                if failures:
+                    raise failures.pop()
+                return insert_rows(rows, series_rows)
+
+            log.insert_rows = failing_insert
+            log.writer = Log_Writer(log, batch_size=1, flush_interval=0.01, retry_delay=0.1)
+            log.writer.start()
+            log.add_info("kept")
+            sleep(0.3)
+            stats = log.writer.get_stats()
+            self.assertTrue(stats["alive"])
+            self.assertEqual((stats["errors"], stats["rows"], stats["lost"]), (1, 1, 0))
+            self.assertEqual(log.last_record("log_type='INFO'", columns="text_value")[0], "kept")
+            log.stop_writer()
+            db.close_pool()
+
+    def test_dead_writer(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db))
+            log.writer = Log_Writer(log)  # never started: the records are written synchronously
+            log.add_info("synchronous")
+            self.assertEqual(log.writer.get_stats()["sync_writes"], 2)  # the record and the warning
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_log WHERE log_type='WARNING'", only_one=True)[0], 1)
+            db.close_pool()
+
+
+if __name__ == "__main__":
+    unittest.main()
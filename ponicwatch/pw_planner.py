@@ -0,0 +1,108 @@
+#!/bin/python3
+"""
+    pw_planner.py: spreads the cron jobs over the seconds of the minute.
+
+    Most timers fire at the second 0 ('0 */5 * * * *') or on multiples of 5 seconds ('*/5 * * * * *'):
+    all the sensors and switches would access their buses and the database in the same second.
+    An object accepting to be delayed declares it with the init key "max_jitter" (seconds, default 0):
+    its job is shifted by up to 'max_jitter' seconds, within the same minute, to the least loaded seconds.
+    The offsets are deterministic: same database, same plan. Ties between offsets are broken by a hash of the
+    object's name, not by random.
+    A firing is never delayed up to the next one of the same job: the shift is limited by the shortest gap between
+    its seconds. A job firing every minute may be shifted past the second 59, to the beginning of the next minute.
+    Limits: the load is a profile of one minute. A job of the minute field i.e. '0 */5 * * * *' weighs the fraction
+    of the minutes it runs (1/5), the hour and day fields are not modelled: a job running a few hours per day
+    weighs as if it ran all day.
+"""
+import re
+from zlib import crc32
+
+FIELD_RE = re.compile(r"^(\*|\d+)(?:-(\d+))?(?:/(\d+))?$")
+
+
+class Job_Planner(object):
+    """Chooses the seconds field of the cron jobs and keeps the load profile: number of jobs firing on each second"""
+    def __init__(self):
+        self.load = [0.0] * 60
+        self.jobs, self.shifted = 0, 0
+
+    @staticmethod
+    def seconds_of(field):
+        """
+        :param field: seconds field of a cron time i.e. '0', '*/5', '10-40/10', '0,30'
+        :return: sorted list of the seconds matched by the field, None if the syntax is not supported
+        """
+        seconds = set()
+        for part in field.split(','):
+            match = FIELD_RE.match(part)
+            if not match:
+                return None
+            first, last, step = match.groups()
+            if first == '*':
+                first, last = 0, 59
+            else:
+                first = int(first)
+                last = int(last) if last else (59 if step else first)
+            seconds.update(range(first, min(last, 59) + 1, int(step or 1)))
+        return sorted(seconds)
+
+    @staticmethod
+    def field_of(seconds):
+        """Opposite of seconds_of: 'N', 'first-last/step' or a list"""
+        if len(seconds) == 1:
+            return str(seconds[0])
+        step = seconds[1] - seconds[0]
+        if all(b - a == step for a, b in zip(seconds, seconds[1:])):
+            return "{}-{}/{}".format(seconds[0], seconds[-1], step)
+        return ",".join(str(s) for s in seconds)
+
+    def plan(self, field, max_jitter=0, seed="", minute="*", every_minute=False):
+        """
+        Shifts the seconds field of a job by 0 to 'max_jitter' seconds to the least loaded seconds
+        :param field: seconds field of the cron time
+        :param max_jitter: maximum delay accepted by the job, in seconds
+        :param seed: name of the object, to break the ties
+        :param minute: minute field of the cron time: weight of the job in the load profile
+        :param every_minute: True if the job runs every minute (all the other fields are '*'): its seconds may wrap
+        :return: the seconds field to schedule the job with
+        """
+        seconds = self.seconds_of(field)
+        if seconds is None:
+            return field
+        minutes = self.seconds_of(minute)
+        weight = len(minutes) / 60.0 if minutes else 1.0
+        # gap of each second to the next firing of the job: in the next minute or, if not every minute, later
+        gaps = [b - a for a, b in zip(seconds, seconds[1:] + [seconds[0] + 60 if every_minute else 60])]
+        max_shift = max(0, min(int(max_jitter), min(gaps) - 1))
+        if max_shift:
+            start = crc32(seed.encode()) % (max_shift + 1)
+            # least loaded on its busiest second, then on all its seconds, then the object's preferred offset
+            shift = min(range(max_shift + 1),
+                        key=lambda d: (max(self.load[(s + d) % 60] for s in seconds),
+                                       sum(self.load[(s + d) % 60] for s in seconds),
+                                       (d - start) % (max_shift + 1)))
+        else:
+            shift = 0
+        for s in seconds:
+            self.load[(s + shift) % 60] += weight
+        self.jobs += 1
+        if shift:
+            self.shifted += 1
+            field = self.field_of(sorted((s + shift) % 60 for s in seconds))
+        return field
+
+    def get_stats(self):
+        """Load profile for Controller.get_metrics"""
+        return {"jobs": self.jobs, "shifted": self.shifted, "peak": round(max(self.load), 3),
+                "load_profile": [round(load, 3) for load in self.load]}
+
+
+if __name__ == "__main__":
+    # 40 objects on '0 */5 * * * *' and 10 on '*/5 * * * * *' accepting up to 30 seconds / 4 seconds of delay
+    planner = Job_Planner()
+    for i in range(40):
+        planner.plan("0", 30, "Sensor {}".format(i), minute="*/5")
+    for i in range(10):
+        print(planner.plan("*/5", 4, "Switch {}".format(i), every_minute=True), end="  ")
+    print()
+    print(planner.get_stats())
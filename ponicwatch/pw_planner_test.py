@@ -0,0 +1,54 @@
+#!/bin/python3
+"""
+  Test the staggering of the cron jobs over the seconds of the minute
+  To run from the ponicwatch folder:  python -m pytest pw_planner_test.py
+"""
+import unittest
+from pw_planner import Job_Planner
+
+
+class Planner(unittest.TestCase):
+    def test_fields(self):
+        self.assertEqual(Job_Planner.seconds_of("0"), [0])
+        self.assertEqual(Job_Planner.seconds_of("*/15"), [0, 15, 30, 45])
+        self.assertEqual(Job_Planner.seconds_of("10-40/10"), [10, 20, 30, 40])
+        self.assertEqual(Job_Planner.seconds_of("0,30"), [0, 30])
+        self.assertIsNone(Job_Planner.seconds_of("L"))
+        self.assertEqual(Job_Planner.field_of([10, 20, 30, 40]), "10-40/10")
+        self.assertEqual(Job_Planner.field_of([1, 2, 7]), "1,2,7")
+
+    def test_plan(self):
+        planner = Job_Planner()
+        fields = [planner.plan("0", 2, "Sensor {}".format(i)) for i in range(3)]
+        self.assertEqual(sorted(fields), ["0", "1", "2"])
+        self.assertEqual(planner.plan("0"), "0")  # no jitter accepted
+        self.assertIn(planner.plan("*/5", 4, "Switch", every_minute=True), ("3-58/5", "4-59/5"))  # the seconds 0 to 2 are already used
+        stats = planner.get_stats()
+        self.assertEqual((stats["jobs"], stats["shifted"], stats["peak"]), (5, 3, 2))
+        # deterministic
+        other = Job_Planner()
+        self.assertEqual([other.plan("0", 2, "Sensor {}".format(i)) for i in range(3)], fields)
+
+    def test_minute_weight(self):
+        planner = Job_Planner()
+        planner.plan("0", minute="*/5")  # runs one minute out of five
+        planner.plan("0", minute="0,30")
+        self.assertEqual(planner.get_stats()["peak"], 0.233)
+
+    def test_never_up_to_the_next_firing(self):
+        planner = Job_Planner()
+        planner.load = [0.0 if s in (25, 45) else 1.0 for s in range(60)]  # free 25 seconds later only
+        seconds = Job_Planner.seconds_of(planner.plan("0,20", 30, "Pump"))
+        self.assertLessEqual(seconds[0], 19)  # before the second 20 of its next firing
+        self.assertEqual(seconds[1] - seconds[0], 20)
+
+    def test_wrap_every_minute(self):
+        planner = Job_Planner()
+        for s in range(50, 60):
+            planner.plan(str(s))
+        self.assertIn(int(planner.plan("55", 10, "Hourly")), range(55, 60))  # stays within the minute
+        self.assertLess(int(planner.plan("55", 10, "Every minute", every_minute=True)), 5)  # to the next minute
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/bin/python3
+"""
+    pw_power.py: power sequencing of the probes powered on only for their reading.
+
+    A Sensor with { "POWER": "RPI3.14", "power_delay": 1.5 } (or "power_hid"/"power_pin") is powered on, read once
+    its 'power_delay' seconds have elapsed, then powered off. The Controller's acquisition job does not wait:
+    it powers the probes on and schedules a one-shot job reading them after the delay.
+    The probes sharing a power pin are powered once per cycle: the pin counts its users and is powered off
+    by the last one. A probe joining a pin already powered only waits for what remains of its delay.
+    The lock of the sequencer only protects the counters: the pins are written and the events logged once it is
+    released, in the order decided under the lock (a ticket per operation on a pin).
+"""
+from threading import Lock, Condition, Event
+from time import time
+
+
+class Power_Sequencer(object):
+    """Power pins shared by the probes: (hardware id, pin) --> [number of users, powered on at, Event set once powered]"""
+    def __init__(self, wait_power=5.0):
+        """:param wait_power: seconds a probe joining a pin waits for the probe powering it"""
+        self.lock = Lock()
+        self.powered = {}
+        self.pins = {}  # (hardware id, pin) --> {"next": next ticket, "done": tickets done, "cond": Condition}
+        self.wait_power = wait_power
+        self.cycles, self.shared, self.failed = 0, 0, 0
+
+    def ticket(self, key):
+        """Order of a new hardware operation on a pin - must be called with the lock"""
+        pin = self.pins.setdefault(key, {"next": 0, "done": 0, "cond": Condition()})
+        pin["next"] += 1
+        return pin, pin["next"] - 1
+
+    @staticmethod
+    def in_order(pin, ticket, operation):
+        """Executes the operation once the operations with a previous ticket on the same pin are done"""
+        with pin["cond"]:
+            pin["cond"].wait_for(lambda: pin["done"] == ticket)
+        try:
+            return operation()
+        finally:
+            with pin["cond"]:
+                pin["done"] += 1
+                pin["cond"].notify_all()
+
+    def power_on(self, sensor):
+        """
+        Powers the sensor on, unless its pin is already powered
+        :return: seconds still to wait before the reading, None if the power could not be set
+        """
+        key = sensor.power_key
+        with self.lock:
+            entry = self.powered.get(key)
+            if entry is not None:
+                entry[0] += 1
+                self.shared += 1
+                first = None
+            else:
+                entry = self.powered[key] = [1, None, Event()]
+                first = self.ticket(key)
+        if first:
+            powered = False
+            try:
+                powered = self.in_order(first[0], first[1], sensor.power_on)
+            finally:
+                with self.lock:
+                    if powered:
+                        entry[1] = time()
+                        self.cycles += 1
+                    else:
+                        self.failed += 1
+                        if self.powered.get(key) is entry:
+                            del self.powered[key]
+                entry[2].set()
+        else:
+            entry[2].wait(self.wait_power)
+        if entry[1] is None:  # the probe powering the pin failed: the probes joining it are read without power
+            return None
+        return max(0.0, entry[1] + sensor.power_delay - time())
+
+    def power_off(self, sensor):
+        """Releases the power pin of the sensor: powered off when its last user is done"""
+        key = sensor.power_key
+        with self.lock:
+            entry = self.powered.get(key)
+            if entry is None:
+                return
+            entry[0] -= 1
+            if entry[0] > 0:
+                return
+            del self.powered[key]
+            pin, ticket = self.ticket(key)
+        self.in_order(pin, ticket, sensor.power_off)
+
+    def power_off_all(self, sensors):
+        """Controller stop: no probe must stay powered because its reading was still pending"""
+        with self.lock:
+            to_power_off = [(sensor, self.ticket(sensor.power_key)) for sensor in sensors
+                            if getattr(sensor, "pwr_ic", None) and self.powered.pop(sensor.power_key, None)]
+        for sensor, (pin, ticket) in to_power_off:
+            self.in_order(pin, ticket, sensor.power_off)
+
+    def get_stats(self):
+        return {"cycles": self.cycles, "shared": self.shared, "failed": self.failed, "powered": len(self.powered)}
@@ -0,0 +1,59 @@
+#!/bin/python3
+"""
+  Test the power sequencing of the probes sharing a power pin
+  To run from the ponicwatch folder:  python -m pytest pw_power_test.py
+"""
+import unittest
+from threading import Thread
+from time import sleep
+from pw_power import Power_Sequencer
+
+
+class Probe(object):
+    """Sensor stand-in powered through a pin"""
+    def __init__(self, key, delay=0.2, powered=True):
+        self.power_key, self.power_delay, self.pwr_ic = key, delay, True
+        self.powered, self.calls = powered, []
+
+    def power_on(self):
+        self.calls.append("on")
+        return self.powered
+
+    def power_off(self):
+        self.calls.append("off")
+
+
+class Power(unittest.TestCase):
+    def test_shared_pin(self):
+        sequencer = Power_Sequencer()
+        first, second = Probe(("RPI3", 14)), Probe(("RPI3", 14), delay=0.5)
+        self.assertAlmostEqual(sequencer.power_on(first), 0.2, delta=0.05)
+        sleep(0.1)
+        self.assertAlmostEqual(sequencer.power_on(second), 0.4, delta=0.05)  # only what remains of its delay
+        sequencer.power_off(first)
+        self.assertEqual(first.calls + second.calls, ["on"])  # still used by the second probe
+        sequencer.power_off(second)
+        self.assertEqual(first.calls + second.calls, ["on", "off"])
+        self.assertEqual(sequencer.get_stats(), {"cycles": 1, "shared": 1, "failed": 0, "powered": 0})
+
+    def test_power_failure(self):
+        sequencer, probe = Power_Sequencer(), Probe(("RPI3", 15), powered=False)
+        self.assertIsNone(sequencer.power_on(probe))
+        self.assertEqual(sequencer.get_stats()["failed"], 1)
+        sequencer.power_off(probe)
+        self.assertEqual(probe.calls, ["on"])  # never powered: nothing to power off
+
+    def test_power_off_all(self):
+        sequencer, probes = Power_Sequencer(), [Probe(("RPI3", 16)), Probe(("RPI3", 17))]
+        threads = [Thread(target=sequencer.power_on, args=(probe,)) for probe in probes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        sequencer.power_off_all(probes)
+        self.assertEqual([probe.calls for probe in probes], [["on", "off"], ["on", "off"]])
+        self.assertEqual(sequencer.get_stats()["powered"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/bin/python3
+"""
+    pw_retention.py: tiered retention of the log records, declared in the 'init' of the 'reduce_log_table' interrupt:
+
+    { "action": "reduce_log_table", "timer": "0 30 3 * * *", "days": 90,
+      "retention": [ {"log_type": "SENSOR", "days": 7},
+                     {"log_type": "SENSOR", "object_id": 4, "days": 30},
+                     {"log_type": "ERROR", "days": null},
+                     {"rollup": "minute", "days": 30},
+                     {"rollup": "hour", "days": 365},
+                     {"series": true, "days": 30} ],
+      "chunk_size": 500, "max_seconds": 60 }
+
+    - the most specific policy applies to a tb_log record: log_type and object_id, then log_type, then the default 'days'
+    - "days": null keeps the records forever
+    - 'rollup' policies apply to tb_log_rollup by resolution (kept forever if not given), 'series' to tb_series
+      (default 'days' if not given)
+    - the records are deleted by chunks of 'chunk_size' rows, each chunk in its own short transaction: the scheduler
+      is never blocked for long. After 'max_seconds', the remaining chunks are left to the next run.
+    - the tb_log records are copied to the log's archive, if any, before their deletion
+    - the old partitions left empty are dropped
+"""
+from time import time
+from datetime import datetime, timezone, timedelta
+from model.pw_db import log_partition_name, ROLLUP_RESOLUTIONS
+from pw_rollup import utc_text
+
+
+class Log_Retention(object):
+    """Retention policies parsed from an 'init' dictionary, applied by enforce()"""
+    def __init__(self, log, init_dict):
+        self.log = log
+        self.default_days = init_dict.get("days", 90)
+        self.chunk_size = init_dict.get("chunk_size", 500)
+        self.max_seconds = init_dict.get("max_seconds")
+        self.policies, self.rollup_days, self.series_days = [], {}, self.default_days
+        resolutions = [r[0] for r in ROLLUP_RESOLUTIONS]
+        for policy in init_dict.get("retention", []):
+            if "rollup" in policy:
+                if policy["rollup"] not in resolutions:
+                    raise ValueError("Unknown rollup resolution in retention policy: {}".format(policy["rollup"]))
+                self.rollup_days[policy["rollup"]] = policy["days"]
+            elif "series" in policy:
+                self.series_days = policy["days"]
+            else:
+                self.policies.append((policy["log_type"], policy.get("object_id"), policy["days"]))
+
+    def conditions(self, now):
+        """WHERE clauses selecting the expired tb_log records of each policy: the more specific policies are excluded from the general ones
+        :return: list of (where clause, arguments, cutoff)
+        """
+        by_object = [(t, o) for t, o, d in self.policies if o is not None]
+        by_type = [t for t, o, d in self.policies if o is None]
+        conditions = []
+        for log_type, object_id, days in self.policies:
+            if days is None:
+                continue
+            cutoff = now - timedelta(days=days)
+            if object_id is not None:
+                where, args = "log_type=? and object_id=?", [log_type, object_id]
+            else:
+                where, args = "log_type=?", [log_type]
+                ids = [o for t, o in by_object if t == log_type]
+                if ids:
+                    where += " and object_id not in ({})".format(",".join("?" * len(ids)))
+                    args += ids
+            conditions.append((where + " and created_on < ?", args + [cutoff], cutoff))
+        if self.default_days is not None:
+            cutoff = now - timedelta(days=self.default_days)
+            where, args = [], []
+            if by_type:
+                where.append("log_type not in ({})".format(",".join("?" * len(by_type))))
+                args += by_type
+            for log_type, object_id in by_object:
+                if log_type not in by_type:
+                    where.append("not (log_type=? and object_id=?)")
+                    args += [log_type, object_id]
+            where.append("created_on < ?")
+            conditions.append((" and ".join(where), args + [cutoff], cutoff))
+        return conditions
+
+    def chunks(self, now):
+        """All the expired records to delete by chunks as (table, where clause, arguments, key column)"""
+        for partition in list(self.log.partitions):
+            for where, args, cutoff in self.conditions(now):
+                if partition <= log_partition_name(cutoff):  # else no record of the partition is old enough
+                    yield partition, where, args, "log_id"
+        for resolution, days in sorted(self.rollup_days.items()):
+            if days is not None:
+                yield "tb_log_rollup", "resolution=? and bucket<?", [resolution, utc_text(now - timedelta(days=days))], "rowid"
+        if self.series_days is not None:
+            yield "tb_series", "last_on<?", [int((now - timedelta(days=self.series_days)).timestamp() * 1000)], "rowid"
+
+    def delete_chunk(self, table, where, args, key):
+        """Delete one chunk of records, the tb_log records being archived first
+        :return: number of records deleted
+        """
+        if key == "log_id" and self.log.archive:
+            rows = self.log.fetch("SELECT * FROM {} WHERE {} LIMIT ?".format(table, where), args + [self.chunk_size])
+            if not rows:
+                return 0
+            self.log.archive.append(rows)
+            ids = [row[0] for row in rows]
+            self.log.execute_sql("DELETE FROM {} WHERE log_id IN ({})".format(table, ",".join("?" * len(ids))), ids)
+            return len(rows)
+        return self.log.execute_sql("DELETE FROM {0} WHERE {1} IN (SELECT {1} FROM {0} WHERE {2} LIMIT ?)".format(table, key, where),
+                                    args + [self.chunk_size])
+
+    def enforce(self):
+        """Delete the expired records chunk by chunk, then drop the old partitions left empty
+        :return: number of tb_log records deleted
+        """
+        start, now = time(), datetime.now(timezone.utc)
+        nb_rows = 0
+        for table, where, args, key in self.chunks(now):
+            deleted = self.chunk_size
+            while deleted == self.chunk_size:
+                if self.max_seconds and time() - start > self.max_seconds:
+                    return nb_rows
+                deleted = self.delete_chunk(table, where, args, key)
+                if key == "log_id":
+                    nb_rows += deleted
+        self.log.drop_partitions([p for p in self.log.partitions
+                                  if self.log.fetch("SELECT 1 FROM {} LIMIT 1".format(p), only_one=True) is None])
+        return nb_rows
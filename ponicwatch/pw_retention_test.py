@@ -0,0 +1,55 @@
+#!/bin/python3
+"""
+  Test the tiered retention of the log records on temporary Sqlite3 files
+  To run from the ponicwatch folder:  python -m pytest pw_retention_test.py
+"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone, timedelta
+from model.pw_db import Ponicwatch_Db
+from pw_log import Ponicwatch_Log
+from pw_retention import Log_Retention
+
+POLICIES = {"days": 90, "chunk_size": 1,
+            "retention": [{"log_type": "SENSOR", "days": 7},
+                          {"log_type": "SENSOR", "object_id": 4, "days": 30},
+                          {"log_type": "ERROR", "days": None},
+                          {"rollup": "minute", "days": 5}]}
+
+
+class ctrl:
+    """Controller stand-in: Ponicwatch_Log only needs a name and a database"""
+    def __init__(self, db):
+        self.name = 'Test'
+        self.db = db
+
+
+class Retention(unittest.TestCase):
+    def test_enforce(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db))
+            now = datetime.now(timezone.utc)
+            log.insert_rows([("Test", "SENSOR", 1, "Sys", 1.0, "value", now - timedelta(days=10)),
+                             ("Test", "SENSOR", 1, "Sys", 1.0, "value", now - timedelta(days=1)),
+                             ("Test", "SENSOR", 4, "Sys", 1.0, "value", now - timedelta(days=10)),
+                             ("Test", "ERROR", 0, "Sys", 0.0, "error", now - timedelta(days=100)),
+                             ("Test", "INFO", 0, "Sys", 0.0, "message", now - timedelta(days=100)),
+                             ("Test", "INFO", 0, "Sys", 0.0, "message", now - timedelta(days=200))])
+            old_partition = log.partitions[0]
+            self.assertEqual(Log_Retention(log, POLICIES).enforce(), 3)
+            self.assertEqual(sorted((r[0], r[1]) for r in log.fetch("SELECT log_type, object_id FROM tb_log")),
+                             [("ERROR", 0), ("SENSOR", 1), ("SENSOR", 4)])
+            self.assertNotIn(old_partition, log.partitions)  # left empty: dropped
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_log_rollup WHERE resolution='minute'", only_one=True)[0], 1)
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_log_rollup WHERE resolution='hour'", only_one=True)[0], 3)
+            db.close_pool()
+
+    def test_unknown_rollup(self):
+        with self.assertRaises(ValueError):
+            Log_Retention(None, {"retention": [{"rollup": "week", "days": 5}]})
+
+
+if __name__ == "__main__":
+    unittest.main()
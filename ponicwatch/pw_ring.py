@@ -0,0 +1,58 @@
+#!/bin/python3
+"""
+    pw_ring.py: last readings of a Sensor/Switch kept in memory.
+
+    Each object holds a Ring_Buffer of its last N values (init key "RING", default 1440) with their timestamps,
+    stored in two preallocated arrays of doubles: 16 bytes per reading, no allocation per reading.
+    The latest value and the recent windows (charts, dashboard) are then served without any database access.
+"""
+from array import array
+from bisect import bisect_left
+from threading import Lock
+from datetime import datetime, timezone
+from pw_series import to_ms, from_ms
+
+
+class Ring_Buffer(object):
+    """Circular buffer of (timestamp in ms since epoch, value)"""
+    def __init__(self, size=1440):
+        self.size = max(int(size), 1)
+        self.on = array('d', bytes(8 * self.size))
+        self.vals = array('d', bytes(8 * self.size))
+        self.head, self.count = 0, 0  # 'head' is the index of the next write
+        self.lock = Lock()
+
+    def append(self, value, timestamp=None):
+        """Add a reading: the oldest one is overwritten once the buffer is full"""
+        on = to_ms(timestamp or datetime.now(timezone.utc))
+        with self.lock:
+            self.on[self.head] = on
+            self.vals[self.head] = value
+            self.head = (self.head + 1) % self.size
+            self.count = min(self.count + 1, self.size)
+
+    def latest(self):
+        """Most recent reading as (naive UTC datetime, value) or None if empty"""
+        with self.lock:
+            if not self.count:
+                return None
+            return from_ms(self.on[self.head - 1]), self.vals[self.head - 1]
+
+    def covers(self, from_time):
+        """True if the buffer holds all the readings since from_time, i.e. its oldest reading is not after it"""
+        with self.lock:
+            return self.count > 0 and self.on[(self.head - self.count) % self.size] <= to_ms(from_time)
+
+    def window(self, from_time=None, to_time=None):
+        """Readings in [from_time, to_time[ as a list of (naive UTC datetime, value), oldest first"""
+        with self.lock:
+            if self.count < self.size:
+                on, vals = self.on[:self.count], self.vals[:self.count]
+            else:
+                on, vals = self.on[self.head:] + self.on[:self.head], self.vals[self.head:] + self.vals[:self.head]
+        first = bisect_left(on, to_ms(from_time)) if from_time is not None else 0
+        last = bisect_left(on, to_ms(to_time)) if to_time is not None else len(on)
+        return [(from_ms(on[i]), vals[i]) for i in range(first, last)]
+
+    def __len__(self):
+        return self.count
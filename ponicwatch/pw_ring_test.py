@@ -0,0 +1,29 @@
+#!/bin/python3
+"""
+  Test the ring buffer of the last readings of a Sensor/Switch
+  To run from the ponicwatch folder:  python -m pytest pw_ring_test.py
+"""
+import unittest
+from datetime import datetime, timezone, timedelta
+from pw_ring import Ring_Buffer
+
+START = datetime(2026, 9, 1, tzinfo=timezone.utc)
+
+
+class Ring(unittest.TestCase):
+    def test_wrap_around(self):
+        ring = Ring_Buffer(3)
+        self.assertIsNone(ring.latest())
+        for s in range(5):
+            ring.append(float(s), START + timedelta(seconds=s))
+        self.assertEqual(len(ring), 3)
+        naive = START.replace(tzinfo=None)  # the timestamps are kept as naive UTC
+        self.assertEqual(ring.latest(), (naive + timedelta(seconds=4), 4.0))
+        self.assertEqual([v for t, v in ring.window()], [2.0, 3.0, 4.0])
+        self.assertEqual(ring.window(START + timedelta(seconds=3), START + timedelta(seconds=4)), [(naive + timedelta(seconds=3), 3.0)])
+        self.assertTrue(ring.covers(START + timedelta(seconds=2)))
+        self.assertFalse(ring.covers(START + timedelta(seconds=1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/bin/python3
+"""
+    Model for the table tb_log_rollup
+
+    Aggregates of the SENSOR and SWITCH values logged in tb_log by object and by time bucket (minute, hour, day):
+    number of values, min, max, sum (for the average) and last value.
+    The rows are maintained incrementally by Ponicwatch_Log in the same transaction as the log records.
+    Charts select the coarsest resolution still giving enough points for the requested time window.
+"""
+from datetime import datetime, timezone
+from model.model import Ponicwatch_Table
+from model.pw_db import log_partitions, rollup_log_partition, ROLLUP_RESOLUTIONS, ROLLUP_LOG_TYPES
+
+
+def utc_text(timestamp):
+    """Timestamp as stored in tb_log i.e. 'YYYY-MM-DD HH:MM:SS...' in UTC"""
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo:
+            timestamp = timestamp.astimezone(timezone.utc)
+        return "{:%Y-%m-%d %H:%M:%S}".format(timestamp)
+    return timestamp
+
+
+class Ponicwatch_Rollup(Ponicwatch_Table):
+    """
+    Class to maintain and read the table tb_log_rollup
+    - 'resolution': minute, hour or day
+    - 'bucket': UTC timestamp of the beginning of the bucket
+    - 'last_value': value of the most recent record, logged on 'last_on'
+    """
+    META = {"table": "tb_log_rollup",
+            "id": "bucket",
+            "columns": (
+                            "resolution",   # TEXT NOT NULL,
+                            "log_type",     # TEXT NOT NULL,
+                            "object_id",    # INTEGER NOT NULL,
+                            "bucket",       # TIMESTAMP NOT NULL,
+                            "nb_values",    # INTEGER NOT NULL DEFAULT (0),
+                            "min_value",    # REAL,
+                            "max_value",    # REAL,
+                            "sum_value",    # REAL,
+                            "last_value",   # REAL,
+                            "last_on",      # TIMESTAMP
+                        )
+            }
+
+    def __init__(self, db, *args, **kwargs):
+        super().__init__(db, Ponicwatch_Rollup.META, *args, **kwargs)
+
+    def add_rows(self, curs, rows):
+        """Add the SENSOR/SWITCH values of tb_log rows to their buckets - must be called within the transaction inserting the rows
+        :param curs: cursor of the transaction
+        :param rows: tuples of tb_log values without log_id i.e. (controller_name, log_type, object_id, system_name, float_value, text_value, created_on)
+        """
+        buckets = {}   # pre-aggregation of the rows: one UPDATE/INSERT per bucket
+        for row in rows:
+            log_type, object_id, value, created_on = row[1], row[2], row[4], utc_text(row[6])
+            if log_type not in ROLLUP_LOG_TYPES:
+                continue
+            for resolution, seconds, prefix, completion in ROLLUP_RESOLUTIONS:
+                key = (resolution, log_type, object_id, created_on[:prefix] + completion)
+                if key in buckets:
+                    agg = buckets[key]
+                    agg[0] += 1
+                    agg[1], agg[2], agg[3] = min(agg[1], value), max(agg[2], value), agg[3] + value
+                    if created_on >= agg[5]:
+                        agg[4], agg[5] = value, created_on
+                else:
+                    buckets[key] = [1, value, value, value, value, created_on]
+        for key, (nb_values, min_value, max_value, sum_value, last_value, last_on) in buckets.items():
+            curs.execute("""UPDATE tb_log_rollup SET nb_values=nb_values+?, min_value=min(min_value, ?), max_value=max(max_value, ?),
+                                   sum_value=sum_value+?, last_value=CASE WHEN last_on<=? THEN ? ELSE last_value END, last_on=max(last_on, ?)
+                            WHERE resolution=? AND log_type=? AND object_id=? AND bucket=?""",
+                         (nb_values, min_value, max_value, sum_value, last_on, last_value, last_on) + key)
+            if curs.rowcount == 0:
+                curs.execute("INSERT INTO tb_log_rollup VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             key + (nb_values, min_value, max_value, sum_value, last_value, last_on))
+
+    def rebuild(self, debug=False):
+        """Re-create all the buckets from the records found in the tb_log partitions: one transaction per partition"""
+        self.execute_sql("DELETE FROM tb_log_rollup")
+        with self.db.exclusive_access:
+            self.db.open()
+            try:
+                partitions = log_partitions(self.db.curs)
+            finally:
+                self.db.close()
+        for partition in partitions:
+            with self.db.exclusive_access:
+                self.db.open()
+                try:
+                    rollup_log_partition(self.db.curs, partition)
+                    self.db.conn.commit()
+                finally:
+                    self.db.close()
+            if debug:
+                print(partition, "aggregated")
+
+    @staticmethod
+    def best_resolution(from_time, to_time=None, min_points=100):
+        """Coarsest resolution giving at least 'min_points' buckets over the time window, None if the raw records are needed"""
+        window = ((to_time or datetime.now(timezone.utc)) - from_time).total_seconds()
+        for resolution, seconds, prefix, completion in ROLLUP_RESOLUTIONS:
+            if window / seconds >= min_points:
+                return resolution
+        return None
+
+    def get_series(self, resolution, log_type, object_id, from_time, to_time=None):
+        """List of (bucket, average value) over the time window"""
+        where, args = "resolution=? and log_type=? and object_id=? and bucket>=?", [resolution, log_type, object_id, utc_text(from_time)]
+        if to_time is not None:
+            where += " and bucket<?"
+            args.append(utc_text(to_time))
+        rows = self.get_all_records(page_len=0, where_clause=where, args=args, order_by="bucket",
+                                    columns="bucket, sum_value / nb_values")
+        return [(row[0], row[1]) for row in rows]
+
+
+if __name__ == "__main__":
+    import argparse
+    from model.pw_db import Ponicwatch_Db
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sqlite", dest="dbfilename", help="Path of a Sqlite3 database.", required=True)
+    parser.add_argument("-r", "--rebuild", dest="rebuild", help="Rebuild the rollup table from the tb_log records", action='store_true')
+    args = parser.parse_args()
+    rollup = Ponicwatch_Rollup(Ponicwatch_Db("sqlite3", {'database': args.dbfilename}))
+    if args.rebuild:
+        rollup.rebuild(debug=True)
+    for row in rollup.fetch("select resolution, count(*) from tb_log_rollup group by resolution"):
+        print(row[0], row[1], "buckets")
@@ -0,0 +1,68 @@
+#!/bin/python3
+"""
+  Test the minute/hour/day aggregates of tb_log_rollup on temporary Sqlite3 files
+  To run from the ponicwatch folder:  python -m pytest pw_rollup_test.py
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timezone, timedelta
+from model.pw_db import Ponicwatch_Db
+from pw_log import Ponicwatch_Log
+from pw_rollup import Ponicwatch_Rollup
+
+BUCKETS = "SELECT resolution, CAST(bucket AS TEXT), nb_values, min_value, max_value, sum_value, last_value " \
+          "FROM tb_log_rollup ORDER BY resolution, bucket"
+
+
+class ctrl:
+    """Controller stand-in: Ponicwatch_Log only needs a name and a database"""
+    def __init__(self, db):
+        self.name = 'Test'
+        self.db = db
+
+
+class Rollup(unittest.TestCase):
+    def test_buckets(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db))
+            log.insert_rows([("Test", "SENSOR", 4, "Sys", 1.0, "value", datetime(2026, 9, 1, 10, 0, 10, tzinfo=timezone.utc)),
+                             ("Test", "SENSOR", 4, "Sys", 3.0, "value", datetime(2026, 9, 1, 10, 0, 50, tzinfo=timezone.utc)),
+                             ("Test", "SENSOR", 4, "Sys", 5.0, "value", datetime(2026, 9, 1, 10, 1, 5, tzinfo=timezone.utc)),
+                             ("Test", "INFO", 4, "Sys", 9.0, "message", datetime(2026, 9, 1, 10, 1, 6, tzinfo=timezone.utc))])
+            buckets = [tuple(r) for r in log.fetch(BUCKETS)]
+            self.assertEqual(buckets, [("day", "2026-09-01 00:00:00", 3, 1.0, 5.0, 9.0, 5.0),
+                                       ("hour", "2026-09-01 10:00:00", 3, 1.0, 5.0, 9.0, 5.0),
+                                       ("minute", "2026-09-01 10:00:00", 2, 1.0, 3.0, 4.0, 3.0),
+                                       ("minute", "2026-09-01 10:01:00", 1, 5.0, 5.0, 5.0, 5.0)])
+            series = log.rollup.get_series("minute", "SENSOR", 4, datetime(2026, 9, 1, 10, tzinfo=timezone.utc))
+            self.assertEqual([value for bucket, value in series], [2.0, 5.0])
+            log.rollup.rebuild()
+            self.assertEqual([tuple(r) for r in log.fetch(BUCKETS)], buckets)
+            db.close_pool()
+
+    def test_filled_by_the_migration(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = os.path.join(folder, "baseline.db")
+            Ponicwatch_Db.create_tables(None, db_path)
+            with sqlite3.connect(db_path) as conn:
+                conn.executemany("INSERT INTO tb_log VALUES (?, 'Test', 'SENSOR', 4, 'Sys', ?, 'value', ?)",
+                                 [(1, 20.0, "2026-08-30 23:59:00.000000"), (2, 21.0, "2026-09-01 00:01:00.000000")])
+            db = Ponicwatch_Db("sqlite3", {'database': db_path}, migrate=True)
+            log = Ponicwatch_Log(ctrl(db))
+            rollup = log.fetch("SELECT nb_values, sum_value FROM tb_log_rollup WHERE resolution='day' ORDER BY bucket")
+            self.assertEqual([tuple(r) for r in rollup], [(1, 20.0), (1, 21.0)])
+            db.close_pool()
+
+    def test_best_resolution(self):
+        to_time = datetime(2026, 9, 30, tzinfo=timezone.utc)
+        self.assertEqual(Ponicwatch_Rollup.best_resolution(to_time - timedelta(days=200), to_time), "day")
+        self.assertEqual(Ponicwatch_Rollup.best_resolution(to_time - timedelta(days=10), to_time), "hour")
+        self.assertEqual(Ponicwatch_Rollup.best_resolution(to_time - timedelta(hours=2), to_time), "minute")
+        self.assertIsNone(Ponicwatch_Rollup.best_resolution(to_time - timedelta(minutes=10), to_time))
+
+
+if __name__ == "__main__":
+    unittest.main()
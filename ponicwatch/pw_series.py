@@ -0,0 +1,193 @@
+#!/bin/python3
+"""
+    Model for the table tb_series
+
+    Compact store of the values of the objects with "STORE": "series": about 8 bytes per value instead of a
+    ~150 bytes tb_log row. The values of one object are grouped in chunks of up to CHUNK_SIZE values:
+    - 'first_on', 'last_on': timestamps of the first and last values in milliseconds since epoch (UTC)
+    - 'deltas': BLOB of uint32 little endian, milliseconds elapsed since the previous value (0 for the first one)
+    - 'vals': BLOB of float32 little endian
+    A chunk is only INSERTed once closed, never rewritten. The values of the chunk being filled are appended to
+    tb_series_open in the same transaction as the batch: nothing is lost on a crash, the chunk is reloaded at start-up.
+    A value older than the last one of its chunk (i.e. the point stored by a swinging door) closes the chunk and
+    starts a new one, as the deltas cannot be negative.
+"""
+import sys
+from array import array
+from itertools import accumulate
+from time import time
+from datetime import datetime, timezone
+from model.model import Ponicwatch_Table
+from model.pw_db import ROLLUP_LOG_TYPES
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHUNK_SIZE = 256
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_ms(timestamp):
+    """Milliseconds since epoch of a datetime (naive is UTC)"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int((timestamp - EPOCH).total_seconds() * 1000)
+
+
+def from_ms(ms):
+    """Naive UTC datetime of a number of milliseconds since epoch, as read from tb_log"""
+    return datetime.utcfromtimestamp(ms / 1000.0)
+
+
+class Chunk(object):
+    """Values of one object being accumulated before being stored as one tb_series row"""
+    def __init__(self, first_on):
+        self.first_on = self.last_on = first_on
+        self.deltas, self.vals = array('I'), array('f')
+
+    def accepts(self, on):
+        """False if the value must start a new chunk: older than the last value or delta overflowing uint32"""
+        return 0 <= on - self.last_on <= 0xFFFFFFFF
+
+    def append(self, on, value):
+        self.deltas.append(on - self.last_on if self.vals else 0)
+        self.vals.append(value)
+        self.last_on = on
+
+    def blobs(self):
+        """little endian bytes of the deltas and values"""
+        deltas, vals = array('I', self.deltas), array('f', self.vals)
+        if sys.byteorder == 'big':
+            deltas.byteswap()
+            vals.byteswap()
+        return deltas.tobytes(), vals.tobytes()
+
+
+def decode(first_on, deltas, vals):
+    """Timestamps (ms) and values of one chunk as NumPy arrays, or lists without NumPy"""
+    if np is not None:
+        return (np.frombuffer(deltas, dtype='<u4').astype('int64').cumsum() + first_on,
+                np.frombuffer(vals, dtype='<f4').astype('float64'))
+    d, v = array('I'), array('f')
+    d.frombytes(deltas)
+    v.frombytes(vals)
+    if sys.byteorder == 'big':
+        d.byteswap()
+        v.byteswap()
+    return [first_on + t for t in accumulate(d)], list(v)
+
+
+class Ponicwatch_Series(Ponicwatch_Table):
+    """
+    Class to write and read the table tb_series - the writes are done by Ponicwatch_Log with its exclusive access
+    """
+    META = {"table": "tb_series",
+            "id": "first_on",
+            "columns": (
+                            "log_type",     # TEXT NOT NULL,
+                            "object_id",    # INTEGER NOT NULL,
+                            "first_on",     # INTEGER NOT NULL,
+                            "last_on",      # INTEGER NOT NULL,
+                            "nb_values",    # INTEGER NOT NULL,
+                            "deltas",       # BLOB NOT NULL,
+                            "vals",         # BLOB NOT NULL
+                        )
+            }
+
+    def __init__(self, db, *args, **kwargs):
+        super().__init__(db, Ponicwatch_Series.META, *args, **kwargs)
+        self.chunks = None  # (log_type, object_id) --> Chunk being filled, reloaded from tb_series_open on first write
+        self.last_first_on = {}  # (log_type, object_id) --> first_on of the last chunk written
+        self.rejected = 0
+
+    def load_open_chunks(self, curs):
+        """Rebuild the chunks being filled from their values saved in tb_series_open"""
+        self.chunks = {}
+        curs.execute("SELECT log_type, object_id, max(first_on) FROM tb_series GROUP BY log_type, object_id")
+        self.last_first_on = {(log_type, object_id): first_on for log_type, object_id, first_on in curs.fetchall()}
+        curs.execute("SELECT log_type, object_id, value_on, float_value FROM tb_series_open ORDER BY rowid")
+        for log_type, object_id, on, value in curs.fetchall():
+            chunk = self.chunks.get((log_type, object_id))
+            if chunk is None:
+                chunk = self.chunks[(log_type, object_id)] = Chunk(on)
+            chunk.append(on, value)
+
+    def add_rows(self, curs, rows):
+        """Append the values of tb_log rows - must be called within the transaction inserting the rows
+        :param rows: tuples (controller_name, log_type, object_id, system_name, float_value, text_value, created_on)
+        """
+        if self.chunks is None:
+            self.load_open_chunks(curs)
+        values = sorted(((row[1], row[2]), to_ms(row[6]), row[4]) for row in rows
+                        if row[1] in ROLLUP_LOG_TYPES and isinstance(row[6], datetime))
+        opened = {}  # key --> values of the chunk being filled to append to tb_series_open
+        for key, on, value in values:
+            chunk = self.chunks.get(key)
+            if chunk is not None and not chunk.accepts(on):
+                if on <= chunk.first_on:  # would overlap the chunk: its first_on is the primary key
+                    self.rejected += 1
+                    continue
+                self.close_chunk(curs, key)
+                opened.pop(key, None)
+                chunk = None
+            if chunk is None:
+                if on <= self.last_first_on.get(key, -1):
+                    self.rejected += 1
+                    continue
+                chunk = self.chunks[key] = Chunk(on)
+            chunk.append(on, value)
+            opened.setdefault(key, []).append(key + (on, value))
+            if len(chunk.vals) >= CHUNK_SIZE:
+                self.close_chunk(curs, key)
+                opened.pop(key, None)
+        curs.executemany("INSERT INTO tb_series_open (log_type, object_id, value_on, float_value) VALUES (?, ?, ?, ?)",
+                         [value for values in opened.values() for value in values])
+
+    def close_chunk(self, curs, key):
+        """INSERT the chunk being filled as one tb_series row and forget its values in tb_series_open"""
+        chunk = self.chunks.pop(key)
+        deltas, vals = chunk.blobs()
+        curs.execute("INSERT INTO tb_series VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     key + (chunk.first_on, chunk.last_on, len(chunk.vals), deltas, vals))
+        curs.execute("DELETE FROM tb_series_open WHERE log_type=? and object_id=?", key)
+        self.last_first_on[key] = chunk.first_on
+
+    def read(self, log_type, object_id, from_time, to_time=None):
+        """Values of one object created in [from_time, to_time[
+        :return: (timestamps in ms since epoch, values) as NumPy arrays, or lists if NumPy is not installed
+        """
+        from_on = to_ms(from_time)
+        to_on = to_ms(to_time) if to_time is not None else None
+        where, args = "log_type=? and object_id=? and last_on>=?", [log_type, object_id, from_on]
+        if to_on is not None:
+            where += " and first_on<?"
+            args.append(to_on)
+        rows = self.get_all_records(page_len=0, where_clause=where, args=args, order_by="first_on",
+                                    columns="first_on, deltas, vals")
+        parts = [decode(*row) for row in rows]
+        # values of the chunk being filled, possibly written by another process
+        opened = self.fetch("SELECT value_on, float_value FROM tb_series_open WHERE log_type=? and object_id=? and value_on>=? "
+                            "ORDER BY rowid", (log_type, object_id, from_on))
+        if opened:
+            parts.append(([row[0] for row in opened], [row[1] for row in opened]))
+        if np is not None:
+            if not parts:
+                return np.empty(0, dtype='int64'), np.empty(0, dtype='float64')
+            on = np.concatenate([np.asarray(p[0], dtype='int64') for p in parts])
+            vals = np.concatenate([np.asarray(p[1], dtype='float64') for p in parts])
+            keep = (on >= from_on) if to_on is None else (on >= from_on) & (on < to_on)
+            order = np.argsort(on[keep], kind='stable')  # the chunks started by an out of order value overlap the previous one
+            return on[keep][order], vals[keep][order]
+        on, vals = [], []
+        for p_on, p_vals in parts:
+            for t, v in zip(p_on, p_vals):
+                if t >= from_on and (to_on is None or t < to_on):
+                    on.append(t)
+                    vals.append(v)
+        order = sorted(range(len(on)), key=on.__getitem__)
+        return [on[i] for i in order], [vals[i] for i in order]
+
+    def reduce_size(self, keep_days=90):
+        """Delete the chunks having all their values older than the number of days given as parameters"""
+        return self.execute_sql("DELETE FROM tb_series WHERE last_on < ?", (int((time() - keep_days * 86400) * 1000),))
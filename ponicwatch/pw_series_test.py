@@ -0,0 +1,74 @@
+#!/bin/python3
+"""
+  Test the columnar store tb_series on temporary Sqlite3 files
+  To run from the ponicwatch folder:  python -m pytest pw_series_test.py
+"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone, timedelta
+from model.pw_db import Ponicwatch_Db
+from pw_log import Ponicwatch_Log
+from pw_series import CHUNK_SIZE, to_ms, from_ms
+
+START = datetime(2026, 9, 1, tzinfo=timezone.utc)
+
+
+class ctrl:
+    """Controller stand-in: Ponicwatch_Log only needs a name and a database"""
+    def __init__(self, db):
+        self.name = 'Test'
+        self.db = db
+
+
+def values(first, last):
+    """one value per second of object 7, stored only in tb_series"""
+    return [("Test", "SENSOR", 7, "Sys", float(s), "value", START + timedelta(seconds=s)) for s in range(first, last)]
+
+
+class Series(unittest.TestCase):
+    def test_ms(self):
+        self.assertEqual(from_ms(to_ms(START + timedelta(milliseconds=1500))), datetime(2026, 9, 1, 0, 0, 1, 500000))
+
+    def test_chunks(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db))
+            log.insert_rows([], values(0, 300))
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_log", only_one=True)[0], 0)
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_series", only_one=True)[0], 1)
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_series_open", only_one=True)[0], 300 - CHUNK_SIZE)
+            on, vals = log.series.read("SENSOR", 7, START)
+            self.assertEqual([int(t) for t in on], [to_ms(START) + 1000 * s for s in range(300)])
+            self.assertEqual([float(v) for v in vals], [float(s) for s in range(300)])
+            # the rollup still aggregates the values
+            self.assertEqual(log.fetch("SELECT nb_values FROM tb_log_rollup WHERE resolution='hour'", only_one=True)[0], 300)
+            db.close_pool()
+
+    def test_reload_open_chunk(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            Ponicwatch_Log(ctrl(db)).insert_rows([], values(0, 10))
+            log = Ponicwatch_Log(ctrl(db))  # restart: the chunk being filled is reloaded from tb_series_open
+            log.insert_rows([], values(10, CHUNK_SIZE))
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_series", only_one=True)[0], 1)
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_series_open", only_one=True)[0], 0)
+            self.assertEqual([float(v) for v in log.series.read("SENSOR", 7, START)[1]], [float(s) for s in range(CHUNK_SIZE)])
+            db.close_pool()
+
+    def test_out_of_order(self):
+        with tempfile.TemporaryDirectory() as folder:
+            db = Ponicwatch_Db("sqlite3", {'database': os.path.join(folder, "log.db")})
+            log = Ponicwatch_Log(ctrl(db))
+            log.insert_rows([], values(100, 110))
+            log.insert_rows([], values(105, 106))  # older than the last value: starts a new chunk
+            log.insert_rows([], values(100, 101))  # same time as the first value of the chunk: rejected
+            self.assertEqual(log.series.rejected, 1)
+            self.assertEqual(log.fetch("SELECT count(*) FROM tb_series", only_one=True)[0], 1)
+            self.assertEqual([float(v) for v in log.series.read("SENSOR", 7, START)[1]],
+                             [float(s) for s in sorted(list(range(100, 110)) + [105])])
+            db.close_pool()
+
+
+if __name__ == "__main__":
+    unittest.main()
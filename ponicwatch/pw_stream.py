@@ -0,0 +1,157 @@
+#!/bin/python3
+"""
+    pw_stream.py: continuous sampling of ADC channels at hundreds of Hz, i.e. for the EC/pH noise analysis.
+
+    A MCP3208 declared with the init key "stream" is sampled by its own thread into a ring buffer:
+        "stream": {"channels": [0, 1], "rate": 500, "size": 8192, "filter": "CIC", "decimation": 100, "order": 3}
+    - channels: ADC channels sampled continuously (default all 8)
+    - rate: samples per second and per channel, 0 for as fast as the bus allows (default 200)
+    - size: samples kept per channel, preallocated (default 8192)
+    - filter: how the value of a channel is computed from its last samples (default "boxcar")
+        "boxcar": mean of the last 'decimation' samples
+        "CIC": 'order' cascaded moving averages of 'decimation' samples, as the output of a CIC decimator
+        "median": median of the last 'decimation' samples
+    - warmup: seconds a reading waits for the first samples once the stream runs (default 2.0)
+    The Sensors keep their timer: Hardware.read/average of a streamed channel return the filtered value
+    without any SPI transfer, so Sensor.execute logs the decimated signal at the timer's rate.
+"""
+from threading import Thread, Event, Lock
+from time import perf_counter
+from pw_bus import No_Lock
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FILTERS = ("boxcar", "CIC", "median")
+
+
+def cic_weights(decimation, order):
+    """Impulse response of 'order' cascaded moving averages of 'decimation' samples, normalized
+    :return: NumPy array, or list if NumPy is not installed
+    """
+    if np is not None:
+        box = np.ones(decimation)
+        weights = box
+        for _ in range(order - 1):
+            weights = np.convolve(weights, box)
+        return weights / weights.sum()
+    weights = [1.0] * decimation
+    for _ in range(order - 1):
+        weights = [sum(weights[j] for j in range(max(0, i - decimation + 1), min(i, len(weights) - 1) + 1))
+                   for i in range(len(weights) + decimation - 1)]
+    total = sum(weights)
+    return [w / total for w in weights]
+
+
+class ADC_Stream(Thread):
+    """Thread sampling some channels of an ADC driver (Hardware_MCP3208) into a ring buffer per channel"""
+    def __init__(self, driver, init_dict, bus_lock=None):
+        """
+        :param driver: Hardware_MCP3208 driver: its transfer() and decode() are used
+        :param init_dict: the "stream" dictionary of the hardware's init
+        :param bus_lock: lock of the SPI bus, held during each block of transfers
+        """
+        if np is None:
+            raise ImportError("The ADC streaming mode needs NumPy: pip install numpy")
+        super().__init__(name="pw_stream", daemon=True)
+        self.driver = driver
+        self.channels = list(init_dict.get("channels", range(8)))
+        self.rate = float(init_dict.get("rate", 200))
+        self.size = int(init_dict.get("size", 8192))
+        self.filter = init_dict.get("filter", "boxcar")
+        if self.filter not in FILTERS:
+            raise ValueError("Unknown stream filter {}: must be one of {}".format(self.filter, FILTERS))
+        self.decimation, self.order = int(init_dict.get("decimation", 100)), int(init_dict.get("order", 3))
+        self.weights = cic_weights(self.decimation, self.order) if self.filter == "CIC" else None
+        self.window = len(self.weights) if self.filter == "CIC" else self.decimation
+        # samples per channel read in one go: the bus is released between two blocks (about 50 blocks per second)
+        self.block = max(1, int(init_dict.get("block", self.rate / 50 if self.rate else 16)))
+        self.bus_lock = bus_lock or No_Lock()
+        self.ring = np.zeros((self.size, len(self.channels)), dtype=np.uint16)
+        self.head, self.count = 0, 0  # 'head' is the index of the next write
+        self.lock = Lock()
+        self.warmup = float(init_dict.get("warmup", 2.0))
+        self.ready = Event()  # set by the first block of samples
+        self.stopping = Event()
+        self.samples, self.overruns, self.started_on, self.stopped_on = 0, 0, None, None
+
+    def run(self):
+        self.started_on = perf_counter()
+        next_block = self.started_on
+        while not self.stopping.is_set():
+            with self.bus_lock:
+                raw = self.driver.transfer(self.channels, self.block)
+            self.store(self.driver.decode(raw, len(self.channels)))
+            if self.rate:
+                next_block += self.block / self.rate
+                delay = next_block - perf_counter()
+                if delay > 0:
+                    self.stopping.wait(delay)
+                else:  # the bus cannot keep up with the rate: do not try to catch up more than one second
+                    self.overruns += 1
+                    next_block = max(next_block, perf_counter() - 1.0)
+        self.stopped_on = perf_counter()
+
+    def stop(self):
+        self.stopping.set()
+        if self.is_alive():
+            self.join(timeout=2.0)
+
+    def store(self, rows):
+        """Copies the decoded samples (one row per sample, one column per channel) into the ring buffer"""
+        n = len(rows)
+        if n > self.size:
+            rows, n = rows[-self.size:], self.size
+        with self.lock:
+            end = self.head + n
+            if end <= self.size:
+                self.ring[self.head:end] = rows
+            else:
+                first = self.size - self.head
+                self.ring[self.head:] = rows[:first]
+                self.ring[:n - first] = rows[first:]
+            self.head = end % self.size
+            self.count = min(self.count + n, self.size)
+            self.samples += n
+        self.ready.set()
+
+    def latest(self, n=None):
+        """Copy of the last n samples of each channel, oldest first: one row per sample, one column per channel"""
+        with self.lock:
+            n = self.count if n is None else min(n, self.count)
+            return self.ring[np.arange(self.head - n, self.head) % self.size].astype(np.float64)
+
+    def covers(self, channel):
+        return channel in self.channels
+
+    def value(self, channel):
+        """Filtered 12 bits value of a channel, None before the first samples"""
+        samples = self.latest(self.window)[:, self.channels.index(channel)]
+        if not len(samples):
+            return None
+        if self.filter == "median":
+            return float(np.median(samples))
+        if self.filter == "CIC":
+            weights = self.weights[-len(samples):]  # start-up: the available samples only
+            return float(np.dot(samples, weights) / weights.sum())
+        return float(samples.mean())
+
+    def read(self, channel, param=5.0):
+        """Same result as Hardware_MCP3208.read: (12 bits value, volts) - the value being filtered
+        A reading made just after the start waits up to 'warmup' seconds for the first block of samples.
+        """
+        if not self.ready.is_set() and self.is_alive():
+            self.ready.wait(self.warmup)
+        data = self.value(channel)
+        if data is None:
+            return None, None
+        return data, (data * param) / 4095.0
+
+    def get_stats(self):
+        """Counters for Controller.get_metrics"""
+        elapsed = ((self.stopped_on or perf_counter()) - self.started_on) if self.started_on else 0.0
+        return {"channels": self.channels, "rate": self.rate, "filter": self.filter, "decimation": self.decimation,
+                "samples": self.samples,
+                "samples_per_sec": round(self.samples * len(self.channels) / elapsed, 1) if elapsed else 0.0,
+                "overruns": self.overruns, "buffered": self.count}
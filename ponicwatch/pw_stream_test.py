@@ -0,0 +1,62 @@
+#!/bin/python3
+"""
+  Test the streaming acquisition of ADC channels with a driver stand-in
+  To run from the ponicwatch folder:  python -m pytest pw_stream_test.py
+"""
+import unittest
+from pw_stream import ADC_Stream, cic_weights, np
+
+
+class Fake_ADC(object):
+    """MCP3208 driver stand-in: channel c of sample i reads i * 10 + c"""
+    def __init__(self):
+        self.sample = 0
+
+    def transfer(self, channels, block):
+        rows = [[(self.sample + i) * 10 + c for c in channels] for i in range(block)]
+        self.sample += block
+        return rows
+
+    def decode(self, raw, nb_channels):
+        return np.array(raw, dtype=np.uint16)
+
+
+@unittest.skipIf(np is None, "the ADC stream needs NumPy")
+class Stream(unittest.TestCase):
+    def test_ring_and_filters(self):
+        stream = ADC_Stream(Fake_ADC(), {"channels": [0, 3], "size": 8, "decimation": 4})
+        self.assertEqual(stream.read(0), (None, None))  # not started: no wait, no samples
+        stream.store(stream.driver.transfer(stream.channels, 10))  # wraps around the ring
+        self.assertEqual(stream.count, 8)
+        self.assertEqual(list(stream.latest(3)[:, 1]), [73.0, 83.0, 93.0])
+        self.assertEqual(stream.value(3), (63 + 73 + 83 + 93) / 4.0)
+        stream.filter = "median"
+        self.assertEqual(stream.value(0), 75.0)
+        self.assertEqual(stream.read(0, 4.095), (75.0, 0.075))
+
+    def test_cic(self):
+        weights = cic_weights(4, 3)
+        self.assertEqual(len(weights), 10)
+        self.assertAlmostEqual(float(weights.sum()), 1.0)
+        stream = ADC_Stream(Fake_ADC(), {"channels": [0], "filter": "CIC", "decimation": 4, "order": 3})
+        stream.store(np.full((20, 1), 100, dtype=np.uint16))
+        self.assertAlmostEqual(stream.value(0), 100.0)
+
+    def test_thread_warmup(self):
+        stream = ADC_Stream(Fake_ADC(), {"channels": [0], "rate": 500, "decimation": 1})
+        stream.start()
+        try:
+            value, volts = stream.read(0)  # waits for the first block
+            self.assertIsNotNone(value)
+        finally:
+            stream.stop()
+        self.assertFalse(stream.is_alive())
+        self.assertGreater(stream.get_stats()["samples"], 0)
+
+    def test_unknown_filter(self):
+        with self.assertRaises(ValueError):
+            ADC_Stream(Fake_ADC(), {"filter": "FIR"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,8 +6,12 @@
     Sensors are objects linked to a hardware pin (on/off digital input) or an analog input to capture a sensor's state.
     They belong to one Controller.
 """
-from time import sleep
+from time import sleep, monotonic
+import asyncio
 from model.model import Ponicwatch_Table
+from pw_ring import Ring_Buffer
+from pw_compress import Log_Compressor
+from pw_filter import Signal_Filter
 
 class Sensor(Ponicwatch_Table):
     """
@@ -61,6 +65,16 @@ class Sensor(Ponicwatch_Table):
         self.controller = controller
         self.hardware = hardware
         self.read_value = -1
+        self.last_read_value = -1  # read value of the previous execution, for LOG: DIFF
+        self.ring = Ring_Buffer(self.init_dict.get("RING", 1440))  # last readings kept in memory
+        # "LOG": "DEADBAND" or "SWING" --> only the values needed to reconstruct the signal are logged
+        self.compressor = Log_Compressor(self.init_dict) if self.init_dict.get("LOG") in Log_Compressor.MODES else None
+        # "filter": the calculated values are filtered before being updated and logged, i.e. "HAMPEL" or {"type": "EMA", "alpha": 0.1}
+        self.filter = Signal_Filter(self.init_dict["filter"]) if "filter" in self.init_dict else None
+        # 'value' returns the last reading if younger than "max_age" seconds: the if-expressions do not read the hardware again
+        self.max_age = float(self.init_dict.get("max_age", 0))
+        self.cached = None  # (monotonic time of the reading, calculated value)
+        self.cache_hits, self.cache_misses = 0, 0
         self.debug = max(self.controller.debug, self.init_dict.get("debug", 0))
         if self.debug >= 3:
             print("Sensor {} is attached to hardware {}".format(self, self.hardware))
@@ -68,7 +82,7 @@ class Sensor(Ponicwatch_Table):
             if hardware["mode"] == 2:  # R/W
                 self.hardware.set_pin_as_input(self.init_dict["pin"])
             self.long_name = system_name + "/" + self["name"]
-            self.controller.add_cron_job(self.execute, self["timer"])
+            self.controller.add_acquisition_job(self, self["timer"])
             # attach the interruption if present
             if "interrupt" in self.init_dict:
                 hardware.register_interrupt(int(self.init_dict["interrupt"]), self.on_interrupt)
@@ -91,60 +105,139 @@ class Sensor(Ponicwatch_Table):
                 self.pwr_ic, self.pwr_pin = self.controller.get_pwo("Hardware", pwo_hid), self.init_dict["power_pin"]
             if self.pwr_ic:
                 self.pwr_ic.set_pin_as_output(self.pwr_pin)
+                self.power_key = (self.pwr_ic["id"], str(self.pwr_pin))  # probes sharing a power pin are powered once
+                self.power_delay = float(self.init_dict.get("power_delay", 0.5))
 
     def read_values(self):
         """Reads the direct and calculated values from a sensor
-        Powers ON and OFF the sensor if required
+        Powers ON and OFF the sensor if required: this thread waits for the 'power_delay'
+        (the scheduled acquisitions do not wait, see Controller.acquire)
         """
-        # need to power on the sensor if a power pin is given   { "POWER": "I/O_IC.pin" }
-        if self.pwr_ic:
-            try:
-                self.pwr_ic.write(self.pwr_pin, 1)
-                self.controller.log.add_info("{}.{} powered on before reading {}".format(self.pwr_ic, self.pwr_pin, self["name"]))
-                sleep(self.init_dict.get("power_pin", 0.5))
-            except TypeError as err:
-                msg="Cannot write to hw: {} pin: {} power: {}".format(self.hardware, self.init_dict["pin"], self.pwr_pin)
-                self.controller.log.add_error(msg=msg, err_code=self["id"], fval=-3.2)
-        # reads from sensor hardware
+        delay = self.controller.power.power_on(self) if self.pwr_ic else None
+        if delay:
+            sleep(delay)
+        try:
+            return self.read_hardware()
+        finally:
+            if delay is not None:
+                self.controller.power.power_off(self)
+
+    def read_hardware(self):
+        """reads from sensor hardware, the sensor being powered if required"""
+        read_val, calc_val = None, None
         try:
             read_val, calc_val = self.hardware.read(self.init_dict.get("pin"), self.init_dict.get("hw_param", {}))
             self.read_value = read_val
             if self.debug >= 3:
                 print("Reading sensor {}: read_val={} and calc_val={} from {}".format(self, read_val, calc_val, self.hardware))
         except AttributeError as err:
-            msg = "Reading from hardware {} (mode={}) returns error: {}".format(self.hardware["name"], self.hardware["mode"], err)
-            if self.debug >= 3:
-                print(msg)
-            self.controller.log.add_error(msg=msg, err_code=self["id"], fval=-3.5)
-        # power off the sensor if necessary
-        if self.pwr_ic:
-            self.pwr_ic.write(self.pwr_pin, 0)
-            self.controller.log.add_info("{}.{} powered off after reading {}".format(self.pwr_ic, self.pwr_pin, self["name"]))
+            self.read_error(err)
+        return read_val, calc_val
+
+    async def read_values_async(self):
+        """read_values() for the asyncio runtime: the power delay and the waits of the driver do not block the event loop"""
+        delay = self.controller.power.power_on(self) if self.pwr_ic else None
+        if delay:
+            await asyncio.sleep(delay)
+        read_val, calc_val = None, None
+        try:
+            read_val, calc_val = await self.hardware.read_async(self.init_dict.get("pin"), self.init_dict.get("hw_param", {}))
+            self.read_value = read_val
+        except AttributeError as err:
+            self.read_error(err)
+        finally:
+            if delay is not None:
+                self.controller.power.power_off(self)
         return read_val, calc_val
 
+    def read_error(self, err):
+        msg = "Reading from hardware {} (mode={}) returns error: {}".format(self.hardware["name"], self.hardware["mode"], err)
+        if self.debug >= 3:
+            print(msg)
+        self.controller.log.add_error(msg=msg, err_code=self["id"], fval=-3.5)
+
+    def power_on(self):
+        """Power on the sensor: a power pin is given   { "POWER": "I/O_IC.pin" }
+        Called by the Controller's Power_Sequencer which counts the probes sharing the pin
+        :return: True if the sensor was powered on i.e. it needs time to settle before the reading
+        """
+        try:
+            self.pwr_ic.write(self.pwr_pin, 1)
+            self.controller.log.add_info("{}.{} powered on before reading {}".format(self.pwr_ic, self.pwr_pin, self["name"]),
+                                         category="POWER")
+            return True
+        except TypeError as err:
+            msg="Cannot write to hw: {} pin: {} power: {}".format(self.hardware, self.init_dict["pin"], self.pwr_pin)
+            self.controller.log.add_error(msg=msg, err_code=self["id"], fval=-3.2)
+            return False
+
+    def power_off(self):
+        """power off the sensor after the reading of the last probe sharing its pin (see Power_Sequencer)"""
+        self.pwr_ic.write(self.pwr_pin, 0)
+        self.controller.log.add_info("{}.{} powered off after reading {}".format(self.pwr_ic, self.pwr_pin, self["name"]),
+                                     category="POWER")
+
     @property
     def value(self):
-        """Force the sensor reading and return the calculated valule only
+        """Return the calculated valule only: the last reading if younger than 'max_age' seconds else force the sensor reading
         NO LOGGING: convenient for frequent reading in switch condition"""
+        cached = self.cached
+        if cached and monotonic() - cached[0] < self.max_age:
+            self.cache_hits += 1
+            return cached[1]
+        self.cache_misses += 1
         read_val, calc_val = self.read_values()
+        if read_val is not None:
+            if self.filter:  # filtered as a reading of the scheduler would be, without changing the filter's state
+                calc_val = self.filter.filter(calc_val, update=False)
+            self.cached = (monotonic(), calc_val)
         if self.debug >= 3:
             print("Reading {}: {}, {}".format(self, read_val, calc_val))
         return calc_val
 
-    def execute(self):
+    @property
+    def last_value(self):
+        """Calculated value of the last reading, else the value stored in the database, None if never read
+        NO READING: for the drivers which must not wait for this sensor's hardware"""
+        if self.cached:
+            return self.cached[1]
+        return self["value"] if self["updated_on"] else None
+
+    def execute(self, values=None):
         """Called by the scheduler to perform the data reading
         Log the read values
+        :param values: optional, (read value, calculated value) already read by the Controller's acquisition job
         """
-        last_read_val = self.read_value
-        read_val, calc_val = self.read_values()
+        read_val, calc_val = values if values is not None else self.read_values()
+        last_read_val, self.last_read_value = self.last_read_value, read_val
         if read_val is None:
             self.controller.log.add_error("Cannot read from " + str(self), err_code=self["id"], fval=-3.3)
         else:
+            if self.filter:
+                calc_val = self.filter.filter(calc_val)
             self.update(read_value=read_val, value=calc_val)   #  update_values(read_val, calc_val)
+            self.cached = (monotonic(), calc_val)
+            self.ring.append(calc_val)
             log_action = self.init_dict.get("LOG", "ON")
-            if log_action=="ON" or (log_action=="DIFF" and last_read_val!=read_val):
+            if self.compressor:
+                for created_on, value in self.compressor.add(calc_val):
+                    self.controller.log.add_log(system_name=self.long_name, param=self, value=value, created_on=created_on)
+            elif log_action=="ON" or (log_action=="DIFF" and last_read_val!=read_val):
                 self.controller.log.add_log(system_name=self.long_name, param=self)
 
+    def flush_log(self):
+        """Log the last reading held by the compressor, i.e. before stopping"""
+        if self.compressor:
+            for created_on, value in self.compressor.flush():
+                self.controller.log.add_log(system_name=self.long_name, param=self, value=value, created_on=created_on)
+
+    def get_cache_stats(self):
+        """Hit/miss counters of the value cache: shown on the sensor's page and in Controller.get_metrics"""
+        lookups = self.cache_hits + self.cache_misses
+        return {"max_age": self.max_age, "hits": self.cache_hits, "misses": self.cache_misses,
+                "hit_ratio": round(self.cache_hits / lookups, 3) if lookups else 0.0,
+                "age": round(monotonic() - self.cached[0], 1) if self.cached else None}
+
     def on_interrupt(self):
         print("Ready to take care of the interrupt", self)
 
@@ -8,6 +8,7 @@
     A switch is either set manually ON/OFF while in AUTO mode,the controller will tabulate the current time on the 'timer' string.
 """
 from model.model import Ponicwatch_Table
+from pw_ring import Ring_Buffer
 
 class Switch(Ponicwatch_Table):
     """
@@ -47,10 +48,12 @@ class Switch(Ponicwatch_Table):
         self.controller = controller
         self.system_name = system_name + "/" + self["name"]
         self.hardware = hardware
+        self.ring = Ring_Buffer(self.init_dict.get("RING", 1440))  # last values kept in memory
         self.hardware.set_pin_as_output(self.init_dict["pin"])
         self.debug = max(self.controller.debug, self.init_dict.get("debug", 0))
         if self["mode"] > self.INACTIVE and self["timer"]:
-            self.controller.add_cron_job(self.execute, self["timer"])
+            self.controller.add_cron_job(self.execute, self["timer"], bus=self.hardware.bus,
+                                         max_jitter=self.init_dict.get("max_jitter", 0), seed=self.system_name)
         # set the switch to 'set_value_to' if given in the init dictionary else to the last value recorded
         # try:
         #     self.execute(self.init_dict["set_value_to"])
@@ -96,6 +99,7 @@ class Switch(Ponicwatch_Table):
         if continue_execution:
             self.hardware.write(self.init_dict["pin"], set_to)
             self.update(value=set_to)
+            self.ring.append(set_to)
             self.controller.log.add_log(system_name=self.system_name, param=self)
         elif self.debug >= 3:
             print(self, "'if' condition False: abort execution")
@@ -24,7 +24,14 @@
    - License: {{__license__}}<br/>
 </p>
 %import os
-<p>Database file size: {{os.path.getsize(controller.db.server_params["database"]) >> 10}} kB</p>
+<p>Database file size: {{os.path.getsize(controller.db.server_params["database"]) >> 10}} kB
+   - <a href="/metrics">Metrics</a></p>
+<table border="1">
+    <tr><th>Log events</th><th>Verbosity</th><th>Count</th><th>Not yet summarized</th><th>Last event</th></tr>
+% for category, counter in controller.log.get_counters().items():
+    <tr><td>{{category}}</td><td>{{counter["verbosity"]}}</td><td>{{counter["events"]}}</td><td>{{counter["pending"]}}</td><td>{{counter["last"]}}</td></tr>
+% end
+</table>
 <ul>
     <li>Last stop on:  {{controller.last_stop[0]}}</li>
     <li>Last start on: {{controller.last_start[0]}}</li>
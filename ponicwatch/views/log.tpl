@@ -8,6 +8,18 @@
 % include('header.html')
 % import datetime
 <p>{{!pwo}}</p>
+<form action="/log" method="get">
+    <select name="log_type">
+        <option value=""></option>
+% for log_type in log_types:
+        <option value="{{log_type}}" {{'selected' if log_type == filters['log_type'] else ''}}>{{log_type}}</option>
+% end
+    </select>
+    Object id: <input type="text" name="object_id" size="4" value="{{filters['object_id']}}">
+    From: <input type="date" name="from" value="{{filters['from']}}">
+    To: <input type="date" name="to" value="{{filters['to']}}">
+    <input type="submit" value="Filter">
+</form>
 <table border="1">
     <tr><th>log_id</th><th>Log Type</th><th>System/PWO</th><th>Value</th><th>Text</th><th>Timestamp</th></tr>
 % for row in rows:
@@ -20,12 +32,9 @@
 % end
 </table>
 <p>
-% if current_page > 0:
-    <a href="/log/{{current_page-1}}{{req_query}}">Previous</a>
-% end
-% if len(rows) == 20:
-    <a href="/log/{{current_page+1}}{{req_query}}">Next</a>
+% for label, url in links:
+    <a href="{{url}}">{{label}}</a>
 % end
 </p>
 </body>
-</html>
\ No newline at end of file
+</html>
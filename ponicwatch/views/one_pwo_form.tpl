@@ -38,6 +38,10 @@
 %end
 
 %if pwo_cls_name == "Sensor":
+    % cache = pw_object.get_cache_stats()
+<tr><td style="text-align:right">Value cache:</td>
+    <td>max_age {{cache["max_age"]}}s - hits {{cache["hits"]}} - misses {{cache["misses"]}} - hit ratio {{cache["hit_ratio"]}}
+        - last reading {{cache["age"] if cache["age"] is not None else "-"}}s ago</td></tr>
 <tr><td style="text-align:right"> </td>
     <td><button type="button" onclick="location.href='/sensor/exec/{{pw_object["id"]}}'">Execute reading...</button></td></tr>
 %end